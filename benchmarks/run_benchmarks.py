@@ -0,0 +1,261 @@
+"""
+Mide por etapas, sin servidor de Streamlit, el comportamiento de hsa_engine.py y hsa.py con
+libros sintéticos de distintos tamaños: ingesta, búsqueda, procesamiento de
+TRAZABILIDAD, generación del HTML y exportación de resultados. El resultado
+se escribe como JSON.
+
+Uso:
+    python benchmarks/run_benchmarks.py --rows 1000 10000 50000 --output bench.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Sin hilo de recarga: cada medición controla cuándo se construyen los datos
+os.environ.setdefault('HSA_RELOAD_INTERVAL', '0')
+
+import numpy as np
+import pandas as pd
+
+import hsa
+import hsa_engine
+from synthetic_workbook import generate_workbook
+
+# Cada construcción de una versión de los datos se registra; aquí ya se mide por separado
+logging.getLogger('hsa').setLevel(logging.WARNING)
+
+SEARCH_FIELDS = ['TODOS', 'SOLICITANTE', 'ASUNTO']
+TERM_COUNTS = [1, 2, 3]
+
+def stats(tiempos):
+    return {
+        'min_s': min(tiempos),
+        'median_s': statistics.median(tiempos),
+        'max_s': max(tiempos),
+        'repeat': len(tiempos),
+    }
+
+def timed(func, repeat=1):
+    """
+    Ejecuta func `repeat` veces y devuelve (resultado de la última, estadísticas en segundos).
+    """
+    tiempos = []
+    resultado = None
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        resultado = func()
+        tiempos.append(time.perf_counter() - inicio)
+    return resultado, stats(tiempos)
+
+def _vocabulario(sheets, rng, size=200):
+    """
+    Palabras reales de las columnas de texto, para que las búsquedas encuentren resultados.
+    """
+    palabras = set()
+    for df in sheets.values():
+        for col in ('SOLICITANTE', 'ASUNTO', 'TEMA', 'MUNICIPIO'):
+            if col in df.columns:
+                for valor in df[col].dropna().head(500):
+                    palabras.update(p.lower() for p in str(valor).split() if len(p) >= 3)
+    palabras = sorted(palabras)
+    return rng.sample(palabras, min(size, len(palabras)))
+
+def bench_ingest(file_path, repeat, workers=1):
+    resultados = {}
+    # En frío: sin caché en disco, se lee el .xlsx completo
+    def ingesta_en_frio():
+        shutil.rmtree(hsa_engine.CACHE_DIR, ignore_errors=True)
+        return hsa_engine.read_workbook_version(file_path)
+    (_, sheets), resultados['ingest_cold'] = timed(ingesta_en_frio, repeat)
+    # Nuevo proceso con el caché en disco ya escrito
+    _, resultados['ingest_disk_cache'] = timed(lambda: hsa_engine.read_workbook_version(file_path), repeat)
+    # Solo lectura y normalización de las hojas, en serie y con el pool de procesos
+    if workers > 1:
+        _, resultados['parse_serial'] = timed(
+            lambda: dict(hsa_engine.parse_workbook_sheets(file_path, workers=1)), repeat)
+        _, resultados['parse_parallel'] = timed(
+            lambda: dict(hsa_engine.parse_workbook_sheets(file_path, workers=workers)), repeat)
+        resultados['parse_parallel']['workers'] = workers
+    # Lectura de las hojas con read_excel y por bloques de filas (ver HSA_INGEST_MODE)
+    for modo in ('pandas', 'streaming'):
+        _, resultados[f'parse_{modo}'] = timed(
+            lambda: dict(hsa_engine.parse_workbook_sheets(file_path, workers=1, mode=modo)), repeat)
+    # Construcción de la versión compartida: índices, eventos y fechas
+    snapshot, resultados['snapshot_build'] = timed(lambda: hsa_engine.WorkbookSnapshot(file_path), repeat)
+    # Desglose por etapa de la última construcción (índices, eventos, fechas)
+    resultados['snapshot_stages'] = snapshot.timer.records()
+    resultados['snapshot_frames_mb'] = snapshot.frames_mb()
+
+    # Hasta poder dibujar la página: solo los encabezados, las hojas siguen cargándose en segundo plano
+    tiempos = []
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        perezoso = hsa_engine.WorkbookSnapshot(file_path, lazy=True)
+        tiempos.append(time.perf_counter() - inicio)
+        perezoso.wait_until_loaded()
+    resultados['time_to_interactive'] = stats(tiempos)
+
+    # get_sheet_names + load_sheet_data de todas las hojas, como hace la interfaz
+    def cargar_todas():
+        return [hsa_engine.load_sheet_data(file_path, sheet) for sheet in hsa_engine.get_sheet_names(file_path)]
+    def cargar_en_frio():
+        hsa_engine.clear_data_stores()
+        return cargar_todas()
+    _, resultados['load_sheet_data_cold'] = timed(cargar_en_frio, repeat)
+    _, resultados['load_sheet_data_warm'] = timed(cargar_todas, max(repeat, 5))
+    hsa_engine.clear_data_stores()
+    return sheets, snapshot, resultados
+
+def bench_search(snapshot, vocabulario, rng, queries):
+    resultados = []
+    for campo in SEARCH_FIELDS:
+        for n_terms in TERM_COUNTS:
+            consultas = [' '.join(rng.sample(vocabulario, n_terms)) for _ in range(queries)]
+            tiempos, encontrados = [], 0
+            for consulta in consultas:
+                inicio = time.perf_counter()
+                for sheet in snapshot.sheet_names:
+                    df = snapshot.sheet(sheet)
+                    if campo == 'TODOS' or campo in df.columns:
+                        encontrados += len(hsa_engine.search_data(df, consulta, campo, index=snapshot.index(sheet)))
+                tiempos.append(time.perf_counter() - inicio)
+            resultados.append({
+                'campo': campo,
+                'terms': n_terms,
+                'queries': queries,
+                'median_s': statistics.median(tiempos),
+                'p95_s': sorted(tiempos)[int(0.95 * (len(tiempos) - 1))],
+                'max_s': max(tiempos),
+                'avg_matches': encontrados / queries,
+            })
+    return resultados
+
+def bench_trazabilidad(sheets, snapshot, repeat, render_rows):
+    resultados = {}
+    textos = [valor for df in sheets.values() if 'TRAZABILIDAD' in df.columns for valor in df['TRAZABILIDAD']]
+    _, resultados['process_trazabilidad'] = timed(lambda: [hsa_engine.process_trazabilidad(t) for t in textos], repeat)
+    resultados['process_trazabilidad']['cells'] = len(textos)
+    _, resultados['build_trazabilidad_events'] = timed(
+        lambda: [hsa_engine.build_trazabilidad_events(df, sheet) for sheet, df in sheets.items()], repeat)
+
+    # HTML de las primeras filas de cada hoja: desde el texto y desde los eventos precalculados
+    filas = []
+    for sheet in snapshot.sheet_names:
+        df = snapshot.sheet(sheet)
+        filas.extend((sheet, fila, valor) for fila, valor in df['TRAZABILIDAD'].head(render_rows).items())
+        if len(filas) >= render_rows:
+            break
+    filas = filas[:render_rows]
+    _, resultados['render_trazabilidad_from_text'] = timed(
+        lambda: [hsa.render_trazabilidad(valor) for _, _, valor in filas], repeat)
+    _, resultados['render_trazabilidad_from_events'] = timed(
+        lambda: [hsa.render_trazabilidad(snapshot.eventos(sheet, fila))
+                 for sheet, fila, _ in filas], repeat)
+    resultados['render_trazabilidad_from_text']['rows'] = len(filas)
+    resultados['render_trazabilidad_from_events']['rows'] = len(filas)
+
+    # Las mismas filas como página de expedientes: generando todos los mosaicos y desde el caché
+    hojas, posiciones = [sheet for sheet, _, _ in filas], [fila for _, fila, _ in filas]
+    titulos = [f"📂 {fila}" for fila in posiciones]
+    def pagina_sin_cache():
+        hsa.mosaic_cache().clear()
+        return hsa.pagina_html(snapshot, posiciones, hojas, titulos)
+    _, resultados['render_page_cold'] = timed(pagina_sin_cache, repeat)
+    _, resultados['render_page_cached'] = timed(lambda: hsa.pagina_html(snapshot, posiciones, hojas, titulos),
+                                                repeat)
+    resultados['render_page_cold']['rows'] = len(filas)
+    resultados['render_page_cached']['rows'] = len(filas)
+    return resultados
+
+def bench_export(snapshot, repeat):
+    # Descarga de resultados con todas las filas del libro, en cada formato
+    resultados = {}
+    coincidencias = {sheet: np.arange(len(snapshot.sheet(sheet))) for sheet in snapshot.sheet_names}
+    for formato in hsa_engine.EXPORT_FORMATS:
+        def exportar():
+            with tempfile.TemporaryFile() as destino:
+                hsa_engine.write_export(snapshot, coincidencias, destino, formato)
+                return destino.tell()
+        tamano, resultados[f'export_{formato}'] = timed(exportar, repeat)
+        resultados[f'export_{formato}']['bytes'] = tamano
+    return resultados
+
+def run(rows_list, sheets, repeat, queries, render_rows, seed, workdir, workers=1):
+    rng = random.Random(seed)
+    informe = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'runs': [],
+    }
+    for rows in rows_list:
+        file_path = os.path.join(workdir, f'hsa_sintetico_{rows}.xlsx')
+        _, generacion = timed(lambda: generate_workbook(file_path, rows, sheets, seed))
+        print(f"[{rows} filas] libro generado en {generacion['min_s']:.1f}s", file=sys.stderr)
+
+        sheets_data, snapshot, ingesta = bench_ingest(file_path, repeat, workers)
+        print(f"[{rows} filas] ingesta medida", file=sys.stderr)
+        vocabulario = _vocabulario(sheets_data, rng)
+        busqueda = bench_search(snapshot, vocabulario, rng, queries)
+        print(f"[{rows} filas] búsqueda medida", file=sys.stderr)
+        trazabilidad = bench_trazabilidad(sheets_data, snapshot, repeat, render_rows)
+        exportacion = bench_export(snapshot, repeat)
+
+        informe['runs'].append({
+            'rows': rows,
+            'sheets': sheets,
+            'file_bytes': os.path.getsize(file_path),
+            'generate_s': generacion['min_s'],
+            'ingest': ingesta,
+            'search': busqueda,
+            'trazabilidad': trazabilidad,
+            'export': exportacion,
+        })
+    return informe
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark por etapas del dashboard HSA con libros sintéticos.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000],
+                        help="Tamaños de libro (número total de expedientes), ej: 1000 10000 200000")
+    parser.add_argument('--sheets', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3, help="Repeticiones de cada etapa")
+    parser.add_argument('--queries', type=int, default=20, help="Consultas por combinación de campo y términos")
+    parser.add_argument('--render-rows', type=int, default=500, help="Filas para medir la generación de HTML")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Procesos para medir también la lectura de hojas en paralelo (ver HSA_INGEST_WORKERS)")
+    parser.add_argument('--output', help="Archivo JSON de salida (por defecto, la salida estándar)")
+    parser.add_argument('--keep', help="Carpeta donde conservar los libros generados")
+    args = parser.parse_args()
+
+    workdir = args.keep or tempfile.mkdtemp(prefix='hsa-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    # Caché en disco aislado para no tocar el de la aplicación
+    hsa_engine.CACHE_DIR = os.path.join(workdir, 'cache')
+    try:
+        informe = run(args.rows, args.sheets, args.repeat, args.queries, args.render_rows, args.seed, workdir,
+                      args.workers)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    salida = json.dumps(informe, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(salida)
+    else:
+        print(salida)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Generador de libros sintéticos con el mismo esquema que
+'HSA VISTA GENERAL H.M ALVARO ECHEVERRY.xlsx', para medir hsa.py con
+volúmenes mayores que el libro real.
+
+Uso:
+    python benchmarks/synthetic_workbook.py salida.xlsx --rows 10000 --sheets 10
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from openpyxl import Workbook
+
+# Mismas columnas (con los mismos espacios sobrantes) que el libro real
+COLUMNS = [
+    'EXPEDIENTE', 'PONENTE', 'FECHA DE REPARTO ', 'ASUNTO', 'DEPARTAMENTO  ', 'MUNICIPIO ',
+    'SOLICITANTE', 'TEMA', 'FECHA DE CADUCIDAD ', 'TRAZABILIDAD', 'ESTADO',
+    'FECHA DE ULTIMA ACTUACIÓN', 'SEGUIMIENTO', 'FECHA DE SEGUIMIENTO', 'FECHA ACTUAL',
+    'ASESOR', 'EXPEDIENTES RE ASIGNADOS',
+]
+
+NOMBRES = ['ANYI', 'GENESIS', 'JHON', 'JULIANA', 'LAURA', 'MIGUEL', 'MONICA', 'RUBÉN',
+           'STEPHANI', 'SHANNERY', 'CARLOS', 'DIANA', 'ANDRÉS', 'PAOLA', 'JORGE', 'SANDRA']
+APELLIDOS = ['AGUIRRE', 'CUELLO', 'TRUJILLO', 'NUÑEZ', 'ORTEGON', 'CALDERON', 'PARDO',
+             'MARTINEZ', 'GUERRERO', 'CHAPARRO', 'PÉREZ', 'GÓMEZ', 'RODRÍGUEZ', 'LÓPEZ']
+PONENTES = ['LORDUY', 'ECHEVERRY', 'QUINTERO', 'RESTREPO', 'BARRETO']
+DEPARTAMENTOS = {
+    'RISARALDA': ['PEREIRA', 'DOSQUEBRADAS', 'SANTA ROSA DE CABAL'],
+    'ANTIOQUIA': ['MEDELLÍN', 'ENVIGADO', 'BELLO', 'RIONEGRO'],
+    'CUNDINAMARCA': ['SOACHA', 'ZIPAQUIRÁ', 'FACATATIVÁ'],
+    'VALLE DEL CAUCA': ['CALI', 'PALMIRA', 'BUGA', 'TULUÁ'],
+    'BOLÍVAR': ['CARTAGENA', 'MAGANGUÉ'],
+    'BOGOTÁ D.C.': ['BOGOTÁ'],
+}
+TEMAS = ['PUBLICIDAD', 'INSCRIPCIÓN DE CÉDULAS', 'DOBLE MILITANCIA', 'FINANCIACIÓN',
+         'REVOCATORIA', 'ENCUESTAS', 'INHABILIDAD', 'RENDICIÓN DE CUENTAS']
+ESTADOS = ['DESPACHO', 'PREARCHIVO']
+ACTUACIONES = [
+    'RECIBIDO', 'REPARTO (5 FOLIOS)', 'AUTO DE APERTURA DE INDAGACIÓN PRELIMINAR',
+    'SE ENVIO AUTO CORRE TRASLADO PARA PRESENTAR ALEGATOS A REVISIÓN DE PRIMER FILTRO.',
+    'AUTO 028- PRUEBAS PUBLICIDAD MEJOR PROVEER', 'SE ENVÍA OFICIO A LA REGISTRADURÍA',
+    'RESPUESTA DE LA PLATAFORMA META', 'PROYECTO DE RESOLUCIÓN A REVISIÓN',
+    'SE ENVIA AUTO MEJOR PROVEER PARA FIRMAS', 'NOTIFICACIÓN POR ESTADO',
+]
+ASUNTOS = [
+    'DENUNCIA POR VIOLACIÓN AL ART. 35 DE LA LEY 1475 DE 2011, POR PARTE DEL PRECANDIDATO AL CONCEJO DE {municipio} -{departamento}, {persona}',
+    'QUEJA POR PRESUNTA INSCRIPCIÓN IRREGULAR DE CÉDULAS EN EL MUNICIPIO DE {municipio}',
+    'SOLICITUD DE REVOCATORIA DE INSCRIPCIÓN DEL CANDIDATO {persona} A LA ALCALDÍA DE {municipio}',
+    'INVESTIGACIÓN POR PRESUNTA DOBLE MILITANCIA DEL CONCEJAL {persona} ({departamento})',
+]
+
+def _persona(rng):
+    return f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}"
+
+def _fecha(rng, inicio, dias):
+    return inicio + timedelta(days=rng.randrange(dias))
+
+def _trazabilidad(rng, reparto, eventos):
+    """
+    Texto multilínea con el formato del libro real: una actuación por línea,
+    a veces con la descripción pegada a la fecha o con año de 2 dígitos.
+    """
+    lineas = []
+    fecha = reparto
+    for _ in range(eventos):
+        fecha = fecha + timedelta(days=rng.randrange(1, 60))
+        formato = '%d/%m/%y' if rng.random() < 0.1 else '%d/%m/%Y'
+        separador = '' if rng.random() < 0.15 else rng.choice([' ', '  ', ' - '])
+        lineas.append(f"{fecha.strftime(formato)}{separador}{rng.choice(ACTUACIONES)}")
+    lineas.reverse()
+    return '\n'.join(lineas)
+
+def generate_rows(rng, rows, inicio=datetime(2021, 1, 1)):
+    """
+    Genera filas con el esquema del libro real.
+    """
+    hoy = datetime(2025, 5, 26)
+    for i in range(rows):
+        departamento = rng.choice(list(DEPARTAMENTOS))
+        municipio = rng.choice(DEPARTAMENTOS[departamento])
+        reparto = _fecha(rng, inicio, (hoy - inicio).days)
+        eventos = rng.randint(0, 8)
+        yield [
+            f"CNE-E-DG-{reparto.year}-{rng.randrange(10 ** 6):06d}",
+            rng.choice(PONENTES),
+            reparto,
+            rng.choice(ASUNTOS).format(municipio=municipio, departamento=departamento, persona=_persona(rng)),
+            departamento,
+            municipio,
+            _persona(rng) if rng.random() < 0.7 else 'DE OFICIO',
+            rng.choice(TEMAS),
+            reparto + timedelta(days=3 * 365) if rng.random() < 0.8 else 'NO APLICA',
+            _trazabilidad(rng, reparto, eventos) if eventos else None,
+            rng.choice(ESTADOS),
+            reparto + timedelta(days=rng.randrange(400)),
+            _trazabilidad(rng, reparto, rng.randint(1, 4)),
+            reparto + timedelta(days=rng.randrange(400)),
+            hoy,
+            rng.choice(NOMBRES),
+            _persona(rng) if rng.random() < 0.1 else None,
+        ]
+
+def generate_workbook(path, rows, sheets=10, seed=0):
+    """
+    Escribe un libro de `rows` filas repartidas entre `sheets` hojas.
+    Devuelve la lista de nombres de hoja.
+    """
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    nombres = []
+    for i in range(sheets):
+        nombre = f"{NOMBRES[i % len(NOMBRES)]} {APELLIDOS[i % len(APELLIDOS)]}"
+        if nombre in nombres:
+            nombre = f"{nombre} {i}"
+        nombres.append(nombre)
+        ws = wb.create_sheet(nombre)
+        ws.append(COLUMNS)
+        filas_hoja = rows // sheets + (1 if i < rows % sheets else 0)
+        for fila in generate_rows(rng, filas_hoja):
+            ws.append(fila)
+    wb.save(path)
+    return nombres
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Genera un libro sintético con el esquema de HSA.")
+    parser.add_argument('path', help="Ruta del .xlsx a generar")
+    parser.add_argument('--rows', type=int, default=10000, help="Número total de expedientes")
+    parser.add_argument('--sheets', type=int, default=10, help="Número de hojas")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate_workbook(args.path, args.rows, args.sheets, args.seed)
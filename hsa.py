@@ -1,501 +1,846 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime
-import re
-
-# Configuración de la página
-st.set_page_config(
-    page_title="HSA Dashboard",
-    page_icon="📊",
-    layout="wide",
-    initial_sidebar_state="expanded"
+import numpy as np
+import cProfile
+import html
+from datetime import date, datetime, timedelta
+import io
+import logging
+import os
+import pstats
+import tempfile
+import time
+
+from hsa_engine import (
+    DEFAULT_WORKBOOK,
+    LOAD_STATS,
+    LRUCache,
+    SEARCH_CACHE,
+    StageTimer,
+    format_date,
+    get_data_store,
+    log_event,
+    process_trazabilidad,
+    write_export,
 )
+from hsa_store import expediente_eventos, get_store_sync, list_fields, list_sheets, search as search_store
+
+# Con HSA_STORE_DB el dashboard consulta la base SQLite de hsa_store en lugar de tener los libros en memoria
+STORE_DB = os.environ.get('HSA_STORE_DB', '')
 
-def format_date(date_str):
+def _html(valor):
     """
-    Formatea una fecha en el formato deseado (dd/mm/aa).
-    Elimina la parte de tiempo si existe.
+    Texto de una celda listo para insertar en HTML: escapado y en una sola línea
+    (una línea en blanco cortaría el bloque HTML dentro del markdown).
     """
-    if date_str == 'No disponible':
-        return date_str
-        
-    try:
-        # Intentar varios formatos de fecha posibles
-        for fmt in ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%d/%m/%Y']:
-            try:
-                date_obj = datetime.strptime(str(date_str), fmt)
-                # Retornar en formato dd/mm/yyyy
-                return date_obj.strftime('%d/%m/%Y')
-            except ValueError:
-                continue
-                
-        # Si no se pudo convertir con ninguno de los formatos, devolver el original
-        return date_str
-    except:
-        # En caso de cualquier error, devolver el original
-        return date_str
-
-def process_trazabilidad(trazabilidad_str):
-    """
-    Procesa el texto de trazabilidad para extraer fechas y descripciones.
-    Maneja correctamente los saltos de línea para separar eventos distintos.
-    """
-    # Corrección específica para el caso de "14/05/2024 (5 FOLIOS)"
-    trazabilidad_str = corregir_caso_especifico(trazabilidad_str)
-    
-    # Manejar mejor los saltos de línea
-    if isinstance(trazabilidad_str, str):
-        # Reemplazar múltiples variantes de saltos de línea por un formato estándar
-        trazabilidad_str = re.sub(r'\\n', '\n', trazabilidad_str)
-        
-        # Dividir por líneas y procesar cada línea por separado
-        lineas = trazabilidad_str.split('\n')
-        trazabilidad_processed = []
-        
-        fecha_pattern = r'\d{2}/\d{2}/\d{4}|\d{2}/\d{2}/\d{2}'  # Acepta tanto dd/mm/yyyy como dd/mm/yy
-        
-        for linea in lineas:
-            linea = linea.strip()
-            if not linea:
-                continue
-                
-            # Buscar fecha en esta línea
-            match = re.search(fecha_pattern, linea)
-            if match:
-                fecha_original = match.group(0)
-                inicio = match.start()
-                
-                # Normalizar la fecha al formato completo (yyyy)
-                partes_fecha = fecha_original.split('/')
-                if len(partes_fecha) == 3:
-                    dia = partes_fecha[0]
-                    mes = partes_fecha[1]
-                    anio = partes_fecha[2]
-                    # Si el año tiene 2 dígitos, convertirlo a 4 dígitos
-                    if len(anio) == 2:
-                        anio = '20' + anio  # Asumimos años 2000+
-                    fecha = f"{dia}/{mes}/{anio}"
-                else:
-                    fecha = fecha_original
-                
-                # Extraer descripción (todo lo que sigue después de la fecha original)
-                descripcion = ""
-                if inicio + len(fecha_original) < len(linea):
-                    descripcion = linea[inicio + len(fecha_original):].strip()
-                    descripcion = re.sub(r'^[\s\-–—]+', '', descripcion)
-                
-                # Convertir la fecha a un objeto datetime para ordenación posterior
-                try:
-                    fecha_formato = '%d/%m/%Y'
-                    fecha_obj = datetime.strptime(fecha, fecha_formato)
-                    trazabilidad_processed.append({
-                        'fecha': fecha,
-                        'fecha_obj': fecha_obj,
-                        'descripcion': descripcion
-                    })
-                except Exception as e:
-                    # Si hay un error en el formato de fecha, añadir sin fecha_obj
-                    print(f"Error al procesar fecha: {fecha} - {str(e)}")
-                    trazabilidad_processed.append({
-                        'fecha': fecha,
-                        'descripcion': descripcion
-                    })
-        
-        # Ordenar por fecha, de más reciente a más antigua
-        trazabilidad_processed = sorted(trazabilidad_processed, 
-                                      key=lambda x: x.get('fecha_obj', datetime.min), 
-                                      reverse=True)
-        return trazabilidad_processed
-    return []
-
-def corregir_caso_especifico(texto):
-    """
-    Corrige manualmente el caso específico de "14/05/2024 (5 FOLIOS)" 
-    para asegurar que muestre "14/05/2024 REPARTO (5 FOLIOS)"
-    """
-    if not isinstance(texto, str):
-        return texto
-        
-    # Buscar específicamente el patrón problemático
-    patron = r'(14/05/20?24)\s*\(?5 FOLIOS\)?'
-    reemplazo = r'\1 REPARTO (5 FOLIOS)'
-    
-    # Reemplazar directamente
-    texto_corregido = re.sub(patron, reemplazo, texto, flags=re.IGNORECASE)
-    
-    # También manejar el caso donde el texto completo está, pero separado incorrectamente
-    patron2 = r'(14/05/20?24)(\s*)\(?5 FOLIOS\)?'
-    if re.search(patron2, texto_corregido, re.IGNORECASE) and not re.search(r'REPARTO', texto_corregido, re.IGNORECASE):
-        texto_corregido = re.sub(patron2, r'\1 REPARTO (5 FOLIOS)', texto_corregido, flags=re.IGNORECASE)
-    
-    return texto_corregido
-
-def render_trazabilidad(trazabilidad_str):
-    eventos = process_trazabilidad(trazabilidad_str)
+    return html.escape(str(valor)).replace('\r', '').replace('\n', ' ')
+
+def render_trazabilidad(trazabilidad):
+    """
+    Genera el HTML del historial de trazabilidad. Acepta el texto original
+    de la celda o la lista de eventos ya procesados (ver eventos_de_fila).
+    """
+    eventos = trazabilidad if isinstance(trazabilidad, list) else process_trazabilidad(trazabilidad)
     if not eventos:
         return "No disponible"
-    
+
     # Modificado para mostrar los mosaicos en forma de cuadrícula con colores mejorados para destacar
-    html_content = '<div class="trazabilidad-container" style="background: #f0f7ff; padding: 15px; border-radius: 10px; box-shadow: 0 4px 8px rgba(0,0,0,0.1); width: 100%; border: 1px solid #d0e3ff;">'
-    html_content += '<h4 style="text-align: center; color: #1f77b4; font-weight: bold;">📑 Historial de Trazabilidad</h4>'
-    html_content += '<div class="trazabilidad-grid">'
-    
+    partes = [
+        '<div class="trazabilidad-container" style="background: #f0f7ff; padding: 15px; border-radius: 10px; box-shadow: 0 4px 8px rgba(0,0,0,0.1); width: 100%; border: 1px solid #d0e3ff;">',
+        '<h4 style="text-align: center; color: #1f77b4; font-weight: bold;">📑 Historial de Trazabilidad</h4>',
+        '<div class="trazabilidad-grid">',
+    ]
     # Utilizamos un formato de fecha corto para los eventos de trazabilidad
     for evento in eventos:
-        html_content += f'<div class="trazabilidad-item">'
         # Convertir la fecha al formato dd/mm/aa para mostrarla
-        fecha_formateada = evento["fecha"]
-        try:
-            fecha_obj = datetime.strptime(evento["fecha"], '%d/%m/%Y')
-            fecha_formateada = fecha_obj.strftime('%d/%m/%y')
-        except:
-            pass
-        html_content += f'   <div class="trazabilidad-fecha"><strong>📅 {fecha_formateada}</strong></div>'
-        html_content += f'   <div class="trazabilidad-descripcion">{evento["descripcion"]}</div>'
-        html_content += f'</div>'
-    
-    html_content += '</div></div>'
-    
-    return html_content
-
-# Función para cargar los datos
-@st.cache_data
-def get_sheet_names(file_path):
-    xls = pd.ExcelFile(file_path)
-    return xls.sheet_names
-
-@st.cache_data
-def load_sheet_data(file_path, sheet_name):
-    return pd.read_excel(file_path, sheet_name=sheet_name)
-
-# Función para buscar en los datos
-def search_data(df, search_term, campo_busqueda):
-    """
-    Busca un término en la columna especificada del DataFrame.
-    Si campo_busqueda es 'TODOS', busca en todas las columnas.
-    Soporta búsqueda de términos múltiples separados por espacios.
-    """
-    if not search_term:
-        return df
-    
-    # Convertir todo a string para evitar problemas de tipo
-    for col in df.columns:
-        df[col] = df[col].astype(str)
-    
-    # Dividir la búsqueda en términos separados por espacios
-    search_terms = search_term.lower().split()
-    
-    if campo_busqueda == 'TODOS':
-        # Buscar todos los términos en todas las columnas
-        mask = pd.Series(True, index=df.index)
-        for term in search_terms:
-            term_mask = False
-            for column in df.columns:
-                term_mask |= df[column].str.lower().str.contains(term, regex=False, na=False)
-            mask &= term_mask
-        return df[mask]
+        fecha_formateada = evento.get('fecha_corta')
+        if fecha_formateada is None:
+            fecha_formateada = evento['fecha_obj'].strftime('%d/%m/%y') if 'fecha_obj' in evento else evento['fecha']
+        partes.append(f'<div class="trazabilidad-item">'
+                      f'<div class="trazabilidad-fecha"><strong>📅 {_html(fecha_formateada)}</strong></div>'
+                      f'<div class="trazabilidad-descripcion">{_html(evento["descripcion"])}</div>'
+                      f'</div>')
+    partes.append('</div></div>')
+    return ''.join(partes)
+
+def mosaic_html(row, eventos, fecha_reparto=None):
+    """
+    Genera el HTML de los mosaicos de un expediente con su trazabilidad.
+    fecha_reparto es el texto ya normalizado de la fecha; si falta se formatea aquí.
+    """
+    if fecha_reparto is None:
+        fecha_reparto = format_date(row.get('FECHA DE REPARTO', 'No disponible'))
+    # Mosaicos regulares (3 columnas)
+    return ''.join([
+        '<div class="mosaic-container">',
+        f'<div class="mosaic-item">📅 <b>Fecha de Reparto</b><br>{_html(fecha_reparto)}</div>',
+        f'<div class="mosaic-item">🔄 <b>Reasignado</b><br>{_html(row.get("EXPEDIENTES RE ASIGNADOS", "No disponible"))}</div>',
+        f'<div class="mosaic-item">🔖 <b>Tema</b><br>{_html(row.get("TEMA", "No disponible"))}</div>',
+        f'<div class="mosaic-item">👤 <b>Solicitante</b><br>{_html(row.get("SOLICITANTE", "No disponible"))}</div>',
+        f'<div class="mosaic-item">🔍 <b>Seguimiento</b><br>{_html(row.get("SEGUIMIENTO", "No disponible"))}</div>',
+        f'<div class="mosaic-item">📜 <b>Asunto</b><br>{_html(row.get("ASUNTO", "No disponible"))}</div>',
+        f'<div class="trazabilidad-mosaic">{render_trazabilidad(eventos)}</div>',
+        '</div>',
+    ])
+
+# Mosaicos guardados en el caché del proceso (compartido por todas las sesiones)
+MOSAIC_CACHE_ENTRIES = int(os.environ.get('HSA_MOSAIC_CACHE_ENTRIES', '5000'))
+
+@st.cache_resource(show_spinner=False)
+def mosaic_cache():
+    """
+    Caché de mosaicos del proceso, con clave (versión de los datos, hoja, fila).
+    Se pide una vez por página y no una vez por expediente.
+    """
+    return LRUCache(MOSAIC_CACHE_ENTRIES)
+
+def mosaicos_expedientes(snapshot, filas, hojas):
+    """
+    HTML de los mosaicos de cada (fila, hoja), desde el caché del proceso: las
+    filas ya vistas no se vuelven a generar en otros reruns ni en otras sesiones.
+    Las que faltan se generan juntas, leyendo de una vez las filas de cada hoja.
+    """
+    cache = mosaic_cache()
+    mosaicos = [cache.get((snapshot.version, hoja, fila)) for fila, hoja in zip(filas, hojas)]
+    faltan = {}
+    for posicion, (fila, hoja) in enumerate(zip(filas, hojas)):
+        if mosaicos[posicion] is None:
+            faltan.setdefault(hoja, []).append((posicion, fila))
+    for hoja, pendientes in faltan.items():
+        filas_hoja = [fila for _, fila in pendientes]
+        registros = snapshot.sheet(hoja).iloc[filas_hoja].to_dict('records')
+        texto = snapshot.dates(hoja)['texto']
+        fechas = (texto['FECHA DE REPARTO'].to_numpy()[filas_hoja] if 'FECHA DE REPARTO' in texto.columns
+                  else [None] * len(filas_hoja))
+        for (posicion, fila), row, fecha_reparto in zip(pendientes, registros, fechas):
+            mosaicos[posicion] = mosaic_html(row, snapshot.eventos(hoja, fila), fecha_reparto)
+            cache.put((snapshot.version, hoja, fila), mosaicos[posicion])
+    return mosaicos
+
+def pagina_html(snapshot, filas, hojas, titulos):
+    """
+    HTML de una página de expedientes en un solo bloque: un <details> por
+    expediente, con su título y sus mosaicos (ver mosaicos_expedientes).
+    """
+    return _pagina(titulos, mosaicos_expedientes(snapshot, filas, hojas))
+
+def pagina_html_base(conn, page, titulos):
+    """
+    Como pagina_html, para una página de resultados de la base (ver
+    hsa_store.search): los eventos de todos sus expedientes se piden de una vez.
+    """
+    eventos = expediente_eventos(conn, page.index)
+    mosaicos = []
+    for expediente_id, row in zip(page.index, page.to_dict('records')):
+        # Celdas vacías como en los datos en memoria y fechas ISO con el formato de format_date
+        row = {col: np.nan if valor is None else valor for col, valor in row.items()}
+        fecha_reparto = row.get('FECHA DE REPARTO', 'No disponible')
+        if isinstance(fecha_reparto, str):
+            fecha_reparto = format_date(fecha_reparto.replace('T', ' '))
+        mosaicos.append(mosaic_html(row, eventos[int(expediente_id)], fecha_reparto))
+    return _pagina(titulos, mosaicos)
+
+def _pagina(titulos, mosaicos):
+    return ''.join([
+        '<div class="expedientes-pagina">',
+        *(f'<details class="expediente"><summary>{_html(titulo)}</summary>{mosaico}</details>'
+          for titulo, mosaico in zip(titulos, mosaicos)),
+        '</div>',
+    ])
+
+# Opciones de paginación de los listados de expedientes
+PAGE_SIZES = [10, 25, 50, 100]
+# Criterios de orden de los listados: None conserva el orden del libro, si no indica si es ascendente
+SORT_OPTIONS = {
+    "Orden del libro": None,
+    "Fecha de reparto (más reciente primero)": False,
+    "Fecha de reparto (más antigua primero)": True,
+}
+# Fechas que cuentan para el filtro "Con movimiento entre": tipos de la línea de tiempo de hsa_engine
+DATE_SOURCES = {
+    "Actuaciones y fecha de reparto": ('eventos', 'reparto'),
+    "Solo actuaciones (TRAZABILIDAD)": ('eventos',),
+    "Solo fecha de reparto": ('reparto',),
+}
+# Columnas de la vista de tabla compacta, en este orden, si existen
+COMPACT_COLUMNS = ['EXPEDIENTE', 'HOJA_ORIGEN', 'FECHA DE REPARTO', 'TEMA', 'SOLICITANTE', 'ESTADO', 'ASUNTO']
+
+def mostrar_expedientes(df, key, snapshot, hoja=None):
+    """
+    Muestra los expedientes de df paginados. Solo se generan los widgets de la
+    página actual: en modo mosaicos un expander por fila, y en modo tabla
+    compacta un st.dataframe con el detalle del expediente seleccionado.
+    Si hoja es None, la hoja de cada fila se toma de la columna HOJA_ORIGEN.
+    """
+    opciones_col1, opciones_col2, opciones_col3, opciones_col4 = st.columns([2, 2, 1, 1])
+    with opciones_col1:
+        vista = st.radio("Vista", ["Mosaicos", "Tabla compacta"], horizontal=True, key=f"{key}_vista")
+    with opciones_col2:
+        orden = st.selectbox("Ordenar por", list(SORT_OPTIONS), key=f"{key}_orden")
+    with opciones_col3:
+        page_size = st.selectbox("Expedientes por página", PAGE_SIZES, key=f"{key}_page_size")
+
+    # Ordenar con la columna de fecha ya normalizada, sin volver a interpretar textos
+    ascendente = SORT_OPTIONS[orden]
+    if ascendente is not None and 'FECHA DE REPARTO' in df.columns:
+        fechas = pd.Series(snapshot.date_column(df, 'FECHA DE REPARTO', hoja))
+        posiciones = fechas.sort_values(ascending=ascendente, na_position='last', kind='stable').index
+        df = df.iloc[posiciones]
+
+    total_pages = max(1, -(-len(df) // page_size))
+    # Ajustar la página si cambió el tamaño de página o el número de resultados
+    if st.session_state.get(f"{key}_pagina", 1) > total_pages:
+        st.session_state[f"{key}_pagina"] = total_pages
+    with opciones_col4:
+        pagina = st.number_input(f"Página (de {total_pages})", min_value=1, max_value=total_pages,
+                                 step=1, key=f"{key}_pagina")
+
+    inicio = (pagina - 1) * page_size
+    page = df.iloc[inicio:inicio + page_size]
+    st.caption(f"Mostrando {inicio + 1 if len(page) else 0}-{inicio + len(page)} de {len(df)} expedientes")
+
+    def titulo(expediente, hoja_fila):
+        if hoja is None:
+            return f"📂 {expediente} - Hoja: {hoja_fila}"
+        return f"📂 {expediente}"
+
+    # Hoja de cada fila de la página (el índice de df es la fila dentro de su hoja)
+    hojas = [hoja] * len(page) if hoja is not None else page['HOJA_ORIGEN'].tolist()
+
+    if vista == "Tabla compacta":
+        columnas = [col for col in COMPACT_COLUMNS if col in page.columns]
+        tabla = page[columnas]
+        if 'FECHA DE REPARTO' in tabla.columns:
+            # El texto ya formateado de la fecha: la columna original mezcla fechas y textos,
+            # que st.dataframe no puede convertir a Arrow
+            tabla = tabla.assign(**{'FECHA DE REPARTO': snapshot.date_text(page, 'FECHA DE REPARTO', hoja)})
+        seleccion = st.dataframe(tabla, hide_index=True, use_container_width=True,
+                                 on_select="rerun", selection_mode="single-row", key=f"{key}_tabla")
+        if seleccion.selection.rows:
+            posicion = seleccion.selection.rows[0]
+            fila = page.index[posicion]
+            st.markdown(f"**{titulo(page['EXPEDIENTE'].iat[posicion], hojas[posicion])}**")
+            st.markdown(mosaicos_expedientes(snapshot, [fila], [hojas[posicion]])[0], unsafe_allow_html=True)
+        else:
+            st.caption("Seleccione un expediente de la tabla para ver su detalle.")
     else:
-        # Buscar solo en la columna especificada, todos los términos deben estar presentes
-        if campo_busqueda in df.columns:
-            mask = pd.Series(True, index=df.index)
-            for term in search_terms:
-                mask &= df[campo_busqueda].str.lower().str.contains(term, regex=False, na=False)
-            return df[mask]
+        # Toda la página en un solo bloque HTML, en lugar de un expander y un markdown por fila
+        titulos = [titulo(expediente, hoja_fila)
+                   for expediente, hoja_fila in zip(page['EXPEDIENTE'].tolist(), hojas)]
+        st.markdown(pagina_html(snapshot, page.index, hojas, titulos), unsafe_allow_html=True)
+
+def cargar_hoja(snapshot, sheet, timer):
+    """
+    Devuelve la hoja; si todavía se está cargando en segundo plano, espera solo por ella.
+    """
+    with timer.stage('load_sheet') as etapa:
+        if snapshot.is_ready(sheet):
+            df = snapshot.sheet(sheet)
+        else:
+            etapa['waited'] = 1
+            with st.spinner(f"Cargando la hoja {sheet}..."):
+                df = snapshot.sheet(sheet)
+        etapa['rows'] = len(df)
+    return df
+
+# Tipo MIME y extensión de cada formato de descarga
+DOWNLOAD_FORMATS = {
+    "CSV": ('csv', 'text/csv'),
+    "Excel (.xlsx)": ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+def generar_descarga(snapshot, coincidencias, extension):
+    """
+    Contenido del archivo de resultados. Se escribe por bloques en un archivo
+    temporal, que se lee una vez completo y se elimina.
+    """
+    descriptor, ruta = tempfile.mkstemp(prefix='hsa-descarga-', suffix=f'.{extension}')
+    try:
+        with os.fdopen(descriptor, 'wb') as destino:
+            write_export(snapshot, coincidencias, destino, extension)
+        with open(ruta, 'rb') as archivo:
+            return archivo.read()
+    finally:
+        os.remove(ruta)
+
+def mostrar_descarga(snapshot, coincidencias):
+    """
+    Botón para descargar los resultados de la búsqueda. El archivo se genera
+    solo al hacer clic, fuera de la ejecución del script (ver generar_descarga).
+    """
+    descarga_col1, descarga_col2 = st.columns([1, 3])
+    with descarga_col1:
+        formato = st.selectbox("Formato", list(DOWNLOAD_FORMATS), key='descarga_formato',
+                               label_visibility="collapsed")
+    extension, mime = DOWNLOAD_FORMATS[formato]
+
+    def generar():
+        return generar_descarga(snapshot, coincidencias, extension)
+
+    with descarga_col2:
+        st.download_button("⬇️ Descargar resultados", data=generar, file_name=f"resultados_hsa.{extension}",
+                           mime=mime, on_click="ignore")
+
+def mostrar_resumen(snapshot, timer):
+    """
+    Resumen general del libro: expedientes por hoja y estado, por TEMA y por
+    SOLICITANTE, antigüedad desde el reparto y tiempo desde la última actuación.
+    Los agregados se calculan una vez por versión de los datos y se comparten entre sesiones.
+    """
+    with st.expander("📊 Resumen general", expanded=True):
+        if not snapshot.loaded():
+            st.info(f"El resumen estará disponible cuando terminen de cargar las hojas "
+                    f"({snapshot.ready_count()} de {len(snapshot.sheet_names)} listas).")
+            return
+        if snapshot.error is not None:
+            st.warning("No se pudo calcular el resumen: no todas las hojas se cargaron.")
+            return
+        with timer.stage('summary'):
+            resumen = snapshot.summary()
+
+        hojas = resumen['hojas']
+        metrica_col1, metrica_col2, metrica_col3, metrica_col4 = st.columns(4)
+        metrica_col1.metric("Expedientes", int(hojas['Expedientes'].sum()))
+        metrica_col2.metric("En despacho", int(hojas['Despacho'].sum()))
+        metrica_col3.metric("En prearchivo", int(hojas['Prearchivo'].sum()))
+        metrica_col4.metric("Hojas", len(hojas))
+        st.dataframe(hojas, use_container_width=True)
+
+        conteo_col1, conteo_col2 = st.columns(2)
+        with conteo_col1:
+            st.caption("Expedientes por tema")
+            st.dataframe(resumen['temas'], hide_index=True, use_container_width=True, height=250)
+        with conteo_col2:
+            st.caption("Expedientes por solicitante")
+            st.dataframe(resumen['solicitantes'], hide_index=True, use_container_width=True, height=250)
+
+        tramo_col1, tramo_col2 = st.columns(2)
+        with tramo_col1:
+            st.caption("Antigüedad desde la fecha de reparto")
+            st.dataframe(resumen['antiguedad'], hide_index=True, use_container_width=True)
+        with tramo_col2:
+            st.caption("Tiempo desde la última actuación (TRAZABILIDAD)")
+            st.dataframe(resumen['actividad'], hide_index=True, use_container_width=True)
+
+def mostrar_expedientes_base(conn, key, timer, search_term='', campo_busqueda='TODOS', libros=None, hoja=None):
+    """
+    Como mostrar_expedientes, con los datos de la base: solo se pide la página
+    actual (LIMIT/OFFSET) y se muestra en el orden de los libros, en mosaicos.
+    Devuelve el total de expedientes.
+    """
+    opciones_col1, opciones_col2 = st.columns(2)
+    with opciones_col1:
+        page_size = st.selectbox("Expedientes por página", PAGE_SIZES, key=f"{key}_page_size")
+
+    def pedir(pagina):
+        with timer.stage('store_search') as etapa:
+            total, page = search_store(conn, search_term, campo_busqueda, page_size, (pagina - 1) * page_size,
+                                       libros, hoja)
+            etapa['matches'] = total
+        return total, page
+
+    total, page = pedir(st.session_state.get(f"{key}_pagina", 1))
+    total_pages = max(1, -(-total // page_size))
+    # Ajustar la página si cambió el tamaño de página o el número de resultados
+    if st.session_state.get(f"{key}_pagina", 1) > total_pages:
+        st.session_state[f"{key}_pagina"] = total_pages
+        total, page = pedir(total_pages)
+    with opciones_col2:
+        pagina = st.number_input(f"Página (de {total_pages})", min_value=1, max_value=total_pages,
+                                 step=1, key=f"{key}_pagina")
+
+    inicio = (pagina - 1) * page_size
+    st.caption(f"Mostrando {inicio + 1 if len(page) else 0}-{inicio + len(page)} de {total} expedientes")
+    if len(page):
+        if hoja is None:
+            titulos = [f"📂 {expediente} - Hoja: {hoja_fila}"
+                       for expediente, hoja_fila in zip(page['EXPEDIENTE'].tolist(), page['HOJA_ORIGEN'].tolist())]
         else:
-            # Si la columna no existe en esta hoja, devolver DataFrame vacío
-            return pd.DataFrame()
-
-# Estilos CSS personalizados para mosaicos mejorados
-st.markdown("""
-    <style>
-        .title-container {
-            background-color: #1f77b4;
-            padding: 20px;
-            border-radius: 10px;
-            margin-bottom: 30px;
-            color: white;
-            text-align: center;
-        }
-        .data-container {
-            background-color: white;
-            padding: 20px;
-            border-radius: 8px;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-            margin-top: 20px;
-        }
-        .mosaic-container {
-            display: grid;
-            grid-template-columns: repeat(3, 1fr);
-            gap: 15px;
-            padding: 20px;
-        }
-        .mosaic-item {
-            background: white;
-            padding: 20px;
-            border-radius: 10px;
-            box-shadow: 0 2px 5px rgba(0, 0, 0, 0.1);
-            text-align: center;
-            font-size: 16px;
-            font-weight: bold;
-            border-top: 4px solid #1f77b4;
-        }
-        .trazabilidad-mosaic {
-            background: #f0f7ff !important;
-            border-top: 4px solid #1f77b4 !important;
-            text-align: left;
-            padding: 20px;
-            grid-column: 1 / span 3; /* Hace que ocupe toda la fila */
-            border: 1px solid #d0e3ff;
-        }
-        .icon {
-            font-size: 20px;
-            margin-right: 5px;
-        }
-        /* Nuevos estilos para visualización de trazabilidad en cuadrícula */
-        .trazabilidad-container {
-            width: 100%;
-            margin: 0;
-            overflow: hidden;
-        }
-        .trazabilidad-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(230px, 1fr));
-            gap: 15px;
-            padding: 10px;
-        }
-        .trazabilidad-item {
-            background: white;
-            border-top: 5px solid #1f77b4;
-            border-radius: 5px;
-            padding: 10px;
-            min-height: 120px;
-            box-shadow: 0 2px 5px rgba(31, 119, 180, 0.2);
-            transition: transform 0.3s ease, box-shadow 0.3s ease;
-            position: relative;
-        }
-        .trazabilidad-item:hover {
-            transform: translateY(-5px);
-            box-shadow: 0 5px 15px rgba(31, 119, 180, 0.3);
-            background-color: #f8fbff;
-        }
-        .trazabilidad-fecha {
-            text-align: center;
-            margin-bottom: 8px;
-            padding-bottom: 5px;
-            border-bottom: 1px solid #1f77b4;
-            color: #1f77b4;
-            font-weight: bold;
-        }
-        .trazabilidad-descripcion {
-            font-size: 14px;
-            overflow-wrap: break-word;
-        }
-        /* Estilos para el buscador */
-        .search-container {
-            background: white;
-            padding: 20px;
-            border-radius: 10px;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-            margin-bottom: 20px;
-            border-left: 5px solid #1f77b4;
-        }
-        .search-title {
-            color: #1f77b4;
-            font-weight: bold;
-            margin-bottom: 15px;
-        }
-        .search-icon {
-            color: #1f77b4;
-            font-size: 24px;
-        }
-        .search-results {
-            margin-top: 10px;
-            padding: 10px;
-            background: #f8f9fa;
-            border-radius: 5px;
-            font-size: 14px;
-        }
-        /* Badge para conteo de resultados */
-        .results-badge {
-            background: #1f77b4;
-            color: white;
-            padding: 5px 10px;
-            border-radius: 15px;
-            font-size: 14px;
-            margin-left: 10px;
-        }
-    </style>
-""", unsafe_allow_html=True)
-
-# Título principal
-st.markdown("""
-    <div class="title-container">
-        <h1>📊 HSA EXPEDIENTES EN DESPACHO Y PREARCHIVO</h1>
-        <p style='font-size: 18px;'>🔍 Sistema de Gestión de Información</p>
-    </div>
-""", unsafe_allow_html=True)
-
-# Cargar el archivo Excel
-file_path = 'HSA VISTA GENERAL H.M ALVARO ECHEVERRY.xlsx'
-try:
-    sheet_names = get_sheet_names(file_path)
-    
-    # Contenedor para el buscador
+            titulos = [f"📂 {expediente}" for expediente in page['EXPEDIENTE'].tolist()]
+        with timer.stage('render_results', rows=len(page)):
+            st.markdown(pagina_html_base(conn, page, titulos), unsafe_allow_html=True)
+    return total
+
+def mostrar_base(timer):
+    """
+    Dashboard sobre la base SQLite de hsa_store (ver HSA_STORE_DB y
+    HSA_STORE_WORKBOOKS): búsqueda y exploración por hojas pidiendo a la base
+    solo la página visible, así que la memoria no crece con el archivo. Los
+    libros se sincronizan en segundo plano al cambiar. El resumen, los filtros
+    por fecha y la descarga necesitan los datos en memoria y no se muestran.
+    """
+    with timer.stage('data_store') as etapa:
+        inicio = time.time()
+        sync = get_store_sync(STORE_DB)
+        etapa['cache'] = 'miss' if sync.created_at >= inicio else 'hit'
+    if sync.synced_at is not None:
+        st.caption(f"Base sincronizada con {len(sync.workbooks)} libro(s) el "
+                   f"{datetime.fromtimestamp(sync.synced_at).strftime('%d/%m/%Y %H:%M')}")
+    if not sync.ready():
+        st.caption("⏳ Sincronizando la base con los libros en segundo plano")
+    if sync.error is not None:
+        st.warning(f"La última sincronización falló; se muestran los datos anteriores ({sync.error}).")
+
+    # Una conexión del pool para todas las consultas del rerun
+    with sync.connection() as conn:
+        st.markdown("""
+            <div class="search-container">
+                <h3 class="search-title">🔍 Buscador de Expedientes</h3>
+            </div>
+        """, unsafe_allow_html=True)
+        search_col1, search_col2 = st.columns([3, 1])
+        with search_col1:
+            search_term = st.text_input("Ingrese término de búsqueda",
+                                        placeholder="Ej: nombre, número de expediente, tema...")
+        with search_col2:
+            campo_busqueda = st.selectbox("Campo de búsqueda", options=['TODOS'] + list_fields(conn))
+
+        # Búsqueda en vivo, como en el modo en memoria: una consulta nueva vuelve a la página 1
+        consulta = (search_term.strip(), campo_busqueda) if search_term.strip() else None
+        if consulta != st.session_state.get('busqueda'):
+            st.session_state.busqueda_pagina = 1
+            st.session_state.busqueda = consulta
+        if st.session_state.get('busqueda'):
+            search_term, campo_busqueda = st.session_state.busqueda
+            cabecera = st.container()
+            total = mostrar_expedientes_base(conn, 'busqueda', timer, search_term, campo_busqueda)
+            with cabecera:
+                st.markdown(f"""
+                    <div class="search-results">
+                        <h4>Resultados <span class="results-badge">{total}</span> expedientes encontrados en todas las hojas</h4>
+                    </div>
+                """, unsafe_allow_html=True)
+                if not total:
+                    st.info("No se encontraron resultados para la búsqueda en ninguna hoja.")
+
+        st.markdown("---")
+        st.subheader("Explorar por hojas")
+        hojas = list_sheets(conn)
+        varios_libros = hojas['libro'].nunique() > 1
+        for libro, hoja, expedientes in hojas.itertuples(index=False, name=None):
+            etiqueta = f"📁 {hoja} ({os.path.basename(libro)})" if varios_libros else f"📁 {hoja}"
+            if st.button(etiqueta, key=f"btn_{libro}_{hoja}", use_container_width=True):
+                st.session_state.expanded_sheet = (libro, hoja) if st.session_state.get('expanded_sheet') != (libro, hoja) else None
+            if st.session_state.get('expanded_sheet') == (libro, hoja):
+                mostrar_expedientes_base(conn, f"hoja_{libro}_{hoja}", timer, libros=[libro], hoja=hoja)
+
+def dashboard(timer):
+    """
+    Dibuja el dashboard registrando en timer el tiempo de cada etapa.
+    Devuelve el almacén de datos usado en el rerun (None si no se pudo cargar).
+    """
+    store = None
+    # Estilos CSS personalizados para mosaicos mejorados
+    st.markdown("""
+        <style>
+            .title-container {
+                background-color: #1f77b4;
+                padding: 20px;
+                border-radius: 10px;
+                margin-bottom: 30px;
+                color: white;
+                text-align: center;
+            }
+            .data-container {
+                background-color: white;
+                padding: 20px;
+                border-radius: 8px;
+                box-shadow: 0 4px 8px rgba(0,0,0,0.1);
+                margin-top: 20px;
+            }
+            .mosaic-container {
+                display: grid;
+                grid-template-columns: repeat(3, 1fr);
+                gap: 15px;
+                padding: 20px;
+            }
+            .mosaic-item {
+                background: white;
+                padding: 20px;
+                border-radius: 10px;
+                box-shadow: 0 2px 5px rgba(0, 0, 0, 0.1);
+                text-align: center;
+                font-size: 16px;
+                font-weight: bold;
+                border-top: 4px solid #1f77b4;
+            }
+            .trazabilidad-mosaic {
+                background: #f0f7ff !important;
+                border-top: 4px solid #1f77b4 !important;
+                text-align: left;
+                padding: 20px;
+                grid-column: 1 / span 3; /* Hace que ocupe toda la fila */
+                border: 1px solid #d0e3ff;
+            }
+            .icon {
+                font-size: 20px;
+                margin-right: 5px;
+            }
+            /* Nuevos estilos para visualización de trazabilidad en cuadrícula */
+            .trazabilidad-container {
+                width: 100%;
+                margin: 0;
+                overflow: hidden;
+            }
+            .trazabilidad-grid {
+                display: grid;
+                grid-template-columns: repeat(auto-fill, minmax(230px, 1fr));
+                gap: 15px;
+                padding: 10px;
+            }
+            .trazabilidad-item {
+                background: white;
+                border-top: 5px solid #1f77b4;
+                border-radius: 5px;
+                padding: 10px;
+                min-height: 120px;
+                box-shadow: 0 2px 5px rgba(31, 119, 180, 0.2);
+                transition: transform 0.3s ease, box-shadow 0.3s ease;
+                position: relative;
+            }
+            .trazabilidad-item:hover {
+                transform: translateY(-5px);
+                box-shadow: 0 5px 15px rgba(31, 119, 180, 0.3);
+                background-color: #f8fbff;
+            }
+            .trazabilidad-fecha {
+                text-align: center;
+                margin-bottom: 8px;
+                padding-bottom: 5px;
+                border-bottom: 1px solid #1f77b4;
+                color: #1f77b4;
+                font-weight: bold;
+            }
+            .trazabilidad-descripcion {
+                font-size: 14px;
+                overflow-wrap: break-word;
+            }
+            /* Expedientes de una página: un details por expediente, con el aspecto de un expander */
+            .expediente {
+                border: 1px solid rgba(49, 51, 63, 0.2);
+                border-radius: 8px;
+                margin-bottom: 10px;
+                background: white;
+            }
+            .expediente summary {
+                cursor: pointer;
+                padding: 12px 16px;
+                font-weight: 600;
+            }
+            .expediente[open] summary {
+                border-bottom: 1px solid rgba(49, 51, 63, 0.1);
+            }
+            /* Estilos para el buscador */
+            .search-container {
+                background: white;
+                padding: 20px;
+                border-radius: 10px;
+                box-shadow: 0 4px 8px rgba(0,0,0,0.1);
+                margin-bottom: 20px;
+                border-left: 5px solid #1f77b4;
+            }
+            .search-title {
+                color: #1f77b4;
+                font-weight: bold;
+                margin-bottom: 15px;
+            }
+            .search-icon {
+                color: #1f77b4;
+                font-size: 24px;
+            }
+            .search-results {
+                margin-top: 10px;
+                padding: 10px;
+                background: #f8f9fa;
+                border-radius: 5px;
+                font-size: 14px;
+            }
+            /* Badge para conteo de resultados */
+            .results-badge {
+                background: #1f77b4;
+                color: white;
+                padding: 5px 10px;
+                border-radius: 15px;
+                font-size: 14px;
+                margin-left: 10px;
+            }
+        </style>
+    """, unsafe_allow_html=True)
+
+    # Título principal
     st.markdown("""
-        <div class="search-container">
-            <h3 class="search-title">🔍 Buscador de Expedientes</h3>
+        <div class="title-container">
+            <h1>📊 HSA EXPEDIENTES EN DESPACHO Y PREARCHIVO</h1>
+            <p style='font-size: 18px;'>🔍 Sistema de Gestión de Información</p>
         </div>
     """, unsafe_allow_html=True)
-    
-    # Crear el buscador con Streamlit
-    search_col1, search_col2 = st.columns([3, 1])
-    
-    with search_col1:
-        search_term = st.text_input("Ingrese término de búsqueda", 
-                                   placeholder="Ej: nombre, número de expediente, tema...")
-    
-    # Obtener una lista de todas las columnas posibles de todas las hojas
-    all_columns = set()
-    common_columns = None
-    dfs_by_sheet = {}
-    
-    # Cargar todas las hojas para obtener columnas
-    for sheet in sheet_names:
-        df = load_sheet_data(file_path, sheet)
-        df.columns = df.columns.str.strip()
-        dfs_by_sheet[sheet] = df
-        
-        # Actualizar conjunto de todas las columnas
-        sheet_columns = set(df.columns)
-        all_columns.update(sheet_columns)
-        
-        # Mantener un seguimiento de las columnas comunes
-        if common_columns is None:
-            common_columns = sheet_columns
-        else:
-            common_columns = common_columns.intersection(sheet_columns)
-    
-    # Opciones de búsqueda
-    search_options_col1, search_options_col2 = st.columns([3, 1])
-    
-    with search_options_col1:
-        # Ordenar y convertir el conjunto a lista para el selectbox
-        search_columns = ['TODOS'] + sorted(list(all_columns))
-        campo_busqueda = st.selectbox("Campo de búsqueda", options=search_columns)
-    
-    with search_options_col2:
-        search_button = st.button("🔍 Buscar", use_container_width=True)
-    
-    # Realizar búsqueda si se presiona el botón
-    if search_button and search_term:
-        # Inicializar DataFrame para almacenar todos los resultados
-        all_results = pd.DataFrame()
-        total_results = 0
-        
-        # Buscar en todas las hojas
-        for sheet_name, df in dfs_by_sheet.items():
-            # Comprobar si el campo de búsqueda existe en esta hoja
-            if campo_busqueda == 'TODOS' or campo_busqueda in df.columns:
-                # Aplicar búsqueda
-                filtered = search_data(df, search_term, campo_busqueda)
-                
-                # Si hay resultados, añadir columna con nombre de la hoja
-                if not filtered.empty:
-                    filtered['HOJA_ORIGEN'] = sheet_name
-                    all_results = pd.concat([all_results, filtered], ignore_index=True)
-                    total_results += len(filtered)
-        
-        # Mostrar resultados de búsqueda
-        st.markdown(f"""
-            <div class="search-results">
-                <h4>Resultados <span class="results-badge">{total_results}</span> expedientes encontrados en todas las hojas</h4>
+
+    if STORE_DB:
+        try:
+            mostrar_base(timer)
+        except Exception as e:
+            log_event('dashboard_error', logging.ERROR, error=str(e))
+            st.error(f"❌ Error al consultar la base: {str(e)}")
+        return store
+
+    # Cargar el archivo Excel
+    file_path = DEFAULT_WORKBOOK
+    try:
+        # Datos compartidos entre sesiones; cada hoja se entrega como vista de solo lectura.
+        # Todo el rerun usa la misma versión aunque el libro se recargue mientras tanto.
+        with timer.stage('data_store') as etapa:
+            inicio = time.time()
+            store = get_data_store(file_path)
+            etapa['cache'] = 'miss' if store.created_at >= inicio else 'hit'
+            snapshot = store.snapshot()
+        sheet_names = snapshot.sheet_names
+        st.caption(f"Datos actualizados el {snapshot.loaded_at.strftime('%d/%m/%Y %H:%M')}")
+        if not snapshot.loaded():
+            st.caption(f"⏳ Cargando hojas en segundo plano: {snapshot.ready_count()} de {len(sheet_names)} listas")
+
+        mostrar_resumen(snapshot, timer)
+
+        # Contenedor para el buscador
+        st.markdown("""
+            <div class="search-container">
+                <h3 class="search-title">🔍 Buscador de Expedientes</h3>
             </div>
         """, unsafe_allow_html=True)
-        
-        # Mostrar los expedientes filtrados
-        if not all_results.empty:
-            for _, row in all_results.iterrows():
-                with st.expander(f"📂 {row['EXPEDIENTE']} - Hoja: {row['HOJA_ORIGEN']}"):
-                    # Mosaicos regulares (3 columnas)
-                    st.markdown("""
-                        <div class="mosaic-container">
-                            <div class="mosaic-item">📅 <b>Fecha de Reparto</b><br>{}</div>
-                            <div class="mosaic-item">🔄 <b>Reasignado</b><br>{}</div>
-                            <div class="mosaic-item">🔖 <b>Tema</b><br>{}</div>
-                            <div class="mosaic-item">👤 <b>Solicitante</b><br>{}</div>
-                            <div class="mosaic-item">🔍 <b>Seguimiento</b><br>{}</div>
-                            <div class="mosaic-item">📜 <b>Asunto</b><br>{}</div>
-                            <div class="trazabilidad-mosaic">{}</div>
-                        </div>
-                    """.format(
-                        format_date(row.get('FECHA DE REPARTO', 'No disponible')),
-                        row.get('EXPEDIENTES RE ASIGNADOS', 'No disponible'),
-                        row.get('TEMA', 'No disponible'),
-                        row.get('SOLICITANTE', 'No disponible'),
-                        row.get('SEGUIMIENTO', 'No disponible'),
-                        row.get('ASUNTO', 'No disponible'),
-                        render_trazabilidad(row.get('TRAZABILIDAD', 'No disponible'))
-                    ), unsafe_allow_html=True)
-        else:
-            st.info("No se encontraron resultados para la búsqueda en ninguna hoja.")
-    
-    # Línea divisoria
-    st.markdown("---")
-    
-    # Explorar todas las hojas (como estaba originalmente)
-    st.subheader("Explorar por hojas")
-    
-    if 'expanded_sheet' not in st.session_state:
-        st.session_state.expanded_sheet = None
-    
-    for sheet in sheet_names:
-        if st.button(f"📁 {sheet}", key=f"btn_{sheet}", use_container_width=True):
-            st.session_state.expanded_sheet = sheet if st.session_state.expanded_sheet != sheet else None
-        
-        if st.session_state.expanded_sheet == sheet:
-            df = load_sheet_data(file_path, sheet)
-            
-            df.columns = df.columns.str.strip()
-            
-            # Mostrar fechas en formato completo dd/mm/yyyy
-            if 'Trazabilidad' in df.columns:
-                # Asegurarnos de que los saltos de línea se preserven correctamente
-                df['Trazabilidad'] = df['Trazabilidad'].astype(str).str.replace(r'\\n', '\n', regex=True)
-                
-                # Limpiar posibles problemas de formato en el campo Trazabilidad
-                def limpiar_trazabilidad(texto):
-                    if not isinstance(texto, str):
-                        return texto
-                    # Asegurar que la fecha y su descripción estén correctamente separadas
-                    texto = re.sub(r'(\d{2}/\d{2}/\d{4}|\d{2}/\d{2}/\d{2})(?!\s)', r'\1 ', texto)
-                    return texto
-                
-                df['Trazabilidad'] = df['Trazabilidad'].apply(limpiar_trazabilidad)
-            
-            df = df.dropna(axis=1, how='all')
-            
-            for _, row in df.iterrows():
-                with st.expander(f"📂 {row['EXPEDIENTE']}"):
-                    # Mosaicos regulares (3 columnas)
-                    st.markdown("""
-                        <div class="mosaic-container">
-                            <div class="mosaic-item">📅 <b>Fecha de Reparto</b><br>{}</div>
-                            <div class="mosaic-item">🔄 <b>Reasignado</b><br>{}</div>
-                            <div class="mosaic-item">🔖 <b>Tema</b><br>{}</div>
-                            <div class="mosaic-item">👤 <b>Solicitante</b><br>{}</div>
-                            <div class="mosaic-item">🔍 <b>Seguimiento</b><br>{}</div>
-                            <div class="mosaic-item">📜 <b>Asunto</b><br>{}</div>
-                            <div class="trazabilidad-mosaic">{}</div>
-                        </div>
-                    """.format(
-                        format_date(row.get('FECHA DE REPARTO', 'No disponible')),
-                        row.get('EXPEDIENTES RE ASIGNADOS', 'No disponible'),
-                        row.get('TEMA', 'No disponible'),
-                        row.get('SOLICITANTE', 'No disponible'),
-                        row.get('SEGUIMIENTO', 'No disponible'),
-                        row.get('ASUNTO', 'No disponible'),
-                        render_trazabilidad(row.get('TRAZABILIDAD', 'No disponible'))
-                    ), unsafe_allow_html=True)
-except Exception as e:
-    st.error(f"❌ Error al cargar el archivo: {str(e)}")
-    st.info("ℹ️ Por favor verifica la ruta del archivo y su formato.")
\ No newline at end of file
+
+        # Crear el buscador con Streamlit
+        search_col1, search_col2 = st.columns([3, 1])
+
+        with search_col1:
+            search_term = st.text_input("Ingrese término de búsqueda", 
+                                       placeholder="Ej: nombre, número de expediente, tema...")
+
+        # Obtener una lista de todas las columnas posibles de todas las hojas
+        all_columns = set()
+        common_columns = None
+
+        # Las columnas salen de los encabezados: no hace falta esperar a que carguen las hojas
+        for sheet in sheet_names:
+            # Actualizar conjunto de todas las columnas
+            sheet_columns = set(snapshot.columns[sheet])
+            all_columns.update(sheet_columns)
+
+            # Mantener un seguimiento de las columnas comunes
+            if common_columns is None:
+                common_columns = sheet_columns
+            else:
+                common_columns = common_columns.intersection(sheet_columns)
+
+        # Opciones de búsqueda
+        search_options_col1, search_options_col2 = st.columns([3, 1])
+
+        with search_options_col1:
+            # Ordenar y convertir el conjunto a lista para el selectbox
+            search_columns = ['TODOS'] + sorted(list(all_columns))
+            campo_busqueda = st.selectbox("Campo de búsqueda", options=search_columns)
+
+        with search_options_col2:
+            search_button = st.button("🔍 Buscar", use_container_width=True)
+
+        # Filtros por fecha, combinables con la búsqueda por términos
+        filtro_col1, filtro_col2, filtro_col3 = st.columns([2, 2, 1])
+        with filtro_col1:
+            rango = st.date_input("📅 Con movimiento entre", value=(), format="DD/MM/YYYY", key='filtro_rango')
+        with filtro_col2:
+            fuente = st.selectbox("Fechas consideradas", list(DATE_SOURCES), key='filtro_fuente')
+        with filtro_col3:
+            dias = st.number_input("Sin actuaciones en (días)", min_value=0, step=30, key='filtro_dias',
+                                   help="Expedientes cuya última actuación (o su reparto, si no tienen) es más "
+                                        "antigua que estos días. 0 desactiva el filtro.")
+        # Mientras se elige el rango llega solo la fecha inicial
+        rango = tuple(rango) if isinstance(rango, (tuple, list)) else (rango,)
+        filtros = None
+        if rango or dias:
+            filtros = (rango[0] if rango else None, rango[1] if len(rango) > 1 else None, fuente, int(dias))
+
+        # Búsqueda en vivo: Streamlit envía el texto al presionar Enter o al salir del campo
+        # (no hay eventos por tecla), así que cada envío ya agrupa lo escrito. Se guarda para
+        # que siga visible al cambiar de página o de vista, y solo una consulta nueva vuelve a la página 1
+        consulta = (search_term.strip(), campo_busqueda, filtros) if search_term.strip() or filtros else None
+        if search_button or consulta != st.session_state.get('busqueda'):
+            if consulta != st.session_state.get('busqueda'):
+                st.session_state.busqueda_pagina = 1
+            st.session_state.busqueda = consulta
+
+        # Realizar búsqueda si hay una búsqueda activa
+        if st.session_state.get('busqueda'):
+            search_term, campo_busqueda, filtros = st.session_state.busqueda
+            # Resultados de cada hoja: se unen una sola vez al final
+            piezas = []
+            coincidencias = {}
+            total_results = 0
+
+            # Filas de cada hoja que cumplen los filtros por fecha (None si no hay filtros)
+            por_fecha = None
+            if filtros:
+                desde, hasta, fuente, dias = filtros
+                with st.spinner("Cargando todas las hojas para filtrar por fecha..."):
+                    with timer.stage('timeline_filter') as etapa:
+                        por_fecha = snapshot.timeline_positions(
+                            desde, hasta, DATE_SOURCES[fuente],
+                            inactivo_desde=date.today() - timedelta(days=dias) if dias else None)
+                        etapa['matches'] = sum(len(filas) for filas in por_fecha.values())
+
+            # Buscar en todas las hojas
+            for sheet_name in sheet_names:
+                # Comprobar si el campo de búsqueda existe en esta hoja
+                if not search_term or campo_busqueda == 'TODOS' or campo_busqueda in snapshot.columns[sheet_name]:
+                    df = cargar_hoja(snapshot, sheet_name, timer)
+                    if search_term:
+                        # Aplicar búsqueda: desde el caché, o refinando una búsqueda anterior más general
+                        with timer.stage('search_data', rows=len(df)) as etapa:
+                            posiciones, etapa['cache'] = SEARCH_CACHE.search_sheet(snapshot, sheet_name,
+                                                                                   search_term, campo_busqueda)
+                            etapa['matches'] = len(posiciones)
+                        if por_fecha is not None:
+                            posiciones = np.intersect1d(posiciones, por_fecha[sheet_name], assume_unique=True)
+                    else:
+                        posiciones = por_fecha[sheet_name]
+                    filtered = df.iloc[posiciones]
+
+                    # Si hay resultados, añadir columna con nombre de la hoja
+                    if not filtered.empty:
+                        # Categórica con todas las hojas: el nombre se guarda una vez y no una por fila
+                        filtered['HOJA_ORIGEN'] = pd.Categorical([sheet_name] * len(filtered),
+                                                                 categories=sheet_names)
+                        piezas.append(filtered)
+                        coincidencias[sheet_name] = posiciones
+                        total_results += len(filtered)
+
+            all_results = pd.DataFrame()
+            if piezas:
+                with timer.stage('concat_results', rows=total_results):
+                    # Se conserva el índice original: es la fila de la hoja para buscar sus eventos
+                    all_results = pd.concat(piezas)
+
+            # Mostrar resultados de búsqueda
+            st.markdown(f"""
+                <div class="search-results">
+                    <h4>Resultados <span class="results-badge">{total_results}</span> expedientes encontrados en todas las hojas</h4>
+                </div>
+            """, unsafe_allow_html=True)
+
+            if coincidencias:
+                mostrar_descarga(snapshot, coincidencias)
+
+            # Mostrar los expedientes filtrados, una página a la vez
+            if not all_results.empty:
+                with timer.stage('render_results', rows=len(all_results)):
+                    mostrar_expedientes(all_results, 'busqueda', snapshot)
+            else:
+                st.info("No se encontraron resultados para la búsqueda en ninguna hoja.")
+
+        # Línea divisoria
+        st.markdown("---")
+
+        # Explorar todas las hojas (como estaba originalmente)
+        st.subheader("Explorar por hojas")
+
+        if 'expanded_sheet' not in st.session_state:
+            st.session_state.expanded_sheet = None
+
+        for sheet in sheet_names:
+            if st.button(f"📁 {sheet}", key=f"btn_{sheet}", use_container_width=True):
+                st.session_state.expanded_sheet = sheet if st.session_state.expanded_sheet != sheet else None
+
+            if st.session_state.expanded_sheet == sheet:
+                # Las columnas y la trazabilidad ya vienen normalizadas desde la ingesta
+                df = cargar_hoja(snapshot, sheet, timer)
+
+                df = df.dropna(axis=1, how='all')
+
+                with timer.stage('render_sheet', rows=len(df)):
+                    mostrar_expedientes(df, f"hoja_{sheet}", snapshot, hoja=sheet)
+    except Exception as e:
+        log_event('dashboard_error', logging.ERROR, error=str(e))
+        st.error(f"❌ Error al cargar el archivo: {str(e)}")
+        st.info("ℹ️ Por favor verifica la ruta del archivo y su formato.")
+    return store
+
+def diagnostics_enabled():
+    """
+    El panel de diagnóstico se activa con ?diagnostico=1 en la URL o con HSA_DIAGNOSTICS=1.
+    """
+    activos = ('1', 'true', 'si', 'sí')
+    return (os.environ.get('HSA_DIAGNOSTICS', '').lower() in activos
+            or st.query_params.get('diagnostico', '').lower() in activos)
+
+def profile_report(profiler, limite=30):
+    """
+    Texto con las funciones más costosas (por tiempo acumulado) de un perfil de cProfile.
+    """
+    salida = io.StringIO()
+    pstats.Stats(profiler, stream=salida).sort_stats('cumulative').print_stats(limite)
+    return salida.getvalue()
+
+def mostrar_diagnostico(timer, store, wall_ms):
+    """
+    Panel lateral con los tiempos del último rerun, la construcción de la
+    versión vigente de los datos, los cachés de carga y la memoria de las hojas.
+    """
+    with st.sidebar:
+        st.subheader("🩺 Diagnóstico")
+        st.caption(f"Último rerun: {wall_ms:.0f} ms (etapas medidas: {timer.total_ms():.0f} ms)")
+        st.dataframe(pd.DataFrame(timer.records()), hide_index=True, use_container_width=True)
+
+        if store is not None:
+            st.caption("Cachés de carga del proceso")
+            st.dataframe(pd.DataFrame(sorted(LOAD_STATS.items()), columns=['contador', 'valor']),
+                         hide_index=True, use_container_width=True)
+
+            snapshot = store.snapshot()
+            st.caption(f"Versión de los datos {snapshot.version}: construida en "
+                       f"{snapshot.timer.total_ms():.0f} ms")
+            st.dataframe(pd.DataFrame(snapshot.timer.records()), hide_index=True, use_container_width=True)
+            pico = f"{snapshot.peak_rss_mb:.0f} MB" if snapshot.peak_rss_mb is not None else "no disponible"
+            st.caption(f"Memoria de las hojas: {snapshot.frames_mb():.1f} MB · pico del proceso: {pico}")
+            memoria = pd.DataFrame.from_dict(snapshot.memory, orient='index').round(2)
+            st.dataframe(memoria, use_container_width=True)
+            st.caption("Memoria por columna (todas las hojas)")
+            st.dataframe(snapshot.column_memory_report(), hide_index=True, use_container_width=True)
+
+        # El clic provoca un rerun; el callback se ejecuta antes, así que ese rerun queda perfilado
+        st.button("⏱️ Perfilar el próximo rerun", use_container_width=True,
+                  on_click=lambda: st.session_state.update(perfilar_rerun=True))
+        if st.session_state.get('perfil_rerun'):
+            st.caption("Perfil del último rerun perfilado (cProfile, tiempo acumulado)")
+            st.code(st.session_state.perfil_rerun, language=None)
+
+def main():
+    """
+    Dibuja el dashboard. Streamlit ejecuta este archivo como __main__; al
+    importarlo (benchmarks, scripts) solo se cargan las funciones de datos.
+    """
+    # Configuración de la página
+    st.set_page_config(
+        page_title="HSA Dashboard",
+        page_icon="📊",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+
+    diagnostico = diagnostics_enabled()
+    timer = StageTimer()
+    inicio = time.perf_counter()
+    profiler = cProfile.Profile() if diagnostico and st.session_state.pop('perfilar_rerun', False) else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        store = dashboard(timer)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            st.session_state.perfil_rerun = profile_report(profiler)
+            log_event('rerun_profile', profile=st.session_state.perfil_rerun)
+    wall_ms = (time.perf_counter() - inicio) * 1000
+    # Cada rerun queda en el registro; en nivel INFO solo con el diagnóstico activo
+    timer.log('rerun', logging.INFO if diagnostico else logging.DEBUG, wall_ms=round(wall_ms, 2))
+    if diagnostico:
+        mostrar_diagnostico(timer, store, wall_ms)
+
+if __name__ == '__main__':
+    main()
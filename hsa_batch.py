@@ -0,0 +1,109 @@
+"""
+Consultas por lotes contra el libro HSA, sin servidor de Streamlit: lee un
+archivo de consultas (término y campo) y escribe cada expediente encontrado
+como una línea JSON. El libro se carga una sola vez para todas las consultas.
+
+Formato de las consultas, una por línea (las vacías y las que empiezan por # se ignoran):
+    {"term": "pepito", "campo": "SOLICITANTE"}    JSON; campo es opcional (por defecto TODOS)
+    pepito<TAB>SOLICITANTE                        texto separado por tabulador
+
+Uso:
+    python hsa_batch.py consultas.jsonl > resultados.jsonl
+    python hsa_batch.py - --workbook otro.xlsx --eventos < consultas.txt
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+
+from hsa_engine import DEFAULT_WORKBOOK, WorkbookSnapshot, json_value, log_event, search_snapshot
+
+def parse_queries(lineas):
+    """
+    Genera (número de línea, término, campo) a partir de las líneas del archivo de consultas.
+    """
+    for numero, linea in enumerate(lineas, start=1):
+        linea = linea.rstrip('\r\n')
+        if not linea.strip() or linea.lstrip().startswith('#'):
+            continue
+        if linea.lstrip().startswith('{'):
+            try:
+                consulta = json.loads(linea)
+            except ValueError as e:
+                log_event('batch_invalid_query', logging.WARNING, line=numero, error=str(e))
+                continue
+            term, campo = consulta.get('term', ''), consulta.get('campo') or 'TODOS'
+        else:
+            term, _, campo = linea.partition('\t')
+            campo = campo.strip() or 'TODOS'
+        yield numero, str(term), campo
+
+def run_queries(snapshot, consultas, salida, limite=None, columnas=None, eventos=False, resumen=False):
+    """
+    Ejecuta las consultas y escribe una línea JSON por expediente encontrado
+    (y, si resumen, una línea con el total de cada consulta). Devuelve el total de coincidencias.
+    """
+    total = 0
+    for numero, term, campo in consultas:
+        encontrados = 0
+        for hoja, resultados in search_snapshot(snapshot, term, campo):
+            if limite is not None:
+                resultados = resultados.head(limite - encontrados)
+            if columnas:
+                resultados = resultados[[col for col in columnas if col in resultados.columns]]
+            for fila, registro in zip(resultados.index, resultados.to_dict('records')):
+                linea = {
+                    'query': numero,
+                    'term': term,
+                    'campo': campo,
+                    'hoja': hoja,
+                    'fila': int(fila),
+                    'expediente': {col: json_value(valor) for col, valor in registro.items()},
+                }
+                if eventos:
+                    linea['trazabilidad'] = [
+                        {'fecha': evento['fecha_obj'].date().isoformat() if 'fecha_obj' in evento else None,
+                         'fecha_texto': evento['fecha'],
+                         'descripcion': evento['descripcion']}
+                        for evento in snapshot.eventos(hoja, fila)
+                    ]
+                salida.write(json.dumps(linea, ensure_ascii=False) + '\n')
+            encontrados += len(resultados)
+            if limite is not None and encontrados >= limite:
+                break
+        if resumen:
+            salida.write(json.dumps({'query': numero, 'term': term, 'campo': campo, 'matches': encontrados},
+                                    ensure_ascii=False) + '\n')
+        # Cada consulta se entrega completa, sin esperar a que termine el lote
+        salida.flush()
+        total += encontrados
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Consultas por lotes contra el libro HSA, con salida en líneas JSON.")
+    parser.add_argument('queries', help="Archivo de consultas ('-' para la entrada estándar)")
+    parser.add_argument('--workbook', default=DEFAULT_WORKBOOK, help="Ruta del libro .xlsx")
+    parser.add_argument('--output', help="Archivo de salida (por defecto, la salida estándar)")
+    parser.add_argument('--limit', type=int, help="Máximo de expedientes por consulta")
+    parser.add_argument('--columns', nargs='+', help="Columnas del expediente a incluir (por defecto, todas)")
+    parser.add_argument('--eventos', action='store_true', help="Incluir los eventos de TRAZABILIDAD ya procesados")
+    parser.add_argument('--summary', action='store_true', help="Escribir una línea con el total de cada consulta")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    snapshot = WorkbookSnapshot(args.workbook)
+    entrada = sys.stdin if args.queries == '-' else open(args.queries, encoding='utf-8')
+    salida = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        total = run_queries(snapshot, parse_queries(entrada), salida, args.limit, args.columns,
+                            args.eventos, args.summary)
+    finally:
+        if entrada is not sys.stdin:
+            entrada.close()
+        if salida is not sys.stdout:
+            salida.close()
+    log_event('batch_done', matches=total, seconds=round(time.perf_counter() - inicio, 3))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1785 @@
+"""
+Capa de datos del dashboard HSA, sin dependencia de Streamlit: lectura y
+caché del libro, eventos de TRAZABILIDAD, fechas normalizadas, índice de
+búsqueda y versiones compartidas de los datos. La usan hsa.py (interfaz)
+y hsa_batch.py (consultas por lotes).
+"""
+import pandas as pd
+import numpy as np
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+import csv
+import hashlib
+import io
+from itertools import islice
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+
+import openpyxl
+from openpyxl.cell.cell import ERROR_CODES, ILLEGAL_CHARACTERS_RE
+from openpyxl.cell import WriteOnlyCell
+
+def format_date(date_str):
+    """
+    Formatea una fecha en el formato deseado (dd/mm/aa).
+    Elimina la parte de tiempo si existe.
+    """
+    if date_str == 'No disponible':
+        return date_str
+        
+    try:
+        # Intentar varios formatos de fecha posibles
+        for fmt in ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%d/%m/%Y']:
+            try:
+                date_obj = datetime.strptime(str(date_str), fmt)
+                # Retornar en formato dd/mm/yyyy
+                return date_obj.strftime('%d/%m/%Y')
+            except ValueError:
+                continue
+                
+        # Si no se pudo convertir con ninguno de los formatos, devolver el original
+        return date_str
+    except:
+        # En caso de cualquier error, devolver el original
+        return date_str
+
+def process_trazabilidad(trazabilidad_str):
+    """
+    Procesa el texto de trazabilidad para extraer fechas y descripciones.
+    Maneja correctamente los saltos de línea para separar eventos distintos.
+    """
+    # Corrección específica para el caso de "14/05/2024 (5 FOLIOS)"
+    trazabilidad_str = corregir_caso_especifico(trazabilidad_str)
+    
+    # Manejar mejor los saltos de línea
+    if isinstance(trazabilidad_str, str):
+        # Reemplazar múltiples variantes de saltos de línea por un formato estándar
+        trazabilidad_str = re.sub(r'\\n', '\n', trazabilidad_str)
+        
+        # Dividir por líneas y procesar cada línea por separado
+        lineas = trazabilidad_str.split('\n')
+        trazabilidad_processed = []
+        
+        fecha_pattern = r'\d{2}/\d{2}/\d{4}|\d{2}/\d{2}/\d{2}'  # Acepta tanto dd/mm/yyyy como dd/mm/yy
+        
+        for linea in lineas:
+            linea = linea.strip()
+            if not linea:
+                continue
+                
+            # Buscar fecha en esta línea
+            match = re.search(fecha_pattern, linea)
+            if match:
+                fecha_original = match.group(0)
+                inicio = match.start()
+                
+                # Normalizar la fecha al formato completo (yyyy)
+                partes_fecha = fecha_original.split('/')
+                if len(partes_fecha) == 3:
+                    dia = partes_fecha[0]
+                    mes = partes_fecha[1]
+                    anio = partes_fecha[2]
+                    # Si el año tiene 2 dígitos, convertirlo a 4 dígitos
+                    if len(anio) == 2:
+                        anio = '20' + anio  # Asumimos años 2000+
+                    fecha = f"{dia}/{mes}/{anio}"
+                else:
+                    fecha = fecha_original
+                
+                # Extraer descripción (todo lo que sigue después de la fecha original)
+                descripcion = ""
+                if inicio + len(fecha_original) < len(linea):
+                    descripcion = linea[inicio + len(fecha_original):].strip()
+                    descripcion = re.sub(r'^[\s\-–—]+', '', descripcion)
+                
+                # Convertir la fecha a un objeto datetime para ordenación posterior
+                try:
+                    fecha_formato = '%d/%m/%Y'
+                    fecha_obj = datetime.strptime(fecha, fecha_formato)
+                    trazabilidad_processed.append({
+                        'fecha': fecha,
+                        'fecha_obj': fecha_obj,
+                        'descripcion': descripcion
+                    })
+                except Exception as e:
+                    # Si hay un error en el formato de fecha, añadir sin fecha_obj
+                    print(f"Error al procesar fecha: {fecha} - {str(e)}")
+                    trazabilidad_processed.append({
+                        'fecha': fecha,
+                        'descripcion': descripcion
+                    })
+        
+        # Ordenar por fecha, de más reciente a más antigua
+        trazabilidad_processed = sorted(trazabilidad_processed, 
+                                      key=lambda x: x.get('fecha_obj', datetime.min), 
+                                      reverse=True)
+        return trazabilidad_processed
+    return []
+
+def corregir_caso_especifico(texto):
+    """
+    Corrige manualmente el caso específico de "14/05/2024 (5 FOLIOS)" 
+    para asegurar que muestre "14/05/2024 REPARTO (5 FOLIOS)"
+    """
+    if not isinstance(texto, str):
+        return texto
+        
+    # Buscar específicamente el patrón problemático
+    patron = r'(14/05/20?24)\s*\(?5 FOLIOS\)?'
+    reemplazo = r'\1 REPARTO (5 FOLIOS)'
+    
+    # Reemplazar directamente
+    texto_corregido = re.sub(patron, reemplazo, texto, flags=re.IGNORECASE)
+    
+    # También manejar el caso donde el texto completo está, pero separado incorrectamente
+    patron2 = r'(14/05/20?24)(\s*)\(?5 FOLIOS\)?'
+    if re.search(patron2, texto_corregido, re.IGNORECASE) and not re.search(r'REPARTO', texto_corregido, re.IGNORECASE):
+        texto_corregido = re.sub(patron2, r'\1 REPARTO (5 FOLIOS)', texto_corregido, flags=re.IGNORECASE)
+    
+    return texto_corregido
+
+# Patrones precompilados para extraer los eventos de TRAZABILIDAD de una hoja completa
+_PATRON_CASO_14_05 = re.compile(r'(14/05/20?24)\s*\(?5 FOLIOS\)?', re.IGNORECASE)
+# Primera fecha de cada línea (dd/mm/yyyy o dd/mm/yy) y el resto de la línea como descripción
+_PATRON_EVENTO = re.compile(
+    r'^.*?(?P<dia>\d{2})/(?P<mes>\d{2})/(?P<anio>\d{4}|\d{2})(?P<descripcion>.*)$',
+    re.MULTILINE,
+)
+EVENT_COLUMNS = ['hoja', 'fila', 'orden', 'fecha', 'fecha_texto', 'fecha_corta', 'descripcion']
+
+def build_trazabilidad_events(df, sheet_name):
+    """
+    Convierte la columna TRAZABILIDAD de una hoja en una tabla de eventos
+    (hoja, fila, orden, fecha, fecha_texto, fecha_corta, descripcion), ordenada por fila y,
+    dentro de cada fila, de la fecha más reciente a la más antigua.
+    Equivale a aplicar process_trazabilidad a cada fila, pero de forma vectorizada.
+    """
+    if 'TRAZABILIDAD' not in df.columns:
+        return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in [
+            ('hoja', 'object'), ('fila', 'int64'), ('orden', 'int64'),
+            ('fecha', 'datetime64[s]'), ('fecha_texto', 'object'), ('fecha_corta', 'object'),
+            ('descripcion', 'object')]})
+
+    textos = df['TRAZABILIDAD'].reset_index(drop=True)
+    textos = textos[textos.map(lambda valor: isinstance(valor, str))].astype(object)
+    textos = textos.str.replace(_PATRON_CASO_14_05, r'\1 REPARTO (5 FOLIOS)', regex=True)
+    textos = textos.str.replace('\\n', '\n', regex=False)
+
+    partes = textos.str.extractall(_PATRON_EVENTO)
+    anio = partes['anio'].where(partes['anio'].str.len() == 4, '20' + partes['anio'])
+    fecha_texto = partes['dia'] + '/' + partes['mes'] + '/' + anio
+    descripcion = partes['descripcion'].fillna('').str.strip().str.replace(r'^[\s\-–—]+', '', regex=True)
+
+    events = pd.DataFrame({
+        'hoja': sheet_name,
+        'fila': partes.index.get_level_values(0).to_numpy(dtype='int64'),
+        'linea': partes.index.get_level_values(1).to_numpy(dtype='int64'),
+        'fecha': pd.to_datetime(fecha_texto, format='%d/%m/%Y', errors='coerce').to_numpy(dtype='datetime64[s]'),
+        'fecha_texto': fecha_texto.to_numpy(dtype=object),
+        'descripcion': descripcion.to_numpy(dtype=object),
+    })
+    # Mismo orden que process_trazabilidad: fecha descendente, fechas inválidas al final
+    events = events.sort_values(['fila', 'fecha', 'linea'], ascending=[True, False, True],
+                                na_position='last', kind='stable').reset_index(drop=True)
+    events['orden'] = events.groupby('fila').cumcount()
+    # Fecha ya formateada para mostrar (dd/mm/aa); si no es válida se muestra el texto original.
+    # Se recorta del texto dd/mm/yyyy, que es mucho más rápido que strftime.
+    events['fecha_corta'] = (events['fecha_texto'].str[:6] + events['fecha_texto'].str[8:]).where(
+        events['fecha'].notna(), events['fecha_texto'])
+    # Columnas de texto como object: eventos_de_fila lee sus arrays sin conversión por cada fila
+    for col in ('hoja', 'fecha_texto', 'fecha_corta', 'descripcion'):
+        events[col] = events[col].astype(object)
+    return events[EVENT_COLUMNS]
+
+def events_arrays(events):
+    """
+    Columnas de la tabla de eventos como arrays de numpy, para consultar
+    muchas filas sin el costo de indexar el DataFrame en cada una.
+    """
+    return {col: events[col].to_numpy() for col in EVENT_COLUMNS}
+
+def eventos_de_fila(events, fila):
+    """
+    Devuelve los eventos ya ordenados de una fila, con la misma estructura
+    que process_trazabilidad. events es la tabla de eventos o, más rápido,
+    el resultado de events_arrays.
+    """
+    filas = np.asarray(events['fila'])
+    inicio, fin = np.searchsorted(filas, [fila, fila + 1])
+    if inicio == fin:
+        return []
+    eventos = []
+    for fecha_texto, fecha, fecha_corta, descripcion in zip(np.asarray(events['fecha_texto'])[inicio:fin],
+                                                            np.asarray(events['fecha'])[inicio:fin],
+                                                            np.asarray(events['fecha_corta'])[inicio:fin],
+                                                            np.asarray(events['descripcion'])[inicio:fin]):
+        evento = {'fecha': fecha_texto, 'fecha_corta': fecha_corta, 'descripcion': descripcion}
+        if not np.isnat(fecha):
+            evento['fecha_obj'] = pd.Timestamp(fecha)
+        eventos.append(evento)
+    return eventos
+
+# Registro estructurado: una línea JSON por evento (tiempos por etapa, recargas, errores)
+logger = logging.getLogger('hsa')
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(os.environ.get('HSA_LOG_LEVEL', 'INFO').upper())
+    logger.propagate = False
+
+def log_event(evento, nivel=logging.INFO, **datos):
+    logger.log(nivel, json.dumps({'event': evento, **datos}, ensure_ascii=False, default=str))
+
+# Aciertos y fallos de los cachés de carga en este proceso, para el panel de diagnóstico
+LOAD_STATS = Counter()
+
+class StageTimer:
+    """
+    Acumula el tiempo de cada etapa (lectura, búsqueda, dibujo...) junto con
+    datos como filas procesadas o aciertos de caché. Si una etapa se repite,
+    sus tiempos y sus valores numéricos se suman. Admite que un hilo lo
+    actualice mientras otro lo consulta.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, etapa, **datos):
+        """
+        Mide el bloque; el diccionario entregado admite datos adicionales de la etapa.
+        """
+        inicio = time.perf_counter()
+        try:
+            yield datos
+        finally:
+            self.add(etapa, time.perf_counter() - inicio, **datos)
+
+    def add(self, etapa, segundos, **datos):
+        with self._lock:
+            registro = self.stages.setdefault(etapa, {'stage': etapa, 'ms': 0.0, 'calls': 0})
+            registro['ms'] += segundos * 1000
+            registro['calls'] += 1
+            for clave, valor in datos.items():
+                if isinstance(valor, (int, float)) and not isinstance(valor, bool) and clave in registro:
+                    registro[clave] += valor
+                else:
+                    registro[clave] = valor
+
+    def records(self):
+        with self._lock:
+            return [{**registro, 'ms': round(registro['ms'], 2)} for registro in self.stages.values()]
+
+    def total_ms(self):
+        with self._lock:
+            return round(sum(registro['ms'] for registro in self.stages.values()), 2)
+
+    def log(self, evento, nivel=logging.INFO, **datos):
+        log_event(evento, nivel, total_ms=self.total_ms(), stages=self.records(), **datos)
+
+def frame_memory_mb(df):
+    """
+    Memoria ocupada por un DataFrame, incluidos los textos, en MB.
+    """
+    return float(df.memory_usage(deep=True).sum()) / 2 ** 20
+
+def column_memory_mb(df):
+    """
+    Memoria de cada columna de un DataFrame, incluidos los textos, en MB.
+    """
+    return {col: float(mb) / 2 ** 20 for col, mb in df.memory_usage(deep=True, index=False).items()}
+
+def peak_rss_mb():
+    """
+    Pico de memoria residente del proceso en MB (None donde no hay módulo resource, ej. Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KB y macOS bytes
+    return maxrss / 2 ** 20 if sys.platform == 'darwin' else maxrss / 2 ** 10
+
+# Caché en disco de las hojas ya normalizadas, una carpeta por versión del libro
+CACHE_DIR = os.environ.get('HSA_CACHE_DIR', '.hsa_cache')
+# Incrementar cuando cambie el formato o la normalización de lo guardado en caché
+CACHE_VERSION = 2
+
+def limpiar_trazabilidad(texto):
+    """
+    Asegura que la fecha y su descripción estén correctamente separadas.
+    """
+    if not isinstance(texto, str):
+        return texto
+    # Solo cuando la descripción viene pegada a la fecha (ej: "14/04/2025AUTO");
+    # exigir una letra evita partir años de 4 dígitos como "20/03/20 25"
+    return re.sub(r'(\d{2}/\d{2}/(?:\d{4}|\d{2}))(?=[^\W\d_])', r'\1 ', texto)
+
+def normalize_sheet(df):
+    """
+    Normaliza una hoja recién leída: limpia los nombres de columna y
+    corrige los saltos de línea y separaciones de fecha en TRAZABILIDAD.
+    """
+    df.columns = df.columns.str.strip()
+    if 'TRAZABILIDAD' in df.columns:
+        # Asegurarnos de que los saltos de línea se preserven correctamente
+        df['TRAZABILIDAD'] = df['TRAZABILIDAD'].map(
+            lambda texto: limpiar_trazabilidad(texto.replace('\\n', '\n')) if isinstance(texto, str) else texto
+        )
+    return compact_columns(df)
+
+# Una columna de texto se guarda como categórica si tiene a lo sumo esta proporción de valores distintos
+CATEGORY_MAX_RATIO = 0.5
+
+def compact_columns(df):
+    """
+    Guarda como categóricas las columnas de texto con pocos valores distintos
+    (TEMA, SOLICITANTE, ESTADO...): cada valor se guarda una sola vez y las
+    filas solo llevan su código. Las de texto libre (ASUNTO, TRAZABILIDAD) no cambian.
+    """
+    for posicion, col in enumerate(df.columns):
+        serie = df.iloc[:, posicion]
+        if pd.api.types.infer_dtype(serie, skipna=True) != 'string':
+            continue
+        valores = serie.count()
+        if valores and serie.nunique() <= CATEGORY_MAX_RATIO * valores:
+            df.isetitem(posicion, serie.astype('category'))
+    return df
+
+def workbook_fingerprint(file_path):
+    """
+    Calcula la huella del libro a partir de su tamaño, fecha de modificación
+    y hash del contenido. Cualquier cambio en el archivo produce otra huella.
+    """
+    stat = os.stat(file_path)
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            sha.update(bloque)
+    return f"{stat.st_size}-{stat.st_mtime_ns}-{sha.hexdigest()[:16]}"
+
+# Procesos que leen las hojas en paralelo: 1 las lee una tras otra en este proceso, 0 usa uno por núcleo
+INGEST_WORKERS = int(os.environ.get('HSA_INGEST_WORKERS', '1'))
+
+# Libro abierto en cada proceso del pool de ingesta: abrirlo lee todos sus textos
+# compartidos, así que cada proceso lo abre una vez y lo usa para todas sus hojas
+_LIBRO_ABIERTO = {}
+
+# Cómo se leen las hojas: 'pandas' (read_excel, toda la hoja en memoria antes de tipar) o
+# 'streaming' (filas en bloques de CHUNK_ROWS, para libros muy grandes con memoria acotada)
+INGEST_MODE = os.environ.get('HSA_INGEST_MODE', 'pandas')
+CHUNK_ROWS = int(os.environ.get('HSA_CHUNK_ROWS', '5000'))
+
+# Textos que read_excel toma como vacíos
+_TEXTOS_NULOS = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+]).union(ERROR_CODES)
+
+def _valor_celda(valor):
+    """
+    Valor de una celda como lo deja read_excel: vacíos y errores como None y
+    los números enteros guardados como decimales como int.
+    """
+    if isinstance(valor, str):
+        return None if valor in _TEXTOS_NULOS else valor
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    return valor
+
+def _tipar_bloque(valores):
+    """
+    Serie tipada con los valores de una columna en un bloque de filas, o el
+    número de filas si están todas vacías. Como read_excel, una columna de
+    booleanos con vacíos queda como decimales.
+    """
+    if all(valor is None for valor in valores):
+        return len(valores)
+    serie = pd.Series(valores)
+    if serie.dtype == object and serie.hasnans and all(isinstance(v, bool) for v in serie.dropna()):
+        serie = serie.astype('float64')
+    return serie
+
+def _unir_bloques(piezas):
+    """
+    Une los bloques de una columna con un solo tipo: el común si todos lo
+    comparten, decimal si mezclan enteros y decimales (o hay enteros con
+    vacíos) y object en cualquier otro caso.
+    """
+    series = [pieza for pieza in piezas if not isinstance(pieza, int)]
+    if not piezas:
+        return pd.Series([], dtype=object)
+    tipos = {serie.dtype for serie in series}
+    if not series:
+        tipo = np.dtype('float64')
+    elif len(tipos) == 1:
+        tipo = tipos.pop()
+        if tipo.kind in 'biu' and len(series) < len(piezas):
+            tipo = np.dtype('float64')
+    elif all(t.kind in 'biuf' for t in tipos):
+        tipo = np.dtype('float64')
+    else:
+        tipo = np.dtype(object)
+    partes = []
+    for pieza in piezas:
+        if isinstance(pieza, int):
+            partes.append(pd.Series(np.nan, index=range(pieza), dtype=tipo))
+        elif tipo == object and pieza.dtype.kind == 'M':
+            # Como read_excel, las fechas de una columna mixta son datetime y sus vacíos NaN
+            partes.append(pd.Series(pieza.dt.to_pydatetime(), dtype=object).where(pieza.notna(), np.nan))
+        else:
+            partes.append(pieza.astype(tipo))
+    piezas.clear()
+    return pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0].reset_index(drop=True)
+
+def stream_sheet(ws, chunk_rows=None):
+    """
+    Lee una hoja de un libro abierto con openpyxl en modo read_only y devuelve el
+    mismo DataFrame que normalize_sheet(read_excel(...)). Las filas se recorren en
+    bloques de chunk_rows (por defecto CHUNK_ROWS): cada bloque se limpia, se tipa
+    por columna y se agrega al búfer de su columna, así que nunca se guardan todas
+    las filas como objetos de Python a la vez.
+    """
+    chunk_rows = chunk_rows or CHUNK_ROWS
+    # Como read_excel: no confiar en el <dimension> de la hoja, que otros programas dejan desactualizado
+    # (con A1, iter_rows no devolvería ninguna fila de datos)
+    ws.reset_dimensions()
+    filas = ws.iter_rows(values_only=True)
+    encabezado = next(filas, None)
+    if encabezado is None:
+        return pd.DataFrame()
+    encabezado = [_valor_celda(valor) if valor != '' else None for valor in encabezado]
+    while encabezado and encabezado[-1] is None:
+        encabezado.pop()
+    nombres = _nombres_columnas(encabezado)
+    traza = nombres.index('TRAZABILIDAD') if 'TRAZABILIDAD' in nombres else None
+
+    columnas = [[] for _ in encabezado]
+    total = 0
+    # Filas vacías pendientes: se conservan entre filas con datos y se descartan al final, como read_excel
+    vacias = 0
+    while True:
+        lote = list(islice(filas, chunk_rows))
+        if not lote:
+            break
+        bloque = []
+        for fila in lote:
+            ancho = len(fila)
+            while ancho and fila[ancho - 1] in (None, ''):
+                ancho -= 1
+            if not ancho:
+                vacias += 1
+                continue
+            bloque.extend([()] * vacias)
+            vacias = 0
+            bloque.append([_valor_celda(valor) for valor in fila[:ancho]])
+        if not bloque:
+            continue
+        # Datos más allá del encabezado: columnas nuevas, vacías en las filas anteriores
+        for _ in range(len(columnas), max(len(fila) for fila in bloque)):
+            columnas.append([total] if total else [])
+        for j, piezas in enumerate(columnas):
+            valores = [fila[j] if j < len(fila) else None for fila in bloque]
+            if j == traza:
+                valores = [limpiar_trazabilidad(v.replace('\\n', '\n')) if isinstance(v, str) else v
+                           for v in valores]
+            piezas.append(_tipar_bloque(valores))
+        total += len(bloque)
+        del lote, bloque
+
+    nombres = _nombres_columnas(encabezado + [None] * (len(columnas) - len(encabezado)))
+    df = pd.DataFrame({j: _unir_bloques(piezas) for j, piezas in enumerate(columnas)}, copy=False)
+    df.columns = nombres
+    return compact_columns(df)
+
+def _abrir_libro(file_path, mode):
+    if mode == 'streaming':
+        return openpyxl.load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+    return pd.ExcelFile(file_path)
+
+def _leer_hoja(libro, sheet, mode):
+    if mode == 'streaming':
+        return stream_sheet(libro[sheet])
+    return normalize_sheet(libro.parse(sheet))
+
+def parse_sheet(file_path, sheet, mode=None):
+    """
+    Lee y normaliza una hoja del libro. Es la tarea de cada proceso del pool de
+    ingesta: devuelve el DataFrame ya normalizado, que llega serializado al proceso principal.
+    """
+    mode = mode or INGEST_MODE
+    if (file_path, mode) not in _LIBRO_ABIERTO:
+        _LIBRO_ABIERTO[file_path, mode] = _abrir_libro(file_path, mode)
+    return _leer_hoja(_LIBRO_ABIERTO[file_path, mode], sheet, mode)
+
+def parse_workbook_sheets(file_path, reuse=None, workers=None, mode=None):
+    """
+    Lee las hojas del libro y genera (nombre de hoja, DataFrame normalizado) en el
+    orden del libro, a medida que cada una queda lista. Con varios workers (por
+    defecto INGEST_WORKERS) cada hoja se lee y normaliza en un proceso aparte;
+    si no, el archivo se abre una sola vez y se lee hoja por hoja. mode (por
+    defecto INGEST_MODE) elige entre read_excel y la lectura por bloques.
+    Las hojas incluidas en reuse no se vuelven a leer y se toman de ahí.
+    """
+    reuse = reuse or {}
+    workers = INGEST_WORKERS if workers is None else workers
+    workers = workers or os.cpu_count() or 1
+    mode = mode or INGEST_MODE
+    with zipfile.ZipFile(file_path) as zf:
+        nombres = list(_sheet_parts(zf))
+    pendientes = [sheet for sheet in nombres if sheet not in reuse]
+
+    if workers > 1 and len(pendientes) > 1:
+        # Los procesos nuevos reciben el sys.path actual y vuelven a importar el script principal
+        # (hsa.py con Streamlit), que importa este módulo. Streamlit pone la carpeta de la app al
+        # inicio de sys.path solo mientras corre el script y esta carga sigue en segundo plano,
+        # así que se agrega también al final, donde Streamlit no la retira
+        directorio = os.path.dirname(os.path.abspath(__file__))
+        if sys.path[-1] != directorio:
+            sys.path.append(directorio)
+        # spawn y no fork: el proceso principal tiene hilos (servidor, recarga) cuyos bloqueos no deben copiarse
+        pool = ProcessPoolExecutor(min(workers, len(pendientes)), mp_context=multiprocessing.get_context('spawn'))
+        try:
+            futuros = {sheet: pool.submit(parse_sheet, file_path, sheet, mode) for sheet in pendientes}
+            for sheet in nombres:
+                if sheet in reuse:
+                    LOAD_STATS['sheets_reused'] += 1
+                    yield sheet, reuse[sheet]
+                else:
+                    LOAD_STATS['sheets_parsed'] += 1
+                    yield sheet, futuros[sheet].result()
+        finally:
+            pool.shutdown(cancel_futures=True)
+        return
+
+    libro = _abrir_libro(file_path, mode)
+    try:
+        for sheet in nombres:
+            if sheet in reuse:
+                LOAD_STATS['sheets_reused'] += 1
+                yield sheet, reuse[sheet]
+            else:
+                LOAD_STATS['sheets_parsed'] += 1
+                yield sheet, _leer_hoja(libro, sheet, mode)
+    finally:
+        libro.close()
+
+_NS_RELS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_NS_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_PKG_RELS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+def _sheet_parts(zf):
+    """
+    Partes XML de cada hoja dentro del .xlsx, en el orden del libro.
+    """
+    rels = ET.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+    destinos = {rel.get('Id'): rel.get('Target') for rel in rels.iter(f'{_NS_PKG_RELS}Relationship')}
+    workbook = ET.fromstring(zf.read('xl/workbook.xml'))
+    partes = {}
+    for hoja in workbook.iter(f'{_NS_MAIN}sheet'):
+        destino = destinos.get(hoja.get(f'{_NS_RELS}id'), '')
+        partes[hoja.get('name')] = destino.lstrip('/') if destino.startswith('/') else f'xl/{destino}'
+    return partes
+
+def sheet_signatures(file_path):
+    """
+    Firma de cada hoja a partir de los CRC que el .xlsx (un zip) ya guarda:
+    la parte XML de la hoja más las partes compartidas (textos y estilos).
+    No descomprime las hojas, así que es muy barato. Si la firma de una hoja
+    no cambia entre dos versiones del libro, su contenido tampoco.
+    """
+    with zipfile.ZipFile(file_path) as zf:
+        crc = {info.filename: info.CRC for info in zf.infolist()}
+        partes = _sheet_parts(zf)
+    compartidas = f"{crc.get('xl/sharedStrings.xml', 0):08x}{crc.get('xl/styles.xml', 0):08x}"
+    return {hoja: f"{crc.get(parte, 0):08x}{compartidas}" for hoja, parte in partes.items()}
+
+def _texto_xml(elemento):
+    # Texto de una cadena compartida (<si>) o de una celda en línea: el <t> directo o
+    # los fragmentos con formato (<r><t>), sin la guía fonética
+    contenedor = elemento.find(f'{_NS_MAIN}is') if elemento.tag == f'{_NS_MAIN}c' else elemento
+    if contenedor is None:
+        return ''
+    textos = contenedor.findall(f'{_NS_MAIN}t') + contenedor.findall(f'{_NS_MAIN}r/{_NS_MAIN}t')
+    return ''.join(t.text or '' for t in textos)
+
+def _indice_columna(referencia):
+    # 'C1' -> 2
+    indice = 0
+    for letra in referencia.rstrip('0123456789'):
+        indice = indice * 26 + ord(letra) - ord('A') + 1
+    return indice - 1
+
+def _primera_fila(zf, parte):
+    """
+    Número (desde 1) de la primera fila con valores de una hoja y sus celdas
+    (tipo, valor) por número de columna. Deja de leer el XML al terminar esa fila.
+    """
+    celdas, numero = {}, 0
+    with zf.open(parte) as f:
+        for _, elemento in ET.iterparse(f):
+            if elemento.tag == f'{_NS_MAIN}c':
+                tipo = elemento.get('t', 'n')
+                if tipo == 'inlineStr':
+                    valor = _texto_xml(elemento)
+                else:
+                    v = elemento.find(f'{_NS_MAIN}v')
+                    valor = v.text if v is not None else None
+                if valor is not None:
+                    celdas[_indice_columna(elemento.get('r', 'A'))] = (tipo, valor)
+            elif elemento.tag == f'{_NS_MAIN}row':
+                # El atributo r es opcional: sin él, la fila sigue a la anterior
+                numero = int(elemento.get('r', numero + 1))
+                if celdas:
+                    break
+                elemento.clear()
+    return numero, celdas
+
+def _cadenas_compartidas(zf, hasta):
+    """
+    Las primeras `hasta` + 1 cadenas compartidas del libro (no lee el resto).
+    """
+    cadenas = []
+    if hasta < 0 or 'xl/sharedStrings.xml' not in zf.namelist():
+        return cadenas
+    with zf.open('xl/sharedStrings.xml') as f:
+        for _, elemento in ET.iterparse(f):
+            if elemento.tag == f'{_NS_MAIN}si':
+                cadenas.append(_texto_xml(elemento))
+                elemento.clear()
+                if len(cadenas) > hasta:
+                    break
+    return cadenas
+
+def read_sheet_headers(file_path):
+    """
+    Columnas de cada hoja, con los mismos nombres que tendrán tras normalize_sheet,
+    leyendo del .xlsx solo la primera fila de cada hoja y las cadenas compartidas
+    que esta usa. Su costo no depende del número de filas del libro.
+    """
+    with zipfile.ZipFile(file_path) as zf:
+        filas = {hoja: _primera_fila(zf, parte) for hoja, parte in _sheet_parts(zf).items()}
+        indices = [int(valor) for numero, celdas in filas.values() if numero == 1
+                   for tipo, valor in celdas.values() if tipo == 's']
+        cadenas = _cadenas_compartidas(zf, max(indices, default=-1))
+    headers = {}
+    for hoja, (numero, celdas) in filas.items():
+        if numero != 1:
+            # read_excel toma como encabezado la fila 1 aunque esté vacía: todas las columnas quedan sin nombre
+            headers[hoja] = _nombres_columnas([None] * (max(celdas, default=-1) + 1))
+            continue
+        valores = []
+        for i in range(max(celdas, default=-1) + 1):
+            tipo, valor = celdas.get(i, (None, None))
+            if tipo == 's':
+                valor = cadenas[int(valor)]
+            elif tipo == 'n':
+                numero = float(valor)
+                valor = int(numero) if numero.is_integer() else numero
+            elif tipo == 'b':
+                valor = valor == '1'
+            valores.append(valor)
+        headers[hoja] = _nombres_columnas(valores)
+    return headers
+
+def _nombres_columnas(encabezado):
+    """
+    Nombres de columna a partir de los valores de la fila de encabezado, como
+    read_excel seguido de normalize_sheet: "Unnamed: i" para las celdas vacías,
+    ".n" para los nombres repetidos y sin espacios sobrantes.
+    """
+    columnas, repetidas = [], Counter()
+    for i, nombre in enumerate(encabezado):
+        nombre = f'Unnamed: {i}' if nombre is None else nombre
+        repetidas[nombre] += 1
+        if repetidas[nombre] > 1:
+            nombre = f'{nombre}.{repetidas[nombre] - 1}'
+        columnas.append(nombre.strip() if isinstance(nombre, str) else nombre)
+    return columnas
+
+def json_value(valor):
+    """
+    Convierte un valor de celda en un valor serializable como JSON.
+    """
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if valor is None or (isinstance(valor, float) and np.isnan(valor)) or valor is pd.NaT:
+        return None
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return valor
+
+def frame_hash(df):
+    """
+    Hash del contenido de un DataFrame (columnas, tipos y valores).
+    """
+    sha = hashlib.sha256()
+    sha.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode('utf-8'))
+    sha.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return sha.hexdigest()
+
+def _workbook_cache_root(file_path):
+    # Una carpeta por libro (según su ruta absoluta) para no mezclar versiones de libros distintos
+    clave = hashlib.sha256(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(CACHE_DIR, clave)
+
+def _read_manifest(cache_path):
+    try:
+        with open(os.path.join(cache_path, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != CACHE_VERSION:
+        return None
+    return manifest
+
+def _write_cache(root, fingerprint, sheets):
+    """
+    Escribe una hoja por archivo en una carpeta temporal y la publica con un
+    renombrado atómico. Las versiones anteriores del mismo libro se eliminan.
+    """
+    os.makedirs(root, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix='.tmp-', dir=root)
+    try:
+        entries = []
+        for i, (sheet, df) in enumerate(sheets.items()):
+            file_name = f'sheet_{i:03d}.pkl'
+            df.to_pickle(os.path.join(tmp_path, file_name))
+            entries.append({'name': sheet, 'file': file_name})
+        manifest = {'version': CACHE_VERSION, 'fingerprint': fingerprint, 'sheets': entries}
+        with open(os.path.join(tmp_path, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        cache_path = os.path.join(root, fingerprint)
+        if os.path.isdir(cache_path):
+            # Otro proceso ya publicó esta misma versión
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        else:
+            os.replace(tmp_path, cache_path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    for nombre in os.listdir(root):
+        if nombre != fingerprint:
+            shutil.rmtree(os.path.join(root, nombre), ignore_errors=True)
+    return cache_path, manifest
+
+def read_workbook_sheets(file_path, fingerprint, reuse=None, stats=None):
+    """
+    Genera (hoja, DataFrame normalizado) de la versión `fingerprint` del libro, una
+    hoja a la vez, desde el caché en disco cuando esa versión ya fue procesada. Si
+    no, lee el libro (salvo las hojas de reuse) y al terminar guarda el caché.
+    Si se pasa stats (diccionario), se anota si hubo acierto del caché en disco.
+    """
+    root = _workbook_cache_root(file_path)
+    cache_path = os.path.join(root, fingerprint)
+    manifest = _read_manifest(cache_path)
+    if stats is not None:
+        stats['disk_cache'] = 'hit' if manifest is not None else 'miss'
+    if manifest is not None:
+        LOAD_STATS['disk_cache_hit'] += 1
+        for entry in manifest['sheets']:
+            yield entry['name'], pd.read_pickle(os.path.join(cache_path, entry['file']))
+        return
+
+    LOAD_STATS['disk_cache_miss'] += 1
+    sheets = {}
+    for sheet, df in parse_workbook_sheets(file_path, reuse):
+        sheets[sheet] = df
+        yield sheet, df
+    try:
+        _write_cache(root, fingerprint, sheets)
+    except OSError as e:
+        # Sin permisos de escritura: seguir funcionando sin caché en disco
+        log_event('disk_cache_error', logging.WARNING, path=root, error=str(e))
+
+def read_workbook_version(file_path, reuse=None, stats=None):
+    """
+    Devuelve (huella, hojas normalizadas) de la versión actual del libro,
+    desde el caché en disco cuando esa versión ya fue procesada.
+    """
+    fingerprint = workbook_fingerprint(file_path)
+    return fingerprint, dict(read_workbook_sheets(file_path, fingerprint, reuse, stats))
+
+def ingest_workbook(file_path):
+    """
+    Devuelve todas las hojas normalizadas del libro, desde el caché en disco
+    cuando la versión del archivo ya fue procesada.
+    """
+    return read_workbook_version(file_path)[1]
+
+# Formatos de fecha aceptados en las columnas de texto, en orden de prioridad (los de format_date)
+DATE_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%d/%m/%Y']
+
+def is_date_column(df, col):
+    return str(col).upper().startswith('FECHA') or pd.api.types.is_datetime64_any_dtype(df[col])
+
+def normalize_dates(serie):
+    """
+    Versión vectorizada de format_date para una columna completa.
+    Devuelve (fechas como datetime64, texto dd/mm/yyyy para mostrar). Los valores
+    que no son fechas (ej: 'NO APLICA') quedan como NaT y se muestran tal cual.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        fechas = serie.astype('datetime64[s]')
+    else:
+        fechas = pd.Series(pd.NaT, index=serie.index, dtype='datetime64[s]')
+        texto = serie.astype(str)
+        for fmt in DATE_FORMATS:
+            pendientes = fechas.isna() & serie.notna()
+            if not pendientes.any():
+                break
+            fechas[pendientes] = pd.to_datetime(texto[pendientes], format=fmt, errors='coerce')
+    # dd/mm/yyyy a partir del texto ISO, mucho más rápido que strftime
+    iso = pd.Series(np.datetime_as_string(fechas.to_numpy(), unit='D'), index=serie.index)
+    mostrar = (iso.str[8:10] + '/' + iso.str[5:7] + '/' + iso.str[:4]).astype(object).where(
+        fechas.notna(), serie.astype(object))
+    return fechas, mostrar
+
+def build_date_columns(df):
+    """
+    Normaliza todas las columnas de fecha de una hoja (las que empiezan por
+    FECHA o ya son datetime). Devuelve {'fechas': DataFrame datetime64,
+    'texto': DataFrame con el texto para mostrar}, con el mismo índice que df.
+    """
+    fechas, texto = {}, {}
+    for col in df.columns:
+        if is_date_column(df, col):
+            fechas[col], texto[col] = normalize_dates(df[col])
+    return {
+        'fechas': pd.DataFrame(fechas, index=df.index),
+        'texto': pd.DataFrame(texto, index=df.index),
+    }
+
+# Fechas de la línea de tiempo: actuaciones de TRAZABILIDAD, FECHA DE REPARTO y última actividad de cada fila
+TIMELINE_KINDS = ('eventos', 'reparto', 'ultima')
+
+def _ordenado(fechas, filas):
+    orden = np.argsort(fechas, kind='stable')
+    return fechas[orden], filas[orden]
+
+def build_timeline(events, fechas):
+    """
+    Línea de tiempo de una hoja: para cada tipo de fecha, las fechas válidas
+    ordenadas y la posición de su fila, para responder rangos con búsqueda binaria.
+    La última actividad de una fila es su actuación más reciente o, si no tiene
+    ninguna, su fecha de reparto.
+    """
+    validos = events['fecha'].notna().to_numpy()
+    evento_fechas = events['fecha'].to_numpy()[validos]
+    evento_filas = events['fila'].to_numpy()[validos]
+    if 'FECHA DE REPARTO' in fechas.columns:
+        reparto = fechas['FECHA DE REPARTO'].to_numpy()
+        reparto_filas = np.flatnonzero(~np.isnat(reparto))
+        reparto_fechas = reparto[reparto_filas]
+    else:
+        reparto_filas = np.empty(0, dtype=np.int64)
+        reparto_fechas = np.empty(0, dtype='datetime64[s]')
+    ultima = pd.Series(evento_fechas, dtype='datetime64[s]').groupby(evento_filas).max().combine_first(
+        pd.Series(reparto_fechas, index=reparto_filas, dtype='datetime64[s]'))
+    return {
+        'eventos': _ordenado(evento_fechas, evento_filas),
+        'reparto': _ordenado(reparto_fechas, reparto_filas),
+        'ultima': _ordenado(ultima.to_numpy(dtype='datetime64[s]'), ultima.index.to_numpy(dtype=np.int64)),
+    }
+
+# Tramos de antigüedad (desde FECHA DE REPARTO) y de última actuación, en días hasta hoy
+AGE_BUCKETS = [
+    (0, 30, 'Hasta 30 días'),
+    (31, 90, '31 a 90 días'),
+    (91, 180, '91 a 180 días'),
+    (181, 365, '181 días a 1 año'),
+    (366, 730, '1 a 2 años'),
+    (731, None, 'Más de 2 años'),
+]
+
+def _estado_normalizado(estados):
+    # 'PRE-ARCHIVO', 'Prearchivo ' y 'PREARCHIVO' cuentan igual
+    texto = estados.astype(str).where(estados.notna(), '').str.upper().str.replace(r'[\s\-]', '', regex=True)
+    return np.select([texto.str.contains('PREARCHIVO', regex=False), texto.str.contains('DESPACHO', regex=False)],
+                     ['Prearchivo', 'Despacho'], default='Otros')
+
+def build_sheet_summary(df, timeline):
+    """
+    Agregados de una hoja para el resumen: expedientes por estado, conteos por
+    TEMA y SOLICITANTE y, de su línea de tiempo, las fechas de reparto y de
+    última actuación ya ordenadas (los tramos dependen del día de la consulta).
+    """
+    def conteos(col):
+        if col not in df.columns:
+            return pd.Series(dtype='int64')
+        return df[col].astype(str).str.strip()[df[col].notna()].value_counts()
+    estados = (pd.Series(_estado_normalizado(df['ESTADO'])).value_counts()
+               if 'ESTADO' in df.columns else pd.Series(dtype='int64'))
+    # Última actuación: la fecha más reciente de los eventos de cada fila
+    fechas, filas = timeline['eventos']
+    ultima = pd.Series(fechas).groupby(filas).max().to_numpy(dtype='datetime64[s]') if len(fechas) else fechas
+    return {
+        'expedientes': len(df),
+        'estados': estados,
+        'temas': conteos('TEMA'),
+        'solicitantes': conteos('SOLICITANTE'),
+        'reparto': timeline['reparto'][0],
+        'ultima_actuacion': np.sort(ultima),
+    }
+
+def age_distribution(fechas, total, hoy):
+    """
+    Cuántas de las fechas ordenadas caen en cada tramo de AGE_BUCKETS contando
+    hasta hoy, con búsqueda binaria; las filas sin fecha van en 'Sin fecha'.
+    """
+    hoy = np.datetime64(hoy, 'D') + np.timedelta64(1, 'D')
+    conteos = {}
+    for minimo, maximo, nombre in AGE_BUCKETS:
+        # Fechas con antigüedad en días entre minimo y maximo: desde hoy - maximo hasta hoy - minimo
+        fin = np.searchsorted(fechas, hoy - np.timedelta64(minimo, 'D'), 'left')
+        inicio = 0 if maximo is None else np.searchsorted(fechas, hoy - np.timedelta64(maximo + 1, 'D'), 'left')
+        conteos[nombre] = int(fin - inicio)
+    conteos['Fecha futura'] = int(len(fechas) - np.searchsorted(fechas, hoy, 'left'))
+    conteos['Sin fecha'] = int(total - len(fechas))
+    return conteos
+
+# Longitud de los n-gramas del índice de búsqueda
+NGRAM_SIZE = 3
+# Separador de columnas en el texto concatenado de cada fila. Es un espacio en
+# blanco para str.split(), así que nunca forma parte de un término de búsqueda.
+_SEPARADOR_COLUMNAS = '\x1f'
+
+def search_columns(df):
+    """
+    Texto en minúsculas de cada columna tal como lo compara la búsqueda (las
+    celdas vacías como texto vacío) y, de las columnas categóricas, sus
+    categorías en minúsculas y los códigos de cada fila.
+    """
+    columnas, categorias = {}, {}
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            # Cada categoría se pasa a minúsculas una vez; el código -1 (vacío) toma el '' del final
+            tabla = np.append(df[col].cat.categories.astype(str).str.lower().to_numpy(dtype=object), '')
+            codigos = df[col].cat.codes.to_numpy()
+            categorias[col] = (tabla, codigos)
+            columnas[col] = pd.Series(tabla[codigos], index=df.index, dtype=str)
+        else:
+            # Misma representación que astype(str), con las celdas vacías como texto vacío
+            columnas[col] = df[col].astype(str).where(df[col].notna(), '').str.lower()
+    return columnas, categorias
+
+def build_search_index(df):
+    """
+    Construye el índice de búsqueda de una hoja: el texto en minúsculas de cada
+    columna, el texto concatenado de cada fila (modo 'TODOS') y un índice
+    invertido de dos niveles: cada trigrama apunta a las palabras del vocabulario
+    que lo contienen, y cada palabra a las posiciones de las filas donde aparece.
+    De las columnas categóricas se guardan sus categorías en minúsculas y los
+    códigos de cada fila, en lugar del texto de cada fila.
+    """
+    columnas, categorias = search_columns(df)
+
+    if columnas:
+        texto = None
+        for shadow in columnas.values():
+            texto = shadow if texto is None else texto + _SEPARADOR_COLUMNAS + shadow
+    else:
+        texto = pd.Series('', index=df.index)
+
+    # Pares (palabra, fila) sin repetir. Un término no tiene espacios, así que
+    # aparece en el texto de una fila si y solo si aparece dentro de alguna de sus palabras.
+    listas = texto.str.split()
+    longitudes = listas.str.len().to_numpy(dtype=np.int64)
+    filas = np.repeat(np.arange(len(texto), dtype=np.int64), longitudes)
+    codigos, vocabulario = pd.factorize(pd.Series([p for lista in listas for p in lista], dtype=object))
+    n = max(len(texto), 1)
+    pares = np.unique(codigos.astype(np.int64) * n + filas)
+    limites = np.searchsorted(pares // n, np.arange(len(vocabulario) + 1))
+
+    # Trigramas del vocabulario: se calculan una vez por palabra distinta, no por fila
+    ngramas = {}
+    for codigo, palabra in enumerate(vocabulario):
+        for gram in {palabra[i:i + NGRAM_SIZE] for i in range(len(palabra) - NGRAM_SIZE + 1)}:
+            ngramas.setdefault(gram, []).append(codigo)
+
+    # El texto por fila de las categóricas solo hacía falta para el texto concatenado
+    for col in categorias:
+        del columnas[col]
+    return {
+        'texto': texto,
+        'columnas': columnas,
+        'categorias': categorias,
+        'vocabulario': pd.Series(vocabulario, dtype=object),
+        'filas_por_palabra': pares % n,
+        'limites': limites,
+        'ngramas': {gram: np.asarray(codigos, dtype=np.int64) for gram, codigos in ngramas.items()},
+        'filas': len(df),
+    }
+
+def _palabras_con(index, term):
+    """
+    Códigos de las palabras del vocabulario que contienen el término.
+    """
+    vocabulario = index['vocabulario']
+    if len(term) < NGRAM_SIZE:
+        # Término demasiado corto para los trigramas: se recorre el vocabulario
+        return np.flatnonzero(vocabulario.str.contains(term, regex=False).to_numpy(dtype=bool))
+    listas = []
+    for gram in {term[i:i + NGRAM_SIZE] for i in range(len(term) - NGRAM_SIZE + 1)}:
+        codigos = index['ngramas'].get(gram)
+        if codigos is None:
+            return np.empty(0, dtype=np.int64)
+        listas.append(codigos)
+    # Intersectar empezando por las listas más cortas
+    listas.sort(key=len)
+    candidatos = listas[0]
+    for codigos in listas[1:]:
+        if len(candidatos) == 0:
+            break
+        candidatos = np.intersect1d(candidatos, codigos, assume_unique=True)
+    # Verificación: tener todos los trigramas no garantiza contener el término completo
+    palabras = vocabulario.to_numpy()
+    return candidatos[[term in palabras[codigo] for codigo in candidatos]]
+
+def _filas_con(index, term):
+    """
+    Posiciones (ordenadas y sin repetir) de las filas cuyo texto contiene el término.
+    """
+    palabras = _palabras_con(index, term)
+    if len(palabras) == 0:
+        return np.empty(0, dtype=np.int64)
+    limites, filas = index['limites'], index['filas_por_palabra']
+    return np.unique(np.concatenate([filas[limites[p]:limites[p + 1]] for p in palabras]))
+
+def _categorias_con(tabla, search_terms):
+    """
+    Máscara de las categorías (más el vacío final, siempre False) que contienen todos los términos.
+    """
+    coincide = np.ones(len(tabla), dtype=bool)
+    coincide[-1] = False
+    for term in search_terms:
+        coincide[:-1] &= [term in categoria for categoria in tabla[:-1]]
+    return coincide
+
+def search_positions(index, search_terms, campo_busqueda, candidatos=None):
+    """
+    Devuelve las posiciones de las filas que contienen todos los términos
+    en el campo indicado (o en cualquier columna si campo_busqueda es 'TODOS').
+    Si se dan candidatos (posiciones ordenadas), solo se revisan esas filas.
+    """
+    if campo_busqueda != 'TODOS' and campo_busqueda not in index['columnas'] \
+            and campo_busqueda not in index['categorias']:
+        # La hoja no tiene la columna (como en search_data, sin coincidencias)
+        return np.empty(0, dtype=np.int64)
+    if candidatos is not None:
+        if campo_busqueda in index['categorias']:
+            tabla, codigos = index['categorias'][campo_busqueda]
+            return candidatos[_categorias_con(tabla, search_terms)[codigos[candidatos]]]
+        objetivo = index['texto'] if campo_busqueda == 'TODOS' else index['columnas'][campo_busqueda]
+        for term in search_terms:
+            if len(candidatos) == 0:
+                break
+            candidatos = candidatos[objetivo.iloc[candidatos].str.contains(term, regex=False).to_numpy(dtype=bool)]
+        return candidatos
+
+    if campo_busqueda in index['categorias'] and search_terms:
+        # Columna categórica: los términos se buscan en las categorías y las filas se eligen por código
+        tabla, codigos = index['categorias'][campo_busqueda]
+        return np.flatnonzero(_categorias_con(tabla, search_terms)[codigos])
+
+    # Intersección de las filas de todos los términos: es exacta para 'TODOS'
+    for term in search_terms:
+        filas = _filas_con(index, term)
+        candidatos = filas if candidatos is None else np.intersect1d(candidatos, filas, assume_unique=True)
+        if len(candidatos) == 0:
+            return candidatos
+    if candidatos is None:
+        return np.arange(index['filas'])
+    if campo_busqueda == 'TODOS':
+        return candidatos
+
+    # En una sola columna, verificar los candidatos contra su texto
+    return search_positions(index, search_terms, campo_busqueda, candidatos)
+
+# Función para buscar en los datos
+def search_data(df, search_term, campo_busqueda, index=None):
+    """
+    Busca un término en la columna especificada del DataFrame.
+    Si campo_busqueda es 'TODOS', busca en todas las columnas.
+    Soporta búsqueda de términos múltiples separados por espacios.
+    Usa el índice precalculado de la hoja si se proporciona; nunca modifica df.
+    """
+    if not search_term:
+        return df
+    
+    if campo_busqueda != 'TODOS' and campo_busqueda not in df.columns:
+        # Si la columna no existe en esta hoja, devolver DataFrame vacío
+        return pd.DataFrame()
+    
+    if index is None:
+        index = build_search_index(df)
+    
+    # Dividir la búsqueda en términos separados por espacios
+    search_terms = search_term.lower().split()
+    return df.iloc[search_positions(index, search_terms, campo_busqueda)]
+
+# Consultas distintas guardadas en el caché de búsquedas y total de posiciones que pueden ocupar
+SEARCH_CACHE_SIZE = int(os.environ.get('HSA_SEARCH_CACHE_SIZE', '256'))
+SEARCH_CACHE_MAX_ROWS = int(os.environ.get('HSA_SEARCH_CACHE_MAX_ROWS', '5000000'))
+
+class SearchCache:
+    """
+    Caché LRU de resultados de búsqueda compartido por todas las sesiones. Cada
+    entrada es una consulta (términos normalizados, campo, versión de los datos)
+    con las posiciones de las filas encontradas en cada hoja.
+
+    Si no hay entrada para una consulta pero sí para otra más general (cada uno de
+    sus términos está contenido en alguno de los nuevos, ej. "juan" -> "juan pe"
+    o "juan" -> "juan perez"), solo se revisan las filas de esa otra consulta.
+    """
+
+    def __init__(self, maxsize=SEARCH_CACHE_SIZE, max_rows=SEARCH_CACHE_MAX_ROWS):
+        self.maxsize = maxsize
+        self.max_rows = max_rows
+        self._entradas = OrderedDict()
+        self._filas = 0
+        self._lock = threading.Lock()
+
+    def _base(self, terminos, campo_busqueda, version, sheet_name):
+        """
+        Posiciones de la consulta guardada más pequeña que contiene a la nueva, o None.
+        """
+        mejor = None
+        for (previos, campo, version_previa), hojas in self._entradas.items():
+            if (campo != campo_busqueda or version_previa != version or sheet_name not in hojas
+                    or not previos or previos == terminos):
+                continue
+            if all(any(previo in termino for termino in terminos) for previo in previos):
+                if mejor is None or len(hojas[sheet_name]) < len(mejor):
+                    mejor = hojas[sheet_name]
+        return mejor
+
+    def search_sheet(self, snapshot, sheet_name, search_term, campo_busqueda):
+        """
+        Posiciones de las filas de la hoja que coinciden con la búsqueda y el origen
+        del resultado: 'hit' (ya estaba), 'refined' (filtrando una consulta más
+        general) o 'miss' (con el índice de la hoja).
+        """
+        terminos = tuple(search_term.lower().split())
+        clave = (terminos, campo_busqueda, snapshot.version)
+        with self._lock:
+            hojas = self._entradas.get(clave)
+            if hojas is not None and sheet_name in hojas:
+                self._entradas.move_to_end(clave)
+                LOAD_STATS['search_cache_hits'] += 1
+                return hojas[sheet_name], 'hit'
+            base = self._base(terminos, campo_busqueda, snapshot.version, sheet_name)
+        origen = 'miss' if base is None else 'refined'
+        LOAD_STATS[f'search_cache_{origen}'] += 1
+        posiciones = search_positions(snapshot.index(sheet_name), list(terminos), campo_busqueda, base)
+        with self._lock:
+            hojas = self._entradas.setdefault(clave, {})
+            if sheet_name not in hojas:
+                hojas[sheet_name] = posiciones
+                self._filas += len(posiciones)
+            self._entradas.move_to_end(clave)
+            # Descartar las consultas usadas hace más tiempo, nunca la actual
+            while len(self._entradas) > 1 and (len(self._entradas) > self.maxsize or self._filas > self.max_rows):
+                _, descartadas = self._entradas.popitem(last=False)
+                self._filas -= sum(len(p) for p in descartadas.values())
+        return posiciones, origen
+
+    def clear(self):
+        with self._lock:
+            self._entradas.clear()
+            self._filas = 0
+
+SEARCH_CACHE = SearchCache()
+
+class LRUCache:
+    """
+    Diccionario acotado a maxsize claves que descarta las usadas hace más tiempo.
+    Se puede compartir entre hilos (sesiones de Streamlit).
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave, default=None):
+        with self._lock:
+            if clave not in self._entradas:
+                return default
+            self._entradas.move_to_end(clave)
+            return self._entradas[clave]
+
+    def put(self, clave, valor):
+        with self._lock:
+            self._entradas[clave] = valor
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.maxsize:
+                self._entradas.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def __len__(self):
+        return len(self._entradas)
+
+# Copy-on-Write garantiza que las vistas entregadas a cada sesión no puedan
+# modificar los DataFrames compartidos (en pandas >= 3 siempre está activo)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+class WorkbookSnapshot:
+    """
+    Una versión inmutable de los datos del libro: hojas normalizadas, índices
+    de búsqueda, eventos de trazabilidad y columnas de fecha ya normalizadas.
+    Cada acceso devuelve una vista sin copia.
+
+    Los nombres de hoja y sus columnas se leen al crearla, solo de la primera
+    fila. Con lazy=True las hojas completas se cargan e indexan en un hilo en
+    segundo plano y cada acceso a una hoja espera solo a que esa hoja esté lista.
+    """
+
+    def __init__(self, file_path, previous=None, lazy=False):
+        self.file_path = file_path
+        # Tiempos de construcción de esta versión, para el registro y el panel de diagnóstico
+        self.timer = StageTimer()
+        with self.timer.stage('sheet_signatures'):
+            self.signatures = sheet_signatures(file_path)
+            self.version = workbook_fingerprint(file_path)
+        with self.timer.stage('sheet_headers'):
+            self.columns = read_sheet_headers(file_path)
+        self.sheet_names = list(self.columns)
+        self.loaded_at = datetime.now()
+
+        self._sheets, self._indexes, self._events, self._dates, self.hashes = {}, {}, {}, {}, {}
+        self._event_arrays = {}
+        self._timelines = {}
+        self._summaries = {}
+        # Resumen de todas las hojas, calculado una vez por versión y día: (día, resumen)
+        self._summary = None
+        # Línea de tiempo de todas las hojas juntas, armada en la primera consulta por fechas
+        self._timeline = None
+        self._timeline_lock = threading.Lock()
+        # Memoria por hoja: filas, MB del DataFrame y de sus eventos de trazabilidad
+        self.memory = {}
+        # Memoria por hoja de cada columna: {hoja: {columna: (tipo, MB)}}
+        self.column_memory = {}
+        self.rebuilt = []
+        self.peak_rss_mb = None
+        self._ready = {sheet: threading.Event() for sheet in self.sheet_names}
+        self._loaded = threading.Event()
+        self.error = None
+        if lazy:
+            threading.Thread(target=self._load, args=(previous,), name='hsa-sheet-loader', daemon=True).start()
+        else:
+            self._load(previous)
+            if self.error is not None:
+                raise self.error
+
+    def _load(self, previous):
+        """
+        Carga, en el orden del libro, cada hoja con su índice, eventos y fechas,
+        y la marca como lista. Un error se guarda y se relanza al acceder a las hojas.
+        """
+        try:
+            # Hojas cuya parte del .xlsx no cambió desde la versión anterior: no se vuelven a leer
+            reuse = {}
+            if previous is not None:
+                reuse = {sheet: previous._sheets[sheet] for sheet, firma in self.signatures.items()
+                         if previous.signatures.get(sheet) == firma and sheet in previous._sheets}
+            estado = {}
+            hojas = read_workbook_sheets(self.file_path, self.version, reuse, estado)
+            while True:
+                with self.timer.stage('read_workbook') as etapa:
+                    siguiente = next(hojas, None)
+                    etapa.update(estado)
+                    if siguiente is not None:
+                        etapa['rows'] = len(siguiente[1])
+                if siguiente is None:
+                    break
+                sheet, df = siguiente
+                self._build_sheet(sheet, df, previous)
+                self._ready.setdefault(sheet, threading.Event()).set()
+            self.peak_rss_mb = peak_rss_mb()
+            self.timer.log('snapshot_build', version=self.version, sheets=len(self.sheet_names),
+                           reused=len(reuse), rebuilt=self.rebuilt, frames_mb=round(self.frames_mb(), 2),
+                           peak_rss_mb=self.peak_rss_mb)
+        except Exception as e:
+            self.error = e
+            log_event('snapshot_error', logging.ERROR, version=self.version, error=str(e))
+        finally:
+            # Despertar a quien espere una hoja que no llegó a cargarse
+            for listo in self._ready.values():
+                listo.set()
+            self._loaded.set()
+
+    def _build_sheet(self, sheet, df, previous):
+        with self.timer.stage('frame_hash', rows=len(df)):
+            self.hashes[sheet] = frame_hash(df)
+        if (previous is not None and sheet in previous._sheets
+                and previous.hashes.get(sheet) == self.hashes[sheet]):
+            # Mismo contenido: se reutilizan el DataFrame y sus índices (solo si la
+            # hoja terminó de construirse; una carga fallida puede dejarla a medias)
+            self._indexes[sheet] = previous._indexes[sheet]
+            self._events[sheet] = previous._events[sheet]
+            self._event_arrays[sheet] = previous._event_arrays[sheet]
+            self._dates[sheet] = previous._dates[sheet]
+            self._timelines[sheet] = previous._timelines[sheet]
+            self._summaries[sheet] = previous._summaries[sheet]
+            self.memory[sheet] = previous.memory[sheet]
+            self.column_memory[sheet] = previous.column_memory[sheet]
+            self._sheets[sheet] = previous._sheets[sheet]
+            return
+        with self.timer.stage('search_index', rows=len(df)):
+            self._indexes[sheet] = build_search_index(df)
+        with self.timer.stage('trazabilidad_events', rows=len(df)) as etapa:
+            self._events[sheet] = build_trazabilidad_events(df, sheet)
+            self._event_arrays[sheet] = events_arrays(self._events[sheet])
+            etapa['events'] = len(self._events[sheet])
+        with self.timer.stage('date_columns', rows=len(df)):
+            self._dates[sheet] = build_date_columns(df)
+        with self.timer.stage('timeline', rows=len(df)):
+            self._timelines[sheet] = build_timeline(self._events[sheet], self._dates[sheet]['fechas'])
+        with self.timer.stage('summary', rows=len(df)):
+            self._summaries[sheet] = build_sheet_summary(df, self._timelines[sheet])
+        self.memory[sheet] = {
+            'rows': len(df),
+            'frame_mb': frame_memory_mb(df),
+            'events': len(self._events[sheet]),
+            'events_mb': frame_memory_mb(self._events[sheet]),
+        }
+        self.column_memory[sheet] = {col: (str(df[col].dtype), mb) for col, mb in column_memory_mb(df).items()}
+        # La hoja se publica al final, cuando todos sus índices existen
+        self.columns[sheet] = list(df.columns)
+        self._sheets[sheet] = df
+        self.rebuilt.append(sheet)
+
+    def _wait(self, sheet_name):
+        """
+        Espera a que la hoja esté cargada (inmediato si ya lo está).
+        """
+        listo = self._ready.get(sheet_name)
+        if listo is not None:
+            listo.wait()
+        if sheet_name not in self._sheets and self.error is not None:
+            raise self.error
+
+    def is_ready(self, sheet_name):
+        return sheet_name in self._sheets
+
+    def ready_count(self):
+        return len(self._sheets)
+
+    def loaded(self):
+        """
+        True cuando terminó la carga de todas las hojas (con o sin error).
+        """
+        return self._loaded.is_set()
+
+    def wait_until_loaded(self, timeout=None):
+        return self._loaded.wait(timeout)
+
+    def sheet(self, sheet_name):
+        self._wait(sheet_name)
+        # Copia superficial: con Copy-on-Write cualquier modificación de la
+        # sesión crea su propia copia y el DataFrame compartido no cambia
+        return self._sheets[sheet_name].copy(deep=False)
+
+    def index(self, sheet_name):
+        self._wait(sheet_name)
+        return self._indexes[sheet_name]
+
+    def events(self, sheet_name):
+        self._wait(sheet_name)
+        return self._events[sheet_name].copy(deep=False)
+
+    def eventos(self, sheet_name, fila):
+        """
+        Eventos de trazabilidad ya ordenados de una fila de la hoja.
+        """
+        self._wait(sheet_name)
+        return eventos_de_fila(self._event_arrays[sheet_name], fila)
+
+    def dates(self, sheet_name):
+        self._wait(sheet_name)
+        return self._dates[sheet_name]
+
+    def frames_mb(self):
+        """
+        Memoria total de las hojas y sus eventos en esta versión, en MB.
+        """
+        return sum(uso['frame_mb'] + uso['events_mb'] for uso in list(self.memory.values()))
+
+    def timeline(self):
+        """
+        Línea de tiempo de todas las hojas: para cada tipo de TIMELINE_KINDS, las
+        fechas ordenadas con el número de hoja (según sheet_names) y la fila de cada una.
+        Espera a que carguen todas las hojas y se arma una sola vez por versión.
+        """
+        with self._timeline_lock:
+            if self._timeline is None:
+                for sheet in self.sheet_names:
+                    self._wait(sheet)
+                linea = {}
+                for tipo in TIMELINE_KINDS:
+                    partes = [self._timelines[sheet][tipo] for sheet in self.sheet_names]
+                    fechas = np.concatenate([f for f, _ in partes]).astype('datetime64[s]')
+                    hojas = np.repeat(np.arange(len(partes), dtype=np.int64), [len(f) for f, _ in partes])
+                    filas = np.concatenate([filas for _, filas in partes]).astype(np.int64)
+                    orden = np.argsort(fechas, kind='stable')
+                    linea[tipo] = (fechas[orden], hojas[orden], filas[orden])
+                self._timeline = linea
+            return self._timeline
+
+    def timeline_positions(self, desde=None, hasta=None, fuentes=('eventos', 'reparto'), inactivo_desde=None):
+        """
+        Posiciones por hoja de las filas con alguna fecha de fuentes entre desde y
+        hasta (días incluidos; sin límite si son None) y cuya última actividad es
+        anterior a inactivo_desde. Devuelve None si no se pide ningún filtro.
+        """
+        if desde is None and hasta is None and inactivo_desde is None:
+            return None
+        linea = self.timeline()
+        # Cada fila se identifica como hoja * 2^32 + fila, que ordena por hoja y luego por fila
+        seleccion = None
+        if desde is not None or hasta is not None:
+            claves = []
+            for fuente in fuentes:
+                fechas, hojas, filas = linea[fuente]
+                inicio = 0 if desde is None else np.searchsorted(fechas, np.datetime64(desde, 'D'), 'left')
+                fin = len(fechas) if hasta is None else np.searchsorted(
+                    fechas, np.datetime64(hasta, 'D') + np.timedelta64(1, 'D'), 'left')
+                claves.append((hojas[inicio:fin] << 32) | filas[inicio:fin])
+            seleccion = np.unique(np.concatenate(claves)) if claves else np.empty(0, dtype=np.int64)
+        if inactivo_desde is not None:
+            fechas, hojas, filas = linea['ultima']
+            fin = np.searchsorted(fechas, np.datetime64(inactivo_desde, 'D'), 'left')
+            claves = np.unique((hojas[:fin] << 32) | filas[:fin])
+            seleccion = claves if seleccion is None else np.intersect1d(seleccion, claves, assume_unique=True)
+        hojas, filas = seleccion >> 32, seleccion & 0xFFFFFFFF
+        limites = np.searchsorted(hojas, np.arange(len(self.sheet_names) + 1))
+        return {sheet: filas[limites[i]:limites[i + 1]] for i, sheet in enumerate(self.sheet_names)}
+
+    def summary(self, hoy=None):
+        """
+        Resumen de todas las hojas: expedientes por hoja y estado, por TEMA y por
+        SOLICITANTE, antigüedad desde el reparto y tiempo desde la última actuación.
+        Se arma con los agregados de cada hoja, calculados al construirla, y se
+        guarda hasta que cambie el día. Espera a que carguen todas las hojas.
+        """
+        hoy = hoy or datetime.now().date()
+        with self._timeline_lock:
+            if self._summary is not None and self._summary[0] == hoy:
+                return self._summary[1]
+        for sheet in self.sheet_names:
+            self._wait(sheet)
+        agregados = [self._summaries[sheet] for sheet in self.sheet_names]
+
+        hojas = pd.DataFrame([a['estados'] for a in agregados], index=self.sheet_names).reindex(
+            columns=['Despacho', 'Prearchivo', 'Otros']).fillna(0).astype('int64')
+        hojas.insert(0, 'Expedientes', [a['expedientes'] for a in agregados])
+
+        def sumar(clave, columna):
+            conteos = pd.concat([a[clave] for a in agregados])
+            if conteos.empty:
+                return pd.DataFrame(columns=[columna, 'Expedientes'])
+            conteos = conteos.groupby(level=0).sum().sort_values(ascending=False, kind='stable')
+            return conteos.rename_axis(columna).rename('Expedientes').reset_index()
+
+        def tramos(clave):
+            por_hoja = [age_distribution(a[clave], a['expedientes'], hoy) for a in agregados]
+            return pd.DataFrame(por_hoja, index=self.sheet_names).sum().rename_axis('Tramo').rename(
+                'Expedientes').reset_index()
+
+        resumen = {
+            'hojas': hojas,
+            'temas': sumar('temas', 'TEMA'),
+            'solicitantes': sumar('solicitantes', 'SOLICITANTE'),
+            'antiguedad': tramos('reparto'),
+            'actividad': tramos('ultima_actuacion').replace({'Tramo': {'Sin fecha': 'Sin actuaciones'}}),
+        }
+        with self._timeline_lock:
+            self._summary = (hoy, resumen)
+        return resumen
+
+    def column_memory_report(self):
+        """
+        Memoria de cada columna sumada en todas las hojas cargadas, de mayor a menor,
+        con sus tipos (una columna puede ser categórica en unas hojas y texto en otras).
+        """
+        filas = [(col, tipo, mb) for columnas in list(self.column_memory.values())
+                 for col, (tipo, mb) in columnas.items()]
+        if not filas:
+            return pd.DataFrame(columns=['columna', 'tipos', 'MB'])
+        por_columna = pd.DataFrame(filas, columns=['columna', 'tipo', 'MB']).groupby('columna', sort=False)
+        informe = pd.DataFrame({
+            'tipos': por_columna['tipo'].agg(lambda tipos: ', '.join(sorted(set(tipos)))),
+            'MB': por_columna['MB'].sum().round(3),
+        })
+        return informe.sort_values('MB', ascending=False).reset_index()
+
+    def date_column(self, df, columna, hoja=None):
+        """
+        Valores datetime64 de la columna de fecha para las filas de df (resultados
+        de varias hojas si hoja es None, según HOJA_ORIGEN), alineados con df.
+        """
+        valores = np.full(len(df), np.datetime64('NaT'), dtype='datetime64[s]')
+        hojas = np.full(len(df), hoja, dtype=object) if hoja is not None else df['HOJA_ORIGEN'].to_numpy(dtype=object)
+        filas = df.index.to_numpy()
+        for nombre in pd.unique(hojas):
+            fechas = self.dates(nombre)['fechas']
+            if columna in fechas.columns:
+                seleccion = hojas == nombre
+                valores[seleccion] = fechas[columna].to_numpy()[filas[seleccion]]
+        return valores
+
+    def date_text(self, df, columna, hoja=None):
+        """
+        Como date_column, pero con el texto ya formateado para mostrar (dd/mm/yyyy,
+        o el valor original si no es una fecha), siempre como str o None.
+        """
+        valores = np.full(len(df), None, dtype=object)
+        hojas = np.full(len(df), hoja, dtype=object) if hoja is not None else df['HOJA_ORIGEN'].to_numpy(dtype=object)
+        filas = df.index.to_numpy()
+        for nombre in pd.unique(hojas):
+            texto = self.dates(nombre)['texto']
+            if columna in texto.columns:
+                seleccion = hojas == nombre
+                valores[seleccion] = [None if pd.isna(valor) else str(valor)
+                                      for valor in texto[columna].to_numpy()[filas[seleccion]]]
+        return valores
+
+# Segundos entre revisiones del archivo en busca de una nueva versión (0 desactiva la recarga)
+RELOAD_INTERVAL = float(os.environ.get('HSA_RELOAD_INTERVAL', '30'))
+
+def _file_stat(file_path):
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+class WorkbookStore:
+    """
+    Datos del libro compartidos por todas las sesiones del proceso. Un hilo en
+    segundo plano revisa el archivo y, si cambia, construye una nueva versión
+    reconstruyendo solo las hojas modificadas. Mientras tanto las sesiones
+    siguen usando la versión anterior, que se reemplaza de forma atómica.
+    La primera versión se publica de inmediato, con solo los encabezados de
+    las hojas, y termina de cargarse en segundo plano.
+    """
+
+    def __init__(self, file_path, reload_interval=RELOAD_INTERVAL):
+        self.file_path = file_path
+        self.reload_interval = reload_interval
+        self._stat = _file_stat(file_path)
+        self._snapshot = WorkbookSnapshot(file_path, lazy=True)
+        # Permite saber si una sesión encontró el almacén ya creado (acierto del caché de Streamlit)
+        self.created_at = time.time()
+        LOAD_STATS['data_store_created'] += 1
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if reload_interval > 0:
+            threading.Thread(target=self._watch, name='hsa-workbook-watcher', daemon=True).start()
+
+    def snapshot(self):
+        """
+        Versión vigente de los datos. Una sesión debe usar la misma durante todo el rerun.
+        """
+        return self._snapshot
+
+    def check_for_changes(self):
+        """
+        Recarga el libro si cambió su tamaño o fecha de modificación.
+        Devuelve True si se publicó una nueva versión de los datos.
+        """
+        with self._lock:
+            stat = _file_stat(self.file_path)
+            if not self._snapshot.loaded():
+                # La versión vigente aún se está cargando: se revisa de nuevo luego
+                return False
+            if stat == self._stat and self._snapshot.error is None:
+                return False
+            previous = self._snapshot
+            snapshot = WorkbookSnapshot(self.file_path, previous)
+            self._stat = stat
+            if (previous.error is None
+                    and snapshot.version.rsplit('-', 1)[-1] == previous.version.rsplit('-', 1)[-1]):
+                # Solo cambió la fecha de modificación, no el contenido. Si la versión
+                # vigente falló al cargarse, la nueva la reemplaza aunque el contenido sea el mismo.
+                return False
+            self._snapshot = snapshot
+        LOAD_STATS['reloads'] += 1
+        log_event('workbook_reloaded', version=snapshot.version, rebuilt=snapshot.rebuilt)
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_interval):
+            try:
+                self.check_for_changes()
+            except Exception as e:
+                # Por ejemplo, el archivo se está guardando: se reintenta en la próxima revisión
+                log_event('reload_error', logging.WARNING, error=str(e))
+
+    def stop(self):
+        self._stop.set()
+
+# Libro que usan el dashboard y, por defecto, las consultas por lotes
+DEFAULT_WORKBOOK = 'HSA VISTA GENERAL H.M ALVARO ECHEVERRY.xlsx'
+
+# Un almacén por libro, compartido por todas las sesiones y consultas del proceso
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+# Función para cargar los datos
+def get_data_store(file_path):
+    with _STORES_LOCK:
+        if file_path not in _STORES:
+            _STORES[file_path] = WorkbookStore(file_path)
+        return _STORES[file_path]
+
+def clear_data_stores():
+    """
+    Detiene y descarta los almacenes abiertos; la próxima carga vuelve a construir los datos.
+    """
+    with _STORES_LOCK:
+        for store in _STORES.values():
+            store.stop()
+        _STORES.clear()
+
+def get_sheet_names(file_path):
+    return get_data_store(file_path).snapshot().sheet_names
+
+def load_sheet_data(file_path, sheet_name):
+    return get_data_store(file_path).snapshot().sheet(sheet_name)
+
+def search_snapshot(snapshot, search_term, campo_busqueda):
+    """
+    Busca en todas las hojas de una versión de los datos. Genera (hoja, resultados)
+    por cada hoja con coincidencias; el índice de los resultados es la fila en la hoja.
+    """
+    for sheet_name in snapshot.sheet_names:
+        df = snapshot.sheet(sheet_name)
+        if campo_busqueda == 'TODOS' or campo_busqueda in df.columns:
+            filtered = search_data(df, search_term, campo_busqueda, index=snapshot.index(sheet_name))
+            if not filtered.empty:
+                yield sheet_name, filtered
+
+# Filas que se leen de una hoja y se escriben de una vez al exportar resultados
+EXPORT_CHUNK_ROWS = int(os.environ.get('HSA_EXPORT_CHUNK_ROWS', '2000'))
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+def _valor_exportado(valor):
+    # Celdas vacías como None y escalares de numpy o pandas como tipos de Python
+    if valor is None or valor is pd.NaT or (isinstance(valor, float) and np.isnan(valor)):
+        return None
+    if isinstance(valor, pd.Timestamp):
+        return valor.to_pydatetime()
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return valor
+
+def export_rows(snapshot, coincidencias, chunk_rows=None):
+    """
+    Genera las filas a exportar de los resultados de una búsqueda, en bloques de
+    chunk_rows (por defecto EXPORT_CHUNK_ROWS). coincidencias es {hoja: posiciones}.
+    El primer bloque es el encabezado: HOJA_ORIGEN, las columnas de todas las hojas
+    con resultados y, por cada actuación de TRAZABILIDAD (la más reciente primero),
+    su fecha y su descripción. Solo se tiene en memoria un bloque a la vez.
+    """
+    chunk_rows = chunk_rows or EXPORT_CHUNK_ROWS
+    hojas = [sheet for sheet in snapshot.sheet_names if len(coincidencias.get(sheet, ()))]
+    columnas, eventos = [], 0
+    for sheet in hojas:
+        columnas.extend(col for col in snapshot.sheet(sheet).columns if col not in columnas)
+        # Número de actuaciones de cada fila exportada: ancho de las columnas de eventos
+        filas = snapshot.events(sheet)['fila'].to_numpy()
+        posiciones = np.asarray(coincidencias[sheet])
+        cuantos = np.searchsorted(filas, posiciones + 1) - np.searchsorted(filas, posiciones)
+        eventos = max(eventos, int(cuantos.max(initial=0)))
+    encabezado = ['HOJA_ORIGEN'] + columnas
+    for numero in range(1, eventos + 1):
+        encabezado += [f'ACTUACIÓN {numero} FECHA', f'ACTUACIÓN {numero}']
+    yield [encabezado]
+
+    for sheet in hojas:
+        df = snapshot.sheet(sheet)
+        events = snapshot.events(sheet)
+        filas, fechas = events['fila'].to_numpy(), events['fecha'].to_numpy()
+        textos, descripciones = events['fecha_texto'].to_numpy(), events['descripcion'].to_numpy()
+        posiciones = np.asarray(coincidencias[sheet])
+        for inicio in range(0, len(posiciones), chunk_rows):
+            bloque = posiciones[inicio:inicio + chunk_rows]
+            parte = df.iloc[bloque].reindex(columns=columnas)
+            desde, hasta = np.searchsorted(filas, bloque), np.searchsorted(filas, bloque + 1)
+            salida = []
+            for valores, a, b in zip(parte.itertuples(index=False, name=None), desde, hasta):
+                fila = [sheet] + [_valor_exportado(valor) for valor in valores]
+                for i in range(a, b):
+                    # Fecha como fecha si es válida; si no, el texto original
+                    fila += [textos[i] if np.isnat(fechas[i]) else pd.Timestamp(fechas[i]).date(), descripciones[i]]
+                fila += [None] * (len(encabezado) - len(fila))
+                salida.append(fila)
+            yield salida
+
+def _celda_xlsx(ws, valor):
+    # Texto tal cual: sin caracteres de control que Excel no admite y sin interpretar '=' como fórmula.
+    # El resto de los valores se pasa sin envolver, que es bastante más rápido
+    if isinstance(valor, str) and (valor.startswith('=') or ILLEGAL_CHARACTERS_RE.search(valor)):
+        celda = WriteOnlyCell(ws, ILLEGAL_CHARACTERS_RE.sub('', valor))
+        celda.data_type = 's'
+        return celda
+    return valor
+
+# Primeros caracteres con los que Excel (y otras hojas de cálculo) interpreta un texto del CSV como fórmula
+_INICIO_FORMULA_CSV = ('=', '+', '-', '@', '\t', '\r')
+
+def _celda_csv(valor):
+    # Texto que Excel tomaría como fórmula: se antepone un apóstrofo para que quede como texto
+    if isinstance(valor, str) and valor.startswith(_INICIO_FORMULA_CSV):
+        return "'" + valor
+    return valor
+
+def write_export(snapshot, coincidencias, destino, formato='csv', chunk_rows=None):
+    """
+    Escribe los resultados de una búsqueda en destino (archivo binario) como CSV
+    (UTF-8 con BOM, para que Excel reconozca las tildes) o XLSX (openpyxl en modo
+    write_only), bloque por bloque. En ningún formato un texto se interpreta como
+    fórmula al abrir el archivo. Devuelve el número de expedientes escritos.
+    """
+    if formato not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportación no soportado: {formato}")
+    inicio = time.perf_counter()
+    # El primer bloque es el encabezado
+    total = -1
+    if formato == 'csv':
+        texto = io.TextIOWrapper(destino, encoding='utf-8-sig', newline='')
+        escritor = csv.writer(texto)
+        for bloque in export_rows(snapshot, coincidencias, chunk_rows):
+            escritor.writerows([_celda_csv(valor) for valor in fila] for fila in bloque)
+            total += len(bloque)
+        texto.flush()
+        # El archivo sigue siendo de quien lo abrió
+        texto.detach()
+    else:
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet('Resultados')
+        for bloque in export_rows(snapshot, coincidencias, chunk_rows):
+            for fila in bloque:
+                ws.append([_celda_xlsx(ws, valor) for valor in fila])
+            total += len(bloque)
+        wb.save(destino)
+    log_event('export_done', format=formato, rows=total, seconds=round(time.perf_counter() - inicio, 3))
+    return total
@@ -0,0 +1,515 @@
+"""
+Almacenamiento opcional de uno o varios libros HSA en una base SQLite local
+(sqlite3 de la biblioteca estándar): los expedientes, los eventos de
+TRAZABILIDAD ya procesados y un índice de texto completo FTS5. La base se
+actualiza de forma incremental: solo se vuelven a leer las hojas cuya firma
+cambió. Las búsquedas equivalen a search_data (modo 'TODOS' y por columna)
+pero se resuelven con SQL indexado y se paginan con LIMIT/OFFSET, sin tener
+los libros en memoria. Varios procesos pueden compartir la misma base.
+
+Uso:
+    python hsa_store.py sync "HSA VISTA GENERAL H.M ALVARO ECHEVERRY.xlsx" otro_despacho_2024.xlsx
+    python hsa_store.py search "pepito perez" --campo SOLICITANTE --limit 50 --offset 100 --eventos
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from hsa_engine import (DEFAULT_WORKBOOK, LOAD_STATS, RELOAD_INTERVAL, build_trazabilidad_events, frame_hash,
+                        json_value, log_event, parse_workbook_sheets, search_columns, sheet_signatures,
+                        workbook_fingerprint)
+
+DEFAULT_DB = os.environ.get('HSA_STORE_DB') or 'hsa_store.sqlite3'
+# Libros que el dashboard mantiene sincronizados cuando usa la base (separados por os.pathsep)
+STORE_WORKBOOKS = [ruta for ruta in os.environ.get('HSA_STORE_WORKBOOKS', DEFAULT_WORKBOOK).split(os.pathsep) if ruta]
+# Conexiones de consulta que StoreSync mantiene abiertas para reutilizar entre reruns
+READER_POOL_SIZE = int(os.environ.get('HSA_STORE_READERS', '4'))
+# Milisegundos que un proceso espera a que otro termine de escribir antes de fallar
+BUSY_TIMEOUT_MS = int(os.environ.get('HSA_STORE_BUSY_TIMEOUT_MS', '30000'))
+
+# Identificadores compuestos, para borrar una hoja completa con un rango de ids:
+# expediente = hoja << 20 | fila (una hoja de Excel tiene como máximo 2^20 filas)
+# y cada texto del índice = expediente << 12 | campo
+_BITS_FILA = 20
+_BITS_CAMPO = 12
+# Columnas que search agrega a las de cada hoja
+_COLUMNAS_ORIGEN = ['LIBRO', 'HOJA_ORIGEN', 'FILA']
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS libros (
+    id INTEGER PRIMARY KEY,
+    ruta TEXT NOT NULL UNIQUE,
+    huella TEXT,
+    actualizado TEXT
+);
+CREATE TABLE IF NOT EXISTS hojas (
+    id INTEGER PRIMARY KEY,
+    libro_id INTEGER NOT NULL,
+    nombre TEXT NOT NULL,
+    posicion INTEGER NOT NULL,
+    firma TEXT,
+    hash TEXT,
+    UNIQUE (libro_id, nombre)
+);
+CREATE TABLE IF NOT EXISTS campos (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS hoja_campos (
+    hoja_id INTEGER NOT NULL,
+    campo_id INTEGER NOT NULL,
+    PRIMARY KEY (hoja_id, campo_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS expedientes (
+    id INTEGER PRIMARY KEY,
+    hoja_id INTEGER NOT NULL,
+    fila INTEGER NOT NULL,
+    datos TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS eventos (
+    expediente_id INTEGER NOT NULL,
+    orden INTEGER NOT NULL,
+    fecha TEXT,
+    fecha_texto TEXT,
+    fecha_corta TEXT,
+    descripcion TEXT,
+    PRIMARY KEY (expediente_id, orden)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS eventos_fecha ON eventos (fecha);
+CREATE VIRTUAL TABLE IF NOT EXISTS textos USING fts5(texto, tokenize='trigram');
+"""
+
+def connect(db_path=DEFAULT_DB, read_only=False):
+    """
+    Abre (y si hace falta crea) la base. En modo WAL los lectores no bloquean
+    al proceso que sincroniza, y las escrituras concurrentes esperan su turno.
+    Con read_only=True solo abre una conexión de consulta a una base ya creada,
+    sin preparar el modo WAL ni el esquema.
+    """
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                           check_same_thread=False)
+    if read_only:
+        conn.execute('PRAGMA query_only=ON')
+        return conn
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    try:
+        conn.executescript(_ESQUEMA)
+    except sqlite3.OperationalError as e:
+        conn.close()
+        # SQLite compilado sin FTS5 o sin el tokenizador trigram (versiones anteriores a 3.34)
+        raise RuntimeError(f"SQLite {sqlite3.sqlite_version} no admite FTS5 con trigramas: {e}") from e
+    return conn
+
+def _rango_hoja(hoja_id):
+    inicio = hoja_id << _BITS_FILA
+    return inicio, inicio + (1 << _BITS_FILA) - 1
+
+def _campo_ids(conn, columnas):
+    """
+    Ids de los nombres de columna, agregando los nuevos a campos. El id ocupa los
+    _BITS_CAMPO bits bajos del rowid de cada texto: uno mayor chocaría con otros textos.
+    """
+    conn.executemany('INSERT OR IGNORE INTO campos (nombre) VALUES (?)', [(str(col),) for col in columnas])
+    campos = {nombre: campo_id for campo_id, nombre in conn.execute('SELECT id, nombre FROM campos')}
+    fuera = sorted(str(col) for col in columnas if campos[str(col)] >= 1 << _BITS_CAMPO)
+    if fuera:
+        raise RuntimeError(
+            f"La base ya tiene el máximo de {(1 << _BITS_CAMPO) - 1} nombres de columna distintos y no "
+            f"admite {', '.join(fuera)}; use una base nueva (HSA_STORE_DB) con menos libros.")
+    return campos
+
+def _borrar_filas(conn, hoja_id):
+    """
+    Borra los expedientes, eventos y textos de una hoja (sin la hoja).
+    """
+    inicio, fin = _rango_hoja(hoja_id)
+    conn.execute('DELETE FROM expedientes WHERE id BETWEEN ? AND ?', (inicio, fin))
+    conn.execute('DELETE FROM eventos WHERE expediente_id BETWEEN ? AND ?', (inicio, fin))
+    conn.execute('DELETE FROM textos WHERE rowid BETWEEN ? AND ?',
+                 (inicio << _BITS_CAMPO, ((fin + 1) << _BITS_CAMPO) - 1))
+    conn.execute('DELETE FROM hoja_campos WHERE hoja_id = ?', (hoja_id,))
+
+def _escribir_hoja(conn, hoja_id, sheet, df):
+    """
+    Reemplaza el contenido de una hoja: expedientes (cada fila como JSON), sus
+    eventos y el texto en minúsculas de cada celda no vacía en el índice FTS5.
+    """
+    _borrar_filas(conn, hoja_id)
+    base = hoja_id << _BITS_FILA
+    campos = _campo_ids(conn, df.columns)
+    conn.executemany('INSERT INTO hoja_campos (hoja_id, campo_id) VALUES (?, ?)',
+                     [(hoja_id, campos[str(col)]) for col in df.columns])
+
+    columnas = [str(col) for col in df.columns]
+    conn.executemany('INSERT INTO expedientes (id, hoja_id, fila, datos) VALUES (?, ?, ?, ?)', (
+        (base + fila, hoja_id, fila,
+         json.dumps({col: json_value(valor) for col, valor in zip(columnas, valores)}, ensure_ascii=False))
+        for fila, valores in enumerate(df.itertuples(index=False, name=None))))
+
+    events = build_trazabilidad_events(df, sheet)
+    conn.executemany(
+        'INSERT INTO eventos (expediente_id, orden, fecha, fecha_texto, fecha_corta, descripcion) '
+        'VALUES (?, ?, ?, ?, ?, ?)', (
+            (base + int(fila), int(orden), None if pd.isna(fecha) else pd.Timestamp(fecha).date().isoformat(),
+             fecha_texto, fecha_corta, descripcion)
+            for fila, orden, fecha, fecha_texto, fecha_corta, descripcion in zip(
+                events['fila'], events['orden'], events['fecha'], events['fecha_texto'],
+                events['fecha_corta'], events['descripcion'])))
+
+    # Mismo texto que compara search_data; las celdas vacías no pueden contener ningún término
+    textos, _ = search_columns(df)
+    for col, texto in textos.items():
+        campo = campos[str(col)]
+        conn.executemany('INSERT INTO textos (rowid, texto) VALUES (?, ?)', (
+            (((base + fila) << _BITS_CAMPO) | campo, valor)
+            for fila, valor in enumerate(texto.to_numpy(dtype=object)) if valor))
+
+def sync_workbook(conn, file_path):
+    """
+    Lleva a la base la versión actual de un libro. Solo se leen las hojas cuya
+    firma cambió, y solo se reescriben si además cambió su contenido. Cada hoja
+    se escribe en su propia transacción, así que quien consulta ve cada hoja
+    antes o después del cambio, nunca a medias. Devuelve los conteos por acción.
+    """
+    ruta = os.path.abspath(file_path)
+    resultado = {'libro': ruta, 'escritas': 0, 'sin_cambios': 0, 'eliminadas': 0}
+    huella = workbook_fingerprint(file_path)
+    fila = conn.execute('SELECT id, huella FROM libros WHERE ruta = ?', (ruta,)).fetchone()
+    if fila is not None and fila[1] == huella:
+        return resultado
+    if fila is None:
+        # OR IGNORE: otro proceso puede estar incorporando el mismo libro
+        conn.execute('INSERT OR IGNORE INTO libros (ruta) VALUES (?)', (ruta,))
+        fila = conn.execute('SELECT id, huella FROM libros WHERE ruta = ?', (ruta,)).fetchone()
+    libro_id = fila[0]
+
+    guardadas = {nombre: (hoja_id, firma, contenido) for hoja_id, nombre, firma, contenido in conn.execute(
+        'SELECT id, nombre, firma, hash FROM hojas WHERE libro_id = ?', (libro_id,))}
+    firmas = sheet_signatures(file_path)
+    iguales = {sheet: None for sheet, firma in firmas.items() if sheet in guardadas and guardadas[sheet][1] == firma}
+
+    for posicion, (sheet, df) in enumerate(parse_workbook_sheets(file_path, reuse=iguales)):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT OR IGNORE INTO hojas (libro_id, nombre, posicion) VALUES (?, ?, ?)',
+                         (libro_id, sheet, posicion))
+            hoja_id = conn.execute('SELECT id FROM hojas WHERE libro_id = ? AND nombre = ?',
+                                   (libro_id, sheet)).fetchone()[0]
+            conn.execute('UPDATE hojas SET posicion = ?, firma = ? WHERE id = ?', (posicion, firmas[sheet], hoja_id))
+            contenido = None if df is None else frame_hash(df)
+            if df is None or (sheet in guardadas and guardadas[sheet][2] == contenido):
+                resultado['sin_cambios'] += 1
+            else:
+                _escribir_hoja(conn, hoja_id, sheet, df)
+                conn.execute('UPDATE hojas SET hash = ? WHERE id = ?', (contenido, hoja_id))
+                resultado['escritas'] += 1
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for sheet, (hoja_id, _, _) in guardadas.items():
+            if sheet not in firmas:
+                _borrar_filas(conn, hoja_id)
+                conn.execute('DELETE FROM hojas WHERE id = ?', (hoja_id,))
+                resultado['eliminadas'] += 1
+        conn.execute("UPDATE libros SET huella = ?, actualizado = datetime('now') WHERE id = ?", (huella, libro_id))
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    return resultado
+
+def remove_workbook(conn, file_path):
+    """
+    Quita de la base un libro y todos sus expedientes.
+    """
+    ruta = os.path.abspath(file_path)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for (hoja_id,) in conn.execute(
+                'SELECT h.id FROM hojas h JOIN libros l ON l.id = h.libro_id WHERE l.ruta = ?', (ruta,)).fetchall():
+            _borrar_filas(conn, hoja_id)
+            conn.execute('DELETE FROM hojas WHERE id = ?', (hoja_id,))
+        conn.execute('DELETE FROM libros WHERE ruta = ?', (ruta,))
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+def _consulta_termino(term, campo_id):
+    """
+    SQL y parámetros de los expedientes cuyo texto contiene el término. Con tres
+    caracteres o más, el índice de trigramas da los candidatos; instr verifica
+    la coincidencia exacta sobre el mismo texto en minúsculas que usa search_data.
+    """
+    if len(term) >= 3:
+        sql = 'SELECT DISTINCT rowid >> ? FROM textos WHERE textos MATCH ? AND instr(texto, ?) > 0'
+        parametros = [_BITS_CAMPO, '"' + term.replace('"', '""') + '"', term]
+    else:
+        # Más corto que un trigrama: se recorre el texto
+        sql = 'SELECT DISTINCT rowid >> ? FROM textos WHERE instr(texto, ?) > 0'
+        parametros = [_BITS_CAMPO, term]
+    if campo_id is not None:
+        sql += ' AND (rowid & ?) = ?'
+        parametros += [(1 << _BITS_CAMPO) - 1, campo_id]
+    return sql, parametros
+
+def search(conn, search_term, campo_busqueda='TODOS', limit=100, offset=0, libros=None, hoja=None):
+    """
+    Busca como search_data en todos los libros de la base (o solo en los de
+    libros, y si se indica, solo en la hoja con ese nombre): todos los términos,
+    separados por espacios, deben aparecer en alguna columna ('TODOS') o en la
+    columna indicada. Devuelve (total de coincidencias, DataFrame con la
+    página pedida), en el orden de los libros, de sus hojas y de sus filas.
+    El DataFrame tiene LIBRO, HOJA_ORIGEN y FILA además de las columnas de cada
+    hoja; su índice es el id del expediente. Las fechas vuelven como texto ISO.
+    """
+    search_terms = (search_term or '').lower().split()
+    campo_id = None
+    if campo_busqueda != 'TODOS':
+        fila = conn.execute('SELECT id FROM campos WHERE nombre = ?', (campo_busqueda,)).fetchone()
+        if fila is None:
+            return 0, pd.DataFrame(columns=_COLUMNAS_ORIGEN, index=pd.Index([], name='id'))
+        campo_id = fila[0]
+
+    if search_terms:
+        partes = [_consulta_termino(term, campo_id) for term in search_terms]
+        coincidencias = ' INTERSECT '.join(sql for sql, _ in partes)
+        parametros = [p for _, params in partes for p in params]
+    elif campo_id is not None:
+        # Sin términos: todas las filas de las hojas que tienen la columna
+        coincidencias = 'SELECT id FROM expedientes WHERE hoja_id IN (SELECT hoja_id FROM hoja_campos WHERE campo_id = ?)'
+        parametros = [campo_id]
+    else:
+        coincidencias = 'SELECT id FROM expedientes'
+        parametros = []
+
+    desde = ('FROM coincidencias c JOIN expedientes e ON e.id = c.id JOIN hojas h ON h.id = e.hoja_id '
+             'JOIN libros l ON l.id = h.libro_id')
+    condiciones = []
+    if libros:
+        rutas = [os.path.abspath(libro) for libro in libros]
+        condiciones.append(f"l.ruta IN ({', '.join('?' * len(rutas))})")
+        parametros += rutas
+    if hoja is not None:
+        condiciones.append('h.nombre = ?')
+        parametros.append(hoja)
+    if condiciones:
+        desde += ' WHERE ' + ' AND '.join(condiciones)
+    con = f'WITH coincidencias(id) AS ({coincidencias}) '
+
+    total = conn.execute(con + 'SELECT count(*) ' + desde, parametros).fetchone()[0]
+    filas = conn.execute(
+        con + 'SELECT e.id, l.ruta, h.nombre, e.fila, e.datos ' + desde +
+        ' ORDER BY l.ruta, h.posicion, e.fila LIMIT ? OFFSET ?', parametros + [limit, offset]).fetchall()
+    registros = [{'LIBRO': ruta, 'HOJA_ORIGEN': hoja, 'FILA': fila, **json.loads(datos)}
+                 for _, ruta, hoja, fila, datos in filas]
+    return total, pd.DataFrame(registros or None, columns=None if registros else _COLUMNAS_ORIGEN,
+                               index=pd.Index([f[0] for f in filas], name='id'))
+
+def list_sheets(conn):
+    """
+    Libros y hojas de la base, en orden, con su número de expedientes.
+    """
+    return pd.DataFrame(conn.execute(
+        'SELECT l.ruta, h.nombre, (SELECT count(*) FROM expedientes e WHERE e.hoja_id = h.id) '
+        'FROM hojas h JOIN libros l ON l.id = h.libro_id ORDER BY l.ruta, h.posicion').fetchall(),
+        columns=['libro', 'hoja', 'expedientes'])
+
+def list_fields(conn):
+    """
+    Columnas de al menos una hoja de la base, en orden alfabético.
+    """
+    return [nombre for (nombre,) in conn.execute(
+        'SELECT nombre FROM campos WHERE id IN (SELECT campo_id FROM hoja_campos) ORDER BY nombre')]
+
+def expediente_eventos(conn, expediente_ids):
+    """
+    Eventos de TRAZABILIDAD de cada expediente, ya ordenados y con la misma
+    estructura que eventos_de_fila. Devuelve {id del expediente: eventos}.
+    """
+    resultado = {int(expediente_id): [] for expediente_id in expediente_ids}
+    if not resultado:
+        return resultado
+    marcadores = ', '.join('?' * len(resultado))
+    for expediente_id, fecha, fecha_texto, fecha_corta, descripcion in conn.execute(
+            'SELECT expediente_id, fecha, fecha_texto, fecha_corta, descripcion FROM eventos '
+            f'WHERE expediente_id IN ({marcadores}) ORDER BY expediente_id, orden', list(resultado)):
+        evento = {'fecha': fecha_texto, 'fecha_corta': fecha_corta, 'descripcion': descripcion}
+        if fecha is not None:
+            evento['fecha_obj'] = pd.Timestamp(fecha)
+        resultado[expediente_id].append(evento)
+    return resultado
+
+class StoreSync:
+    """
+    Base compartida por todas las sesiones del proceso cuando el dashboard usa
+    SQLite en vez de la memoria. Como WorkbookStore, un hilo en segundo plano
+    revisa cada libro cada reload_interval segundos y, si cambió su tamaño o
+    fecha de modificación, lo sincroniza (solo las hojas modificadas). La
+    primera sincronización también corre en segundo plano; mientras tanto se
+    consulta lo que ya tenga la base. La sincronización usa su propia conexión
+    y las consultas toman una de un pool de conexiones de solo lectura.
+    """
+
+    def __init__(self, db_path, workbooks, reload_interval=RELOAD_INTERVAL):
+        self.db_path = db_path
+        self.workbooks = list(workbooks)
+        self.reload_interval = reload_interval
+        self.synced_at = None
+        self.error = None
+        # Permite saber si una sesión encontró la base ya abierta (acierto del caché de Streamlit)
+        self.created_at = time.time()
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        # Crea el esquema una sola vez, antes de que lleguen las consultas
+        self._conn = connect(db_path)
+        self._libres = queue.LifoQueue(maxsize=READER_POOL_SIZE)
+        threading.Thread(target=self._watch, name='hsa-store-sync', daemon=True).start()
+
+    @contextmanager
+    def connection(self):
+        """
+        Conexión de solo lectura para las consultas de un rerun. Streamlit ejecuta
+        cada rerun en un hilo nuevo, así que las conexiones se devuelven a un pool
+        al terminar en lugar de abrir una por hilo (sqlite3 no admite que dos
+        hilos usen la misma conexión a la vez).
+        """
+        try:
+            conn = self._libres.get_nowait()
+        except queue.Empty:
+            conn = connect(self.db_path, read_only=True)
+        try:
+            yield conn
+        finally:
+            try:
+                self._libres.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def ready(self):
+        """
+        True cuando terminó la primera sincronización de todos los libros.
+        """
+        return self._ready.is_set()
+
+    def wait_until_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def check_for_changes(self):
+        """
+        Sincroniza los libros que cambiaron desde la última revisión. Devuelve
+        los resultados de sync_workbook de los libros sincronizados.
+        """
+        resultados = []
+        with self._lock:
+            for file_path in self.workbooks:
+                stat = os.stat(file_path)
+                stat = (stat.st_size, stat.st_mtime_ns)
+                if self._stats.get(file_path) == stat:
+                    continue
+                resultado = sync_workbook(self._conn, file_path)
+                self._stats[file_path] = stat
+                resultados.append(resultado)
+                if resultado['escritas'] or resultado['eliminadas']:
+                    LOAD_STATS['store_syncs'] += 1
+                    log_event('store_synced', **resultado)
+            self.synced_at = time.time()
+            self.error = None
+        return resultados
+
+    def _watch(self):
+        while True:
+            try:
+                self.check_for_changes()
+            except Exception as e:
+                # Por ejemplo, un libro se está guardando: se reintenta en la próxima revisión
+                self.error = str(e)
+                log_event('store_sync_error', logging.WARNING, error=str(e))
+            self._ready.set()
+            if self.reload_interval <= 0 or self._stop.wait(self.reload_interval):
+                break
+
+    def stop(self):
+        self._stop.set()
+
+# Una base por ruta, compartida por todas las sesiones del proceso
+_SYNCS = {}
+_SYNCS_LOCK = threading.Lock()
+
+def get_store_sync(db_path=DEFAULT_DB, workbooks=None):
+    with _SYNCS_LOCK:
+        if db_path not in _SYNCS:
+            _SYNCS[db_path] = StoreSync(db_path, STORE_WORKBOOKS if workbooks is None else workbooks)
+        return _SYNCS[db_path]
+
+def main():
+    parser = argparse.ArgumentParser(description="Base SQLite con índice de texto completo de los libros HSA.")
+    parser.add_argument('--db', default=DEFAULT_DB, help="Ruta de la base SQLite (ver HSA_STORE_DB)")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    sync = comandos.add_parser('sync', help="Incorpora o actualiza libros en la base")
+    sync.add_argument('workbooks', nargs='+', help="Rutas de los libros .xlsx")
+    sync.add_argument('--remove', action='store_true', help="Quitar los libros de la base en vez de actualizarlos")
+    buscar = comandos.add_parser('search', help="Busca expedientes y escribe una línea JSON por cada uno")
+    buscar.add_argument('term', help="Términos separados por espacios ('' para todos los expedientes)")
+    buscar.add_argument('--campo', default='TODOS', help="Columna donde buscar (por defecto, TODOS)")
+    buscar.add_argument('--limit', type=int, default=100)
+    buscar.add_argument('--offset', type=int, default=0)
+    buscar.add_argument('--workbook', nargs='+', help="Buscar solo en estos libros")
+    buscar.add_argument('--eventos', action='store_true', help="Incluir los eventos de TRAZABILIDAD ya procesados")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    conn = connect(args.db)
+    try:
+        if args.comando == 'sync':
+            for file_path in args.workbooks:
+                if args.remove:
+                    remove_workbook(conn, file_path)
+                    log_event('store_removed', workbook=os.path.abspath(file_path))
+                else:
+                    inicio = time.perf_counter()
+                    resultado = sync_workbook(conn, file_path)
+                    log_event('store_synced', seconds=round(time.perf_counter() - inicio, 3), **resultado)
+            return
+        total, resultados = search(conn, args.term, args.campo, args.limit, args.offset, args.workbook)
+        eventos = expediente_eventos(conn, resultados.index) if args.eventos else {}
+        columnas = [col for col in resultados.columns if col not in _COLUMNAS_ORIGEN]
+        for expediente_id, registro in zip(resultados.index, resultados.to_dict('records')):
+            linea = {
+                'libro': registro['LIBRO'],
+                'hoja': registro['HOJA_ORIGEN'],
+                'fila': registro['FILA'],
+                'expediente': {col: json_value(registro[col]) for col in columnas if col in registro},
+            }
+            if args.eventos:
+                linea['trazabilidad'] = [
+                    {'fecha': evento['fecha_obj'].date().isoformat() if 'fecha_obj' in evento else None,
+                     'fecha_texto': evento['fecha'],
+                     'descripcion': evento['descripcion']}
+                    for evento in eventos[int(expediente_id)]
+                ]
+            sys.stdout.write(json.dumps(linea, ensure_ascii=False) + '\n')
+        log_event('store_search', logging.INFO, matches=total, returned=len(resultados),
+                  seconds=round(time.perf_counter() - inicio, 3))
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Libros compartidos por las pruebas: el libro real del repositorio y uno
+sintético con el mismo esquema, ambos procesados una sola vez por sesión.
+"""
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, 'benchmarks'))
+
+import hsa_engine
+from synthetic_workbook import generate_workbook
+
+@pytest.fixture(scope='session')
+def libros(tmp_path_factory):
+    """
+    Rutas del libro real y de un libro sintético de 3 hojas.
+    """
+    sintetico = str(tmp_path_factory.mktemp('libros') / 'sintetico.xlsx')
+    generate_workbook(sintetico, rows=900, sheets=3, seed=7)
+    return [os.path.join(RAIZ, hsa_engine.DEFAULT_WORKBOOK), sintetico]
+
+@pytest.fixture(scope='session')
+def snapshots(libros, tmp_path_factory):
+    """
+    Una versión de los datos (WorkbookSnapshot) por libro, ya cargada.
+    """
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(hsa_engine, 'CACHE_DIR', str(tmp_path_factory.mktemp('cache')))
+        return [hsa_engine.WorkbookSnapshot(libro) for libro in libros]
+
+@pytest.fixture(scope='session')
+def hojas(snapshots):
+    """
+    Hojas normalizadas de los dos libros, {(libro, hoja): DataFrame}.
+    """
+    return {(snapshot.file_path, hoja): snapshot.sheet(hoja) for snapshot in snapshots for hoja in snapshot.sheet_names}
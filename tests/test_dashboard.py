@@ -0,0 +1,46 @@
+"""
+Dashboard con el libro del repositorio: la tabla compacta muestra la fecha de
+reparto ya formateada, como texto que st.dataframe convierte a Arrow sin error.
+"""
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import hsa_engine
+from conftest import RAIZ
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(RAIZ)
+    monkeypatch.setattr(hsa_engine, 'CACHE_DIR', str(tmp_path / 'cache'))
+    yield AppTest.from_file(os.path.join(RAIZ, 'hsa.py'), default_timeout=120)
+    hsa_engine.clear_data_stores()
+
+def test_tabla_compacta(app):
+    app.run()
+    app.text_input[0].set_value('a').run()
+    app.radio(key='busqueda_vista').set_value("Tabla compacta").run()
+    app.selectbox(key='busqueda_page_size').set_value(100).run()
+    assert not app.exception
+    tabla = next(df.value for df in app.dataframe if 'EXPEDIENTE' in df.value.columns)
+
+    snapshot = hsa_engine.get_data_store(hsa_engine.DEFAULT_WORKBOOK).snapshot()
+    esperado = []
+    for hoja in pd.unique(tabla['HOJA_ORIGEN']):
+        texto = snapshot.dates(hoja)['texto']['FECHA DE REPARTO']
+        resultados = hsa_engine.search_data(snapshot.sheet(hoja), 'a', 'TODOS', snapshot.index(hoja))
+        esperado += [None if pd.isna(valor) else str(valor) for valor in texto.iloc[resultados.index]]
+    # Incluye hojas en las que la columna original mezcla fechas y textos
+    assert len(pd.unique(tabla['HOJA_ORIGEN'])) == len(snapshot.sheet_names)
+    assert [None if pd.isna(valor) else valor for valor in tabla['FECHA DE REPARTO']] == esperado
+
+def test_date_text(snapshots):
+    for snapshot in snapshots:
+        for hoja in snapshot.sheet_names:
+            df = snapshot.sheet(hoja)
+            textos = snapshot.date_text(df, 'FECHA DE REPARTO', hoja)
+            assert all(texto is None or isinstance(texto, str) for texto in textos)
+            pa.Table.from_pandas(pd.DataFrame({'FECHA DE REPARTO': textos}))
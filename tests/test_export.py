@@ -0,0 +1,73 @@
+"""
+Descarga de resultados: el archivo llega a Streamlit en un tipo que acepta y
+ningún texto se abre como fórmula.
+"""
+import csv
+import io
+import os
+import sys
+
+import numpy as np
+import openpyxl
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hsa
+import hsa_engine
+
+FILAS = [
+    ['EXPEDIENTE', 'SOLICITANTE', 'TRAZABILIDAD'],
+    ['CNE-1', '=HYPERLINK("http://x","y")', '20/03/2025 AUTO DE PRUEBAS\n12/02/2025 RECIBIDO'],
+    ['CNE-2', '+57 300', None],
+    ['CNE-3', 'PEPITO PEREZ', '01/01/2024 REPARTO'],
+]
+
+@pytest.fixture
+def snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(hsa_engine, 'CACHE_DIR', str(tmp_path / 'cache'))
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'HOJA'
+    for fila in FILAS:
+        ws.append(fila)
+    # Guardado como texto, no como fórmula, igual que lo escribiría un usuario con apóstrofo
+    ws['B2'].data_type = 's'
+    ruta = tmp_path / 'libro.xlsx'
+    wb.save(ruta)
+    return hsa_engine.WorkbookSnapshot(str(ruta))
+
+def descargar(snapshot, monkeypatch, formato):
+    # Lo que hace Streamlit al hacer clic: ejecutar el callable del botón y convertir su resultado
+    botones = []
+    monkeypatch.setattr(hsa.st, 'selectbox', lambda etiqueta, opciones, **kwargs: formato)
+    monkeypatch.setattr(hsa.st, 'download_button', lambda etiqueta, data, **kwargs: botones.append(data))
+    hsa.mostrar_descarga(snapshot, {'HOJA': np.arange(3)})
+    datos, _ = convert_data_to_bytes_and_infer_mime(botones[0](), unsupported_error=RuntimeError('tipo no soportado'))
+    return datos
+
+def test_descarga_csv(snapshot, monkeypatch):
+    datos = descargar(snapshot, monkeypatch, "CSV")
+    filas = list(csv.reader(io.StringIO(datos.decode('utf-8-sig'))))
+    assert filas[0][:4] == ['HOJA_ORIGEN', 'EXPEDIENTE', 'SOLICITANTE', 'TRAZABILIDAD']
+    assert filas[0][4:] == ['ACTUACIÓN 1 FECHA', 'ACTUACIÓN 1', 'ACTUACIÓN 2 FECHA', 'ACTUACIÓN 2']
+    assert [fila[1] for fila in filas[1:]] == ['CNE-1', 'CNE-2', 'CNE-3']
+    assert filas[1][2] == '\'=HYPERLINK("http://x","y")'
+    assert filas[2][2] == "'+57 300"
+    assert filas[1][4:] == ['2025-03-20', 'AUTO DE PRUEBAS', '2025-02-12', 'RECIBIDO']
+
+def test_descarga_xlsx(snapshot, monkeypatch):
+    datos = descargar(snapshot, monkeypatch, "Excel (.xlsx)")
+    ws = openpyxl.load_workbook(io.BytesIO(datos)).active
+    filas = list(ws.iter_rows(values_only=True))
+    assert len(filas) == 4
+    assert ws['C2'].data_type == 's'
+    assert ws['C2'].value == '=HYPERLINK("http://x","y")'
+    assert filas[3][1:3] == ('CNE-3', 'PEPITO PEREZ')
+
+def test_descarga_no_deja_temporales(snapshot, monkeypatch, tmp_path):
+    monkeypatch.setattr(hsa.tempfile, 'tempdir', str(tmp_path / 'tmp'))
+    os.makedirs(tmp_path / 'tmp')
+    descargar(snapshot, monkeypatch, "CSV")
+    assert os.listdir(tmp_path / 'tmp') == []
@@ -0,0 +1,104 @@
+"""
+El índice de búsqueda (trigramas → palabras → filas, y categorías) devuelve
+exactamente las mismas filas que la búsqueda original de search_data, que
+convertía cada columna a texto y la recorría con str.contains.
+"""
+import random
+
+import pandas as pd
+import pytest
+
+import hsa_engine
+
+def textos_originales(df):
+    """
+    Cada columna convertida a texto en minúsculas, como lo hacía search_data
+    antes del índice. Las celdas vacías no coinciden con ningún término (como
+    astype(str) en pandas 3).
+    """
+    return {col: df[col].astype(str).where(df[col].notna(), '').str.lower() for col in df.columns}
+
+def buscar_original(textos, search_term, campo_busqueda):
+    """
+    Posiciones que devolvía search_data antes del índice.
+    """
+    columnas = list(textos) if campo_busqueda == 'TODOS' else [campo_busqueda]
+    mask = None
+    for term in search_term.lower().split():
+        term_mask = False
+        for col in columnas:
+            term_mask |= textos[col].str.contains(term, regex=False, na=False).to_numpy()
+        mask = term_mask if mask is None else mask & term_mask
+    if mask is None:
+        return list(range(len(next(iter(textos.values())))))
+    return mask.nonzero()[0].tolist()
+
+def terminos(df, rng, cantidad, largo):
+    """
+    Términos tomados de las celdas de la hoja: trozos de palabras de `largo`
+    caracteres (mínimo, máximo), a veces con un segundo término, en mayúsculas
+    o con un término que no aparece.
+    """
+    textos = [str(valor) for valor in df.to_numpy().ravel() if not pd.isna(valor)]
+    palabras = sorted({palabra for texto in textos for palabra in texto.split()})
+    resultado = []
+    for _ in range(cantidad):
+        palabra = rng.choice(palabras)
+        n = rng.randint(min(largo[0], len(palabra)), min(largo[1], len(palabra)))
+        inicio = rng.randint(0, len(palabra) - n)
+        term = palabra[inicio:inicio + n]
+        azar = rng.random()
+        if azar < 0.25:
+            otra = rng.choice(palabras)
+            term += ' ' + otra[:rng.randint(1, len(otra))]
+        elif azar < 0.3:
+            term += ' zqxj'
+        resultado.append(term.upper() if rng.random() < 0.5 else term.lower())
+    return resultado
+
+def comparar(hojas, elegir_campos, largo, cantidad=40):
+    rng = random.Random(11)
+    casos = 0
+    for (libro, hoja), df in hojas.items():
+        index = hsa_engine.build_search_index(df)
+        textos = textos_originales(df)
+        campos = elegir_campos(df)
+        for term in terminos(df, rng, cantidad, largo):
+            for campo in campos:
+                obtenido = hsa_engine.search_data(df, term, campo, index=index)
+                assert obtenido.index.tolist() == buscar_original(textos, term, campo), (hoja, term, campo)
+                casos += 1
+    return casos
+
+def categoricas(df):
+    return [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)]
+
+def test_todos(hojas):
+    assert comparar(hojas, lambda df: ['TODOS'], (3, 12))
+
+def test_una_columna(hojas):
+    texto = lambda df: [col for col in df.columns if col not in categoricas(df)]
+    assert comparar(hojas, texto, (3, 12), cantidad=10)
+
+def test_columna_categorica(hojas):
+    assert any(categoricas(df) for df in hojas.values())
+    assert comparar(hojas, categoricas, (2, 10), cantidad=15)
+
+def test_terminos_cortos(hojas):
+    # Más cortos que un trigrama: se buscan recorriendo el vocabulario
+    assert comparar(hojas, lambda df: ['TODOS', *df.columns[:4]], (1, 2), cantidad=20)
+
+@pytest.mark.parametrize('search_term', ['', '   ', 'zqxj', 'a zqxj'])
+def test_sin_terminos_o_sin_coincidencias(hojas, search_term):
+    for df in hojas.values():
+        textos = textos_originales(df)
+        for campo in ['TODOS', df.columns[0]]:
+            obtenido = hsa_engine.search_data(df, search_term, campo)
+            esperado = df.index.tolist() if not search_term else buscar_original(textos, search_term, campo)
+            assert obtenido.index.tolist() == esperado
+
+def test_columna_inexistente(hojas):
+    df = next(iter(hojas.values()))
+    assert hsa_engine.search_data(df, 'a', 'NO EXISTE').empty
+    index = hsa_engine.build_search_index(df)
+    assert len(hsa_engine.search_positions(index, ['a'], 'NO EXISTE')) == 0
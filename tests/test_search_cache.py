@@ -0,0 +1,75 @@
+"""
+Caché de búsquedas: los resultados refinados a partir de una consulta más
+general son los mismos que los de una búsqueda nueva, y el descarte LRU
+nunca saca la consulta que se acaba de hacer.
+"""
+import random
+
+import pandas as pd
+
+import hsa_engine
+
+def escritura(texto):
+    """
+    Lo que se busca mientras se escribe el texto, letra por letra.
+    """
+    return [texto[:n] for n in range(1, len(texto) + 1) if texto[:n].strip()]
+
+def consultas(snapshot, rng, cantidad):
+    """
+    Textos de dos palabras tomados de las celdas del libro.
+    """
+    palabras = sorted({palabra for hoja in snapshot.sheet_names
+                       for valor in snapshot.sheet(hoja).to_numpy().ravel() if not pd.isna(valor)
+                       for palabra in str(valor).split()})
+    return [f'{rng.choice(palabras)} {rng.choice(palabras)[:4]}' for _ in range(cantidad)]
+
+def test_refinado_igual_a_nuevo(snapshots):
+    rng = random.Random(5)
+    origenes = []
+    for snapshot in snapshots:
+        cache = hsa_engine.SearchCache()
+        primera = snapshot.sheet(snapshot.sheet_names[0])
+        categorica = next(col for col in primera.columns if isinstance(primera[col].dtype, pd.CategoricalDtype))
+        for campo in ['TODOS', 'EXPEDIENTE', 'TRAZABILIDAD', categorica]:
+            for texto in consultas(snapshot, rng, 6):
+                for search_term in escritura(texto.lower()):
+                    for hoja in snapshot.sheet_names:
+                        posiciones, origen = cache.search_sheet(snapshot, hoja, search_term, campo)
+                        nuevas = hsa_engine.search_positions(snapshot.index(hoja), search_term.split(), campo)
+                        assert posiciones.tolist() == nuevas.tolist(), (hoja, search_term, campo, origen)
+                        origenes.append(origen)
+    assert {'miss', 'refined', 'hit'} <= set(origenes)
+
+def test_descarte_lru(snapshots):
+    snapshot = snapshots[1]
+    hoja = snapshot.sheet_names[0]
+    cache = hsa_engine.SearchCache(maxsize=3)
+    for search_term in ['pe', 'ma', 'go']:
+        assert cache.search_sheet(snapshot, hoja, search_term, 'TODOS')[1] == 'miss'
+    # 'pe' vuelve a usarse, así que la usada hace más tiempo es 'ma'
+    assert cache.search_sheet(snapshot, hoja, 'pe', 'TODOS')[1] == 'hit'
+    assert cache.search_sheet(snapshot, hoja, 'lo', 'TODOS')[1] == 'miss'
+    assert cache.search_sheet(snapshot, hoja, 'go', 'TODOS')[1] == 'hit'
+    assert cache.search_sheet(snapshot, hoja, 'pe', 'TODOS')[1] == 'hit'
+    assert cache.search_sheet(snapshot, hoja, 'ma', 'TODOS')[1] == 'miss'
+
+def test_descarte_por_filas_conserva_la_actual(snapshots):
+    snapshot = snapshots[1]
+    hoja = snapshot.sheet_names[0]
+    filas = snapshot.memory[hoja]['rows']
+    # Cabe a lo sumo una de estas consultas, que devuelven más de la mitad de las filas
+    cache = hsa_engine.SearchCache(max_rows=filas)
+    for search_term in ['a', 'e', 'o']:
+        posiciones, origen = cache.search_sheet(snapshot, hoja, search_term, 'TODOS')
+        assert origen == 'miss'
+        assert len(posiciones) > filas // 2
+        assert cache.search_sheet(snapshot, hoja, search_term, 'TODOS')[1] == 'hit'
+    assert cache.search_sheet(snapshot, hoja, 'a', 'TODOS')[1] == 'miss'
+
+    # Una consulta que sola supera max_rows se guarda igual mientras sea la actual
+    cache = hsa_engine.SearchCache(max_rows=1)
+    posiciones, _ = cache.search_sheet(snapshot, hoja, 'a', 'TODOS')
+    assert cache.search_sheet(snapshot, hoja, 'a', 'TODOS') == (posiciones, 'hit')
+    assert cache.search_sheet(snapshot, hoja, 'a b', 'TODOS')[1] == 'refined'
+    assert cache.search_sheet(snapshot, hoja, 'a', 'TODOS')[1] == 'miss'
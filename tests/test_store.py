@@ -0,0 +1,104 @@
+"""
+Base SQLite del dashboard: páginas con LIMIT/OFFSET, filtro por hoja y
+sincronización en segundo plano.
+"""
+import os
+import sqlite3
+import sys
+import threading
+
+import openpyxl
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hsa_engine
+import hsa_store
+
+@pytest.fixture
+def libro(tmp_path, monkeypatch):
+    monkeypatch.setattr(hsa_engine, 'CACHE_DIR', str(tmp_path / 'cache'))
+    wb = openpyxl.Workbook()
+    for posicion, nombre in enumerate(['PRIMERA', 'SEGUNDA']):
+        ws = wb.active if posicion == 0 else wb.create_sheet()
+        ws.title = nombre
+        ws.append(['EXPEDIENTE', 'SOLICITANTE'])
+        for i in range(15):
+            ws.append([f'{nombre[0]}-{i}', 'PEPITO PEREZ' if i % 2 else 'ANA GOMEZ'])
+    ruta = tmp_path / 'libro.xlsx'
+    wb.save(ruta)
+    return str(ruta)
+
+@pytest.fixture
+def sync(libro, tmp_path):
+    sync = hsa_store.StoreSync(str(tmp_path / 'base.sqlite3'), [libro], reload_interval=0)
+    assert sync.wait_until_ready(60)
+    assert sync.error is None
+    return sync
+
+@pytest.fixture
+def conn(sync):
+    with sync.connection() as conn:
+        yield conn
+
+def test_paginas(conn):
+    total, todas = hsa_store.search(conn, 'perez', limit=100)
+    assert total == len(todas) == 14
+    paginas = [hsa_store.search(conn, 'perez', limit=5, offset=offset)[1] for offset in range(0, total, 5)]
+    assert [len(pagina) for pagina in paginas] == [5, 5, 4]
+    assert sum((pagina['EXPEDIENTE'].tolist() for pagina in paginas), []) == todas['EXPEDIENTE'].tolist()
+
+def test_filtro_hoja(conn, libro):
+    total, page = hsa_store.search(conn, 'perez', 'SOLICITANTE', libros=[libro], hoja='SEGUNDA')
+    assert total == 7
+    assert set(page['HOJA_ORIGEN']) == {'SEGUNDA'}
+    assert hsa_store.search(conn, 'perez', 'NO EXISTE')[0] == 0
+    assert hsa_store.list_sheets(conn)[['hoja', 'expedientes']].values.tolist() == [['PRIMERA', 15], ['SEGUNDA', 15]]
+    assert hsa_store.list_fields(conn) == ['EXPEDIENTE', 'SOLICITANTE']
+
+def test_sincroniza_cambios(sync, conn, libro):
+    wb = openpyxl.load_workbook(libro)
+    wb['SEGUNDA'].append(['S-15', 'PEPITO PEREZ'])
+    wb.save(libro)
+    # Otro tamaño de archivo: la siguiente revisión sincroniza solo la hoja modificada
+    resultado, = sync.check_for_changes()
+    assert (resultado['escritas'], resultado['sin_cambios']) == (1, 1)
+    assert hsa_store.search(conn, 'perez')[0] == 15
+    assert sync.check_for_changes() == []
+
+def test_maximo_de_campos(sync, tmp_path):
+    conn = hsa_store.connect(sync.db_path)
+    # Columnas 'Unnamed: i' acumuladas de otros libros hasta el último id que cabe en el rowid
+    libres = (1 << hsa_store._BITS_CAMPO) - 1 - conn.execute('SELECT max(id) FROM campos').fetchone()[0]
+    conn.executemany('INSERT INTO campos (nombre) VALUES (?)', [(f'Unnamed: {i}',) for i in range(libres)])
+    wb = openpyxl.Workbook()
+    wb.active.append(['EXPEDIENTE', 'COLUMNA NUEVA'])
+    wb.active.append(['OTRO-1', 'PEPITO PEREZ'])
+    otro = str(tmp_path / 'otro.xlsx')
+    wb.save(otro)
+    with pytest.raises(RuntimeError, match='COLUMNA NUEVA'):
+        hsa_store.sync_workbook(conn, otro)
+    # Nada quedó a medias: las búsquedas siguen viendo solo el primer libro
+    assert hsa_store.search(conn, 'perez')[0] == 14
+    assert 'COLUMNA NUEVA' not in hsa_store.list_fields(conn)
+    conn.close()
+
+def test_pool_de_conexiones(sync):
+    abiertas = []
+
+    def consultar():
+        with sync.connection() as conn:
+            abiertas.append(conn)
+            assert hsa_store.search(conn, 'perez', limit=1)[0] == 14
+
+    # Un hilo por rerun, como Streamlit: todos reutilizan la misma conexión
+    for _ in range(3):
+        hilo = threading.Thread(target=consultar)
+        hilo.start()
+        hilo.join()
+    assert len({id(conn) for conn in abiertas}) == 1
+    # Dos consultas a la vez usan conexiones distintas, que son de solo lectura
+    with sync.connection() as primera, sync.connection() as segunda:
+        assert primera is not segunda
+        with pytest.raises(sqlite3.OperationalError):
+            segunda.execute('DELETE FROM expedientes')
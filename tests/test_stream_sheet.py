@@ -0,0 +1,91 @@
+"""
+Ingesta por streaming: stream_sheet devuelve el mismo DataFrame que
+normalize_sheet(read_excel(...)), también con un <dimension> desactualizado.
+"""
+import re
+import zipfile
+from datetime import datetime
+
+import openpyxl
+import pandas as pd
+import pytest
+
+import hsa_engine
+
+ENCABEZADO = ['EXPEDIENTE', 'ENTERO', 'DECIMAL', 'FECHA DE REPARTO', 'MIXTA', 'BOOLEANO', 'VACÍA', 'TRAZABILIDAD',
+              'ENTERO', None, 'NOTAS']
+
+def filas():
+    for i in range(23):
+        if i in (7, 8):
+            # Filas vacías entre filas con datos
+            yield []
+            continue
+        yield [
+            f'CNE-{i}',
+            i * 10,
+            # Decimales enteros (que read_excel deja como int) y no enteros en la misma columna
+            float(i) if i % 3 else i + 0.25,
+            datetime(2024, 1 + i % 12, 1 + i) if i % 5 else None,
+            [i, f'texto {i}', datetime(2023, 5, 6), 1.5, 'NA'][i % 5],
+            [True, None, False][i % 3],
+            None,
+            f'{i % 28 + 1:02d}/03/2025AUTO {i}\\n12/02/25 RECIBIDO' if i % 4 else None,
+            i if i < 12 else None,
+            'sin nombre' if i == 3 else None,
+            'PRIMERA' if i % 2 else 'SEGUNDA',
+            # Datos más allá del encabezado
+            'extra' if i == 20 else None,
+        ]
+    # Filas vacías al final, que read_excel descarta
+    yield []
+    yield [None, None, '']
+
+@pytest.fixture
+def libro(tmp_path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'HOJA'
+    ws.append(ENCABEZADO)
+    for fila in filas():
+        ws.append(fila)
+    completo = wb.create_sheet('SIN TRAZABILIDAD')
+    for fila in [['A', 'B'], [1, 'x'], [2.5, None], [None, 'y']]:
+        completo.append(fila)
+    wb.create_sheet('SOLO ENCABEZADO').append(['EXPEDIENTE', 'ESTADO'])
+    original = tmp_path / 'original.xlsx'
+    wb.save(original)
+
+    # Mismo libro con <dimension ref="A1">, como lo dejan algunos programas al exportar
+    ruta = tmp_path / 'dimension.xlsx'
+    with zipfile.ZipFile(original) as entrada, zipfile.ZipFile(ruta, 'w', zipfile.ZIP_DEFLATED) as salida:
+        for parte in entrada.infolist():
+            datos = entrada.read(parte)
+            if parte.filename.startswith('xl/worksheets/sheet'):
+                datos, cambios = re.subn(rb'<dimension ref="[^"]*"', b'<dimension ref="A1"', datos)
+                assert cambios == 1
+            salida.writestr(parte, datos)
+    return str(ruta)
+
+@pytest.mark.parametrize('chunk_rows', [1, 4, 5000])
+def test_igual_a_read_excel(libro, chunk_rows):
+    esperado = {hoja: hsa_engine.normalize_sheet(df) for hoja, df in pd.read_excel(libro, sheet_name=None).items()}
+    wb = openpyxl.load_workbook(libro, read_only=True, data_only=True, keep_links=False)
+    try:
+        assert wb['HOJA'].max_row == 1
+        for hoja, df in esperado.items():
+            obtenido = hsa_engine.stream_sheet(wb[hoja], chunk_rows)
+            pd.testing.assert_frame_equal(obtenido, df, check_exact=True)
+    finally:
+        wb.close()
+    assert esperado['HOJA'].shape == (23, 12)
+    assert esperado['HOJA']['FECHA DE REPARTO'].dtype.kind == 'M'
+    assert isinstance(esperado['HOJA']['NOTAS'].dtype, pd.CategoricalDtype)
+
+def test_modos_de_ingesta(libro, tmp_path, monkeypatch):
+    monkeypatch.setattr(hsa_engine, 'CACHE_DIR', str(tmp_path / 'cache'))
+    pandas = dict(hsa_engine.parse_workbook_sheets(libro, workers=1, mode='pandas'))
+    streaming = dict(hsa_engine.parse_workbook_sheets(libro, workers=1, mode='streaming'))
+    assert list(pandas) == list(streaming)
+    for hoja in pandas:
+        pd.testing.assert_frame_equal(streaming[hoja], pandas[hoja], check_exact=True)
@@ -0,0 +1,89 @@
+"""
+Filtros por fecha: timeline_positions devuelve las mismas filas que revisar
+una por una las actuaciones de TRAZABILIDAD (con process_trazabilidad) y la
+FECHA DE REPARTO de cada fila.
+"""
+import random
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+import hsa_engine
+
+def fechas_por_fila(snapshot):
+    """
+    [(hoja, fila, fechas de las actuaciones, fecha de reparto o None)] de todas las filas.
+    """
+    filas = []
+    for hoja in snapshot.sheet_names:
+        df = snapshot.sheet(hoja)
+        reparto = snapshot.dates(hoja)['fechas'].get('FECHA DE REPARTO')
+        for fila in range(len(df)):
+            trazabilidad = df['TRAZABILIDAD'].iloc[fila] if 'TRAZABILIDAD' in df.columns else None
+            eventos = [evento['fecha_obj'].date() for evento in hsa_engine.process_trazabilidad(trazabilidad)
+                       if 'fecha_obj' in evento]
+            fecha = None if reparto is None or pd.isna(reparto.iloc[fila]) else reparto.iloc[fila].date()
+            filas.append((hoja, fila, eventos, fecha))
+    return filas
+
+def filtrar(filas, sheet_names, desde, hasta, fuentes, inactivo_desde):
+    resultado = {hoja: [] for hoja in sheet_names}
+    for hoja, fila, eventos, reparto in filas:
+        if desde is not None or hasta is not None:
+            fechas = (eventos if 'eventos' in fuentes else []) + ([reparto] if 'reparto' in fuentes and reparto else [])
+            if not any((desde is None or desde <= fecha) and (hasta is None or fecha <= hasta) for fecha in fechas):
+                continue
+        if inactivo_desde is not None:
+            ultima = max(eventos) if eventos else reparto
+            if ultima is None or ultima >= inactivo_desde:
+                continue
+        resultado[hoja].append(fila)
+    return resultado
+
+@pytest.fixture(scope='module')
+def casos(snapshots):
+    return [(snapshot, fechas_por_fila(snapshot)) for snapshot in snapshots]
+
+FUENTES = [('eventos', 'reparto'), ('eventos',), ('reparto',)]
+
+def comparar(snapshot, filas, **filtros):
+    obtenido = snapshot.timeline_positions(**filtros)
+    esperado = filtrar(filas, snapshot.sheet_names, filtros.get('desde'), filtros.get('hasta'),
+                       filtros.get('fuentes', FUENTES[0]), filtros.get('inactivo_desde'))
+    assert {hoja: posiciones.tolist() for hoja, posiciones in obtenido.items()} == esperado, filtros
+    return sum(map(len, esperado.values()))
+
+def test_rangos(casos):
+    rng = random.Random(3)
+    for snapshot, filas in casos:
+        fechas = sorted({fecha for _, _, eventos, reparto in filas for fecha in eventos + [reparto] if fecha})
+        encontradas = 0
+        for _ in range(30):
+            desde, hasta = sorted([rng.choice(fechas), rng.choice(fechas)])
+            for fuentes in FUENTES:
+                encontradas += comparar(snapshot, filas, desde=desde, hasta=hasta, fuentes=fuentes)
+                # Un solo día, y rangos abiertos por un lado
+                encontradas += comparar(snapshot, filas, desde=desde, hasta=desde, fuentes=fuentes)
+                comparar(snapshot, filas, desde=desde, fuentes=fuentes)
+                comparar(snapshot, filas, hasta=hasta, fuentes=fuentes)
+        assert encontradas
+        # Antes de la primera fecha y después de la última no hay nada
+        assert not comparar(snapshot, filas, hasta=fechas[0] - timedelta(days=1))
+        assert not comparar(snapshot, filas, desde=fechas[-1] + timedelta(days=1))
+
+def test_inactividad(casos):
+    rng = random.Random(4)
+    for snapshot, filas in casos:
+        fechas = sorted({fecha for _, _, eventos, reparto in filas for fecha in eventos + [reparto] if fecha})
+        for _ in range(20):
+            inactivo_desde = rng.choice(fechas)
+            comparar(snapshot, filas, inactivo_desde=inactivo_desde)
+            desde, hasta = sorted([rng.choice(fechas), rng.choice(fechas)])
+            for fuentes in FUENTES:
+                comparar(snapshot, filas, desde=desde, hasta=hasta, fuentes=fuentes, inactivo_desde=inactivo_desde)
+        # Sin fechas en ninguna fila antes de la primera
+        assert not comparar(snapshot, filas, inactivo_desde=fechas[0])
+
+def test_sin_filtros(snapshots):
+    assert snapshots[0].timeline_positions() is None
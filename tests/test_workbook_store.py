@@ -0,0 +1,60 @@
+"""
+Recarga del libro: después de una carga fallida, la siguiente revisión
+publica una versión sana aunque el archivo no haya cambiado.
+"""
+import os
+import sys
+
+import openpyxl
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hsa_engine
+
+@pytest.fixture
+def libro(tmp_path, monkeypatch):
+    monkeypatch.setattr(hsa_engine, 'CACHE_DIR', str(tmp_path / 'cache'))
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'HOJA'
+    ws.append(['EXPEDIENTE', 'SOLICITANTE'])
+    ws.append(['CNE-1', 'PEPITO PEREZ'])
+    ws.append(['CNE-2', 'ANA GOMEZ'])
+    ruta = tmp_path / 'libro.xlsx'
+    wb.save(ruta)
+    return str(ruta)
+
+def fallar_una_vez(monkeypatch, nombre):
+    original = getattr(hsa_engine, nombre)
+    llamadas = []
+
+    def funcion(*args, **kwargs):
+        llamadas.append(1)
+        if len(llamadas) == 1:
+            raise OSError('fallo de prueba')
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(hsa_engine, nombre, funcion)
+
+# frame_hash falla antes de registrar el hash; build_search_index, después
+@pytest.mark.parametrize('nombre', ['frame_hash', 'build_search_index'])
+def test_recupera_carga_fallida(libro, monkeypatch, nombre):
+    fallar_una_vez(monkeypatch, nombre)
+    store = hsa_engine.WorkbookStore(libro, reload_interval=0)
+    fallida = store.snapshot()
+    assert fallida.wait_until_loaded(60)
+    assert fallida.error is not None
+    with pytest.raises(OSError):
+        fallida.sheet('HOJA')
+
+    assert store.check_for_changes()
+    snapshot = store.snapshot()
+    assert snapshot is not fallida
+    assert snapshot.error is None
+    assert snapshot.rebuilt == ['HOJA']
+    [(hoja, resultados)] = hsa_engine.search_snapshot(snapshot, 'perez', 'TODOS')
+    assert (hoja, resultados['EXPEDIENTE'].tolist()) == ('HOJA', ['CNE-1'])
+    # Ya sana y sin cambios en el archivo: no se vuelve a construir
+    assert not store.check_for_changes()
+    assert store.snapshot() is snapshot